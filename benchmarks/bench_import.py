@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# Check that `import kodi_voice` stays cheap for serverless cold starts.
+#
+# Imports the package in fresh interpreters and fails (exits non-zero) if the
+# fastest import takes longer than the budget, or if any of the heavy
+# optional dependencies got imported along with it.
+#
+# Usage:
+#   python benchmarks/bench_import.py --budget-ms 250 --runs 5
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Modules that should only be imported on first use.
+LAZY_MODULES = ['boto3', 'botocore', 'owncloud', 'fuzzywuzzy', 'num2words', 'roman', 'multiprocessing', 'sqlite3']
+
+DEFAULT_BUDGET_MS = 250
+
+PROBE = '''
+import json, sys, time
+t = time.time()
+import kodi_voice
+elapsed = time.time() - t
+print(json.dumps({'import_ms': elapsed * 1000, 'modules': sorted(sys.modules)}))
+'''
+
+
+# Import kodi_voice in a fresh interpreter; returns (milliseconds, modules).
+def probe():
+  env = dict(os.environ)
+  env['PYTHONPATH'] = os.pathsep.join([ROOT] + [p for p in env.get('PYTHONPATH', '').split(os.pathsep) if p])
+  out = subprocess.check_output([sys.executable, '-c', PROBE], env=env)
+  result = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+  return result['import_ms'], result['modules']
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Check the cold import time of kodi_voice.')
+  parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                      help='fail if the fastest import takes longer (default: %(default)s)')
+  parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to try (default: %(default)s)')
+  args = parser.parse_args(argv)
+
+  times = []
+  eager = set()
+  for i in range(args.runs):
+    ms, modules = probe()
+    times.append(ms)
+    eager.update(m for m in modules if m.split('.')[0] in LAZY_MODULES)
+
+  times.sort()
+  report = {
+    'python': sys.version.split()[0],
+    'runs': args.runs,
+    'budget_ms': args.budget_ms,
+    'import_ms': {'min': times[0], 'median': times[len(times) // 2], 'max': times[-1]},
+    'eager_modules': sorted(set(m.split('.')[0] for m in eager)),
+  }
+  json.dump(report, sys.stdout, indent=2, sort_keys=True)
+  sys.stdout.write('\n')
+
+  failed = False
+  if report['eager_modules']:
+    sys.stderr.write('FAIL: imported eagerly: %s\n' % ', '.join(report['eager_modules']))
+    failed = True
+  if times[0] > args.budget_ms:
+    sys.stderr.write('FAIL: import took %.1fms, budget is %.1fms\n' % (times[0], args.budget_ms))
+    failed = True
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+# Benchmark the matching path (sanitize_name, words2digits, matchHeard and
+# the Find* methods) against synthetic libraries.
+#
+# Runs entirely offline: library queries are answered in-process from a
+# SyntheticLibrary instead of a real Kodi.  Each library size runs in a
+# fresh process, so its memory figures aren't inflated by the sizes before
+# it.  Results are written as JSON.
+#
+# Usage:
+#   python benchmarks/bench_matching.py --sizes 1000,10000 --output bench.json
+
+import argparse
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from kodi_voice import KodiConfigParser, Kodi
+from kodi_voice.kodi import sanitize_name, words2digits
+from synthetic import SyntheticLibrary, heard_corpus
+
+
+log = logging.getLogger('bench_matching')
+
+DEFAULT_SIZES = [1000, 10000, 100000, 500000]
+
+
+# Kodi client whose library queries are served from a SyntheticLibrary.
+class SyntheticKodi(Kodi):
+  def __init__(self, library, config=None):
+    Kodi.__init__(self, config or KodiConfigParser(''))
+    self.library = library
+
+  def SendCommand(self, command, wait_resp=True, cache_resp=False):
+    return self.library.respond(command)
+
+
+def percentile(sorted_values, pct):
+  if not sorted_values:
+    return None
+  idx = int(round((pct / 100.0) * (len(sorted_values) - 1)))
+  return sorted_values[idx]
+
+
+# Peak resident set size of this process so far, in KiB.  This only ever
+# grows, so within a run it includes the library and every benchmark before.
+def peak_rss_kb():
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == 'darwin':
+    rss //= 1024
+  return rss
+
+
+# Time `func` over every argument tuple in `calls`.  If `expected` is given,
+# `check(result, expected)` decides whether each call got the right answer.
+def measure(name, func, calls, expected=None, check=None):
+  latencies = []
+  correct = 0
+  gc.collect()
+  start = time.time()
+  for i, args in enumerate(calls):
+    t = time.time()
+    result = func(*args)
+    latencies.append(time.time() - t)
+    if expected is not None and check(result, expected[i]):
+      correct += 1
+  elapsed = time.time() - start
+
+  latencies.sort()
+  stats = {
+    'name': name,
+    'calls': len(calls),
+    'total_s': elapsed,
+    'throughput_per_s': len(calls) / elapsed if elapsed else None,
+    'latency_ms': {
+      'p50': percentile(latencies, 50) * 1000,
+      'p90': percentile(latencies, 90) * 1000,
+      'p99': percentile(latencies, 99) * 1000,
+      'max': latencies[-1] * 1000,
+    },
+    'process_peak_rss_kb': peak_rss_kb(),
+  }
+  if expected is not None:
+    stats['accuracy'] = float(correct) / len(calls)
+  log.info('%-28s p50 %8.2fms  p99 %8.2fms%s', name, stats['latency_ms']['p50'], stats['latency_ms']['p99'],
+           '  accuracy %.3f' % stats['accuracy'] if 'accuracy' in stats else '')
+  return stats
+
+
+def run_size(size, queries, seed):
+  log.info('Generating library of %d items', size)
+  t = time.time()
+  library = SyntheticLibrary(size, seed=seed)
+  kodi = SyntheticKodi(library)
+  results = {'size': size, 'generate_s': time.time() - t, 'library_peak_rss_kb': peak_rss_kb(), 'benchmarks': []}
+
+  movies = heard_corpus(library.movies, queries, seed=seed)
+  songs = heard_corpus(library.songs, queries, seed=seed + 1)
+  artists = heard_corpus(library.artists, queries, seed=seed + 2)
+
+  def top_label(located, expected):
+    return bool(located) and located[0][1] == expected
+
+  def top_match(located, expected, lookingFor='label'):
+    return bool(located) and located[0][lookingFor] == expected
+
+  bench = results['benchmarks']
+
+  labels = [m['label'] for m in library.movies[:queries * 10]]
+  bench.append(measure('sanitize_name', sanitize_name, [(l,) for l in labels]))
+  bench.append(measure('words2digits', words2digits, [(h, kodi.language) for h, e in movies]))
+
+  bench.append(measure('matchHeard[movies]', kodi.matchHeard,
+                       [(h, library.movies) for h, e in movies], [e for h, e in movies], top_match))
+  bench.append(measure('matchHeard[artists]', lambda h, r: kodi.matchHeard(h, r, 'artist'),
+                       [(h, library.artists) for h, e in artists], [e for h, e in artists],
+                       lambda located, expected: top_match(located, expected, 'artist')))
+
+  bench.append(measure('FindMovie', kodi.FindMovie, [(h,) for h, e in movies], [e for h, e in movies], top_label))
+  bench.append(measure('FindSong', kodi.FindSong, [(h,) for h, e in songs], [e for h, e in songs], top_label))
+  bench.append(measure('FindArtist', kodi.FindArtist, [(h,) for h, e in artists], [e for h, e in artists], top_label))
+
+  return results
+
+
+# run_size() in a child process of its own.
+def run_size_isolated(size, queries, seed):
+  pool = multiprocessing.Pool(1)
+  try:
+    return pool.apply(run_size, (size, queries, seed))
+  finally:
+    pool.close()
+    pool.join()
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Benchmark kodi_voice matching against synthetic libraries.')
+  parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                      help='comma separated library sizes (default: %(default)s)')
+  parser.add_argument('--queries', type=int, default=50, help='heard phrases per benchmark (default: %(default)s)')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output', help='write JSON results here instead of stdout')
+  parser.add_argument('--verbose', action='store_true', help='show kodi_voice logging')
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(level=logging.INFO, format='%(message)s')
+  if not args.verbose:
+    logging.getLogger('kodi_voice').setLevel(logging.WARNING)
+
+  report = {
+    'python': sys.version.split()[0],
+    'platform': sys.platform,
+    'queries': args.queries,
+    'seed': args.seed,
+    'runs': [],
+  }
+  for size in [int(s) for s in args.sizes.split(',') if s]:
+    report['runs'].append(run_size_isolated(size, args.queries, args.seed))
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+  else:
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+
+# Profile cold start and typical intents against a mock Kodi.
+#
+# Starts a local JSON-RPC HTTP server that answers like Kodi (library queries
+# come from a SyntheticLibrary), with a configurable delay per request, and
+# runs each phase against it:
+#
+#   import                  import kodi_voice
+#   KodiConfigParser        KodiConfigParser(config file)
+#   Kodi                    Kodi(config)
+#   FindMovie+PlayMovie     find a movie from a heard phrase and play it
+#   PlayerPlayPause
+#   GetRecommendedVideoItem
+#
+# For each phase it reports wall time, JSON-RPC round trips, bytes sent and
+# received, and the top cProfile entries by cumulative time.  The intents
+# are run --repeat times; the first run is reported separately since it
+# pays for anything that gets cached.  Results are written as JSON.
+#
+# Usage:
+#   python benchmarks/profile_intents.py --latency-ms 20 --size 10000 --output profile.json
+
+import argparse
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+try:
+  from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+  from SocketServer import ThreadingMixIn
+except ImportError:
+  from http.server import BaseHTTPRequestHandler, HTTPServer
+  from socketserver import ThreadingMixIn
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from synthetic import SyntheticLibrary, speak
+
+
+log = logging.getLogger('profile_intents')
+
+
+class MockKodi(ThreadingMixIn, HTTPServer):
+  # A Kodi JSON-RPC endpoint on localhost.  Every request waits `latency`
+  # seconds before it is answered, and is counted along with the bytes that
+  # went each way.
+  daemon_threads = True
+
+  def __init__(self, library, latency=0.0):
+    HTTPServer.__init__(self, ('127.0.0.1', 0), MockKodiHandler)
+    self.library = library
+    self.latency = latency
+    self.lock = threading.Lock()
+    self.reset_counters()
+
+  # Commands sent without waiting for the answer (Player.Open) hang up
+  # before we reply; that's expected.
+  def handle_error(self, request, client_address):
+    if not isinstance(sys.exc_info()[1], (IOError, OSError)):
+      HTTPServer.handle_error(self, request, client_address)
+
+  def reset_counters(self):
+    with self.lock:
+      self.round_trips = 0
+      self.bytes_sent = 0
+      self.bytes_received = 0
+
+  def counters(self):
+    with self.lock:
+      return {'round_trips': self.round_trips, 'bytes_sent': self.bytes_sent, 'bytes_received': self.bytes_received}
+
+  def respond(self, command):
+    method = command.get('method', '')
+    if method == 'Player.GetActivePlayers':
+      result = [{'type': 'video', 'playerid': 1, 'playertype': 'internal'}]
+    elif method == 'Player.PlayPause':
+      result = {'speed': 0}
+    elif method == 'Player.GetItem':
+      result = {'item': {'type': 'movie', 'label': self.library.movies[0]['label'], 'id': 1}}
+    elif method == 'Player.GetProperties':
+      result = {'speed': 1, 'percentage': 12.5,
+                'time': {'hours': 0, 'minutes': 12, 'seconds': 30, 'milliseconds': 0},
+                'totaltime': {'hours': 1, 'minutes': 40, 'seconds': 0, 'milliseconds': 0}}
+    elif method == 'Application.GetProperties':
+      result = {'volume': 50, 'muted': False}
+    elif method.startswith(('VideoLibrary.', 'AudioLibrary.')):
+      result = self.library.respond(json.dumps(command))['result']
+    else:
+      result = 'OK'
+    return {'id': command.get('id'), 'jsonrpc': '2.0', 'result': result}
+
+
+class MockKodiHandler(BaseHTTPRequestHandler):
+  def do_POST(self):
+    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+    with self.server.lock:
+      self.server.round_trips += 1
+      self.server.bytes_sent += len(body)
+    time.sleep(self.server.latency)
+
+    command = json.loads(body.decode('utf-8'))
+    if isinstance(command, list):
+      response = [self.server.respond(c) for c in command]
+    else:
+      response = self.server.respond(command)
+    out = json.dumps(response).encode('utf-8')
+
+    with self.server.lock:
+      self.server.bytes_received += len(out)
+
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(out)))
+    self.end_headers()
+    self.wfile.write(out)
+
+  def log_message(self, format, *args):
+    pass
+
+
+# The top `top` entries of a profile by cumulative time.
+def hot_spots(profile, top):
+  stats = pstats.Stats(profile)
+  entries = []
+  for (filename, line, func), (cc, nc, tt, ct, callers) in stats.stats.items():
+    if filename.startswith(ROOT):
+      filename = os.path.relpath(filename, ROOT)
+    entries.append({'function': '%s:%d(%s)' % (filename, line, func), 'calls': nc,
+                    'tottime_ms': tt * 1000, 'cumtime_ms': ct * 1000})
+  entries.sort(key=lambda e: -e['cumtime_ms'])
+  return entries[:top]
+
+
+# Run func once under cProfile, counting what it asked of the server.
+def profile_call(server, func, top):
+  server.reset_counters()
+  profile = cProfile.Profile()
+  t = time.time()
+  result = profile.runcall(func)
+  elapsed = time.time() - t
+  stats = {'wall_ms': elapsed * 1000}
+  stats.update(server.counters())
+  stats['hot_spots'] = hot_spots(profile, top)
+  return result, stats
+
+
+# Run func `repeat` times, reporting the first run in full and the mean of
+# the rest.
+def profile_phase(name, server, func, repeat, top):
+  result, first = profile_call(server, func, top)
+  phase = {'name': name, 'first': first}
+  rest = []
+  for i in range(repeat - 1):
+    r, stats = profile_call(server, func, 0)
+    rest.append(stats)
+  if rest:
+    phase['repeat'] = {
+      'runs': len(rest),
+      'wall_ms': sum(s['wall_ms'] for s in rest) / len(rest),
+      'round_trips': float(sum(s['round_trips'] for s in rest)) / len(rest),
+      'bytes_sent': float(sum(s['bytes_sent'] for s in rest)) / len(rest),
+      'bytes_received': float(sum(s['bytes_received'] for s in rest)) / len(rest),
+    }
+  log.info('%-24s first %8.1fms %3d round trips %8d bytes%s', name, first['wall_ms'], first['round_trips'],
+           first['bytes_sent'] + first['bytes_received'],
+           '  then %8.1fms %5.1f round trips' % (phase['repeat']['wall_ms'], phase['repeat']['round_trips']) if rest else '')
+  return result, phase
+
+
+def write_config(directory, port):
+  path = os.path.join(directory, 'kodi.config')
+  with open(path, 'w') as f:
+    f.write('[DEFAULT]\naddress = 127.0.0.1\nport = %d\n' % port)
+  return path
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Profile kodi_voice cold start and intents against a mock Kodi.')
+  parser.add_argument('--latency-ms', type=float, default=20, help='delay per request (default: %(default)s)')
+  parser.add_argument('--size', type=int, default=10000, help='synthetic library size (default: %(default)s)')
+  parser.add_argument('--repeat', type=int, default=5, help='runs of each intent (default: %(default)s)')
+  parser.add_argument('--top', type=int, default=10, help='hot spots to report per phase (default: %(default)s)')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output', help='write JSON results here instead of stdout')
+  parser.add_argument('--verbose', action='store_true', help='show kodi_voice logging')
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(level=logging.INFO, format='%(message)s')
+  if not args.verbose:
+    logging.getLogger('kodi_voice').setLevel(logging.WARNING)
+
+  library = SyntheticLibrary(args.size, seed=args.seed)
+  server = MockKodi(library, args.latency_ms / 1000.0)
+  t = threading.Thread(target=server.serve_forever)
+  t.daemon = True
+  t.start()
+  tmpdir = tempfile.mkdtemp()
+
+  report = {
+    'python': sys.version.split()[0],
+    'platform': sys.platform,
+    'latency_ms': args.latency_ms,
+    'size': args.size,
+    'repeat': args.repeat,
+    'seed': args.seed,
+    'phases': [],
+  }
+  phases = report['phases']
+
+  try:
+    def import_kodi_voice():
+      import kodi_voice
+      return kodi_voice
+    kodi_voice, phase = profile_phase('import', server, import_kodi_voice, 1, args.top)
+    phases.append(phase)
+    if 'boto3' in sys.modules or 'fuzzywuzzy' in sys.modules:
+      log.info('note: heavy dependencies were already imported')
+
+    config_file = write_config(tmpdir, server.server_address[1])
+    config, phase = profile_phase('KodiConfigParser', server, lambda: kodi_voice.KodiConfigParser(config_file), args.repeat, args.top)
+    phases.append(phase)
+
+    kodi, phase = profile_phase('Kodi', server, lambda: kodi_voice.Kodi(config), args.repeat, args.top)
+    phases.append(phase)
+
+    rand = random.Random(args.seed)
+    movie = rand.choice(library.movies)
+    heard = speak(movie['label'], rand)
+
+    def find_and_play():
+      located = kodi.FindMovie(heard)
+      if located:
+        kodi.PlayMovie(located[0][0])
+      return located
+    located, phase = profile_phase('FindMovie+PlayMovie', server, find_and_play, args.repeat, args.top)
+    phase['found'] = bool(located) and located[0][1] == movie['label']
+    phases.append(phase)
+
+    result, phase = profile_phase('PlayerPlayPause', server, kodi.PlayerPlayPause, args.repeat, args.top)
+    phases.append(phase)
+
+    result, phase = profile_phase('GetRecommendedVideoItem', server, kodi.GetRecommendedVideoItem, args.repeat, args.top)
+    phases.append(phase)
+  finally:
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+  else:
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+  main()
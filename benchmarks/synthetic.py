@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+# Synthetic, Kodi-shaped libraries for benchmarking the matching path.
+#
+# Everything here is deterministic for a given seed, so results from two runs
+# (or two commits) are comparable.
+
+import json
+import random
+import unicodedata
+import roman
+from num2words import num2words
+
+
+WORDS = [
+  u'love', u'night', u'blue', u'river', u'moon', u'fire', u'heart', u'rain',
+  u'dance', u'city', u'dream', u'shadow', u'summer', u'winter', u'road',
+  u'star', u'ghost', u'king', u'queen', u'empire', u'island', u'storm',
+  u'garden', u'silver', u'golden', u'wild', u'lost', u'last', u'secret',
+  u'hunter', u'machine', u'ocean', u'paper', u'glass', u'stone', u'thunder',
+]
+
+# Words Alexa will hand us without the accents
+NON_ASCII_WORDS = [
+  u'am\xe9lie', u'caf\xe9', u'z\xfcrich', u'ni\xf1o', u'se\xf1orita',
+  u'fa\xe7ade', u'na\xefve', u'm\xfcnchen', u'r\xe9sum\xe9', u'\xe9t\xe9',
+  u'bj\xf6rk', u'mot\xf6rhead', u'sigur r\xf3s', u'cr\xe8me', u'd\xe9j\xe0 vu',
+]
+
+FIRST_NAMES = [
+  u'john', u'paul', u'george', u'ringo', u'aretha', u'nina', u'miles',
+  u'ella', u'johnny', u'dolly', u'jos\xe9', u'fran\xe7oise', u'bj\xf6rn',
+  u'agnetha', u'ren\xe9e', u'zo\xeb', u'chlo\xe9', u'ana\xefs',
+]
+
+LAST_NAMES = [
+  u'smith', u'jones', u'davis', u'simone', u'franklin', u'fitzgerald',
+  u'cash', u'parton', u'gonz\xe1lez', u'hardy', u'ulvaeus', u'f\xe4ltskog',
+  u'm\xfcller', u'dupr\xe9', u'nu\xf1ez',
+]
+
+ARTIST_SUFFIXES = [u'band', u'trio', u'orchestra', u'collective', u'and the wailers', u'experience']
+
+
+def _title_case(s):
+  return u' '.join(w[:1].upper() + w[1:] for w in s.split())
+
+
+class SyntheticLibrary():
+  # A library of `size` movies, `size` songs and `size` artists, plus the
+  # matching albums, shows and music videos needed by the Find* methods.
+  #
+  # Labels include accented characters, arabic numerals and roman numerals
+  # (sequels) so the ASCII, words2digits and roman paths are all exercised.
+  # Labels are unique (ignoring case) within each list, so a heard phrase
+  # has exactly one right answer.
+  def __init__(self, size, seed=0):
+    self.size = size
+    self.rand = random.Random(seed)
+
+    self.movies = [dict(movieid=i + 1, label=l) for i, l in enumerate(self._labels(size, sequels=True))]
+    self.tvshows = [dict(tvshowid=i + 1, label=l) for i, l in enumerate(self._labels(max(size // 10, 1)))]
+    self.artists = [dict(artistid=i + 1, artist=l, label=l) for i, l in enumerate(self._artist_names(size))]
+    self.albums = [dict(albumid=i + 1, label=l) for i, l in enumerate(self._labels(max(size // 10, 1)))]
+    self.songs = [dict(songid=i + 1, label=l) for i, l in enumerate(self._labels(size, numerals=True))]
+    self.musicvideos = []
+    for i, l in enumerate(self._labels(max(size // 10, 1))):
+      artist = self.rand.choice(self.artists)['label']
+      self.musicvideos.append(dict(musicvideoid=i + 1, label=l, artist=[artist]))
+
+  def _words(self, lo, hi):
+    words = []
+    for i in range(self.rand.randint(lo, hi)):
+      if self.rand.random() < 0.1:
+        words.append(self.rand.choice(NON_ASCII_WORDS))
+      else:
+        words.append(self.rand.choice(WORDS))
+    return u' '.join(words)
+
+  # Call make() until it comes up with a label not in seen, adding words to
+  # the end once plain retries stop turning up new ones.
+  def _unique(self, seen, make):
+    label = make()
+    tries = 0
+    while label.lower() in seen:
+      tries += 1
+      label = make() if tries < 3 else label + u' ' + _title_case(self._words(1, 1))
+    seen.add(label.lower())
+    return label
+
+  def _labels(self, count, sequels=False, numerals=False):
+    def make():
+      label = self._words(1, 4)
+      if self.rand.random() < 0.3:
+        label = u'the ' + label
+      r = self.rand.random()
+      if sequels and r < 0.15:
+        label += u' ' + roman.toRoman(self.rand.randint(2, 9))
+      elif (sequels or numerals) and r < 0.3:
+        label += u' %d' % self.rand.choice([2, 3, 4, 7, 9, 12, 21, 99, 1999, 2001])
+      return _title_case(label)
+
+    seen = set()
+    return [self._unique(seen, make) for i in range(count)]
+
+  def _artist_names(self, count):
+    def make():
+      r = self.rand.random()
+      if r < 0.5:
+        name = u'%s %s' % (self.rand.choice(FIRST_NAMES), self.rand.choice(LAST_NAMES))
+      elif r < 0.8:
+        name = u'%s %s' % (self._words(1, 2), self.rand.choice(ARTIST_SUFFIXES))
+      else:
+        name = self._words(1, 3)
+      return _title_case(name)
+
+    seen = set()
+    return [self._unique(seen, make) for i in range(count)]
+
+  # Serve a JSON-RPC command the way Kodi would for the library queries the
+  # Find* methods issue.  Limits and "contains" filters on the title are
+  # honoured; other filters and sorts are ignored.
+  def respond(self, command):
+    command = json.loads(command)
+    method = command['method']
+    limits = command.get('params', {}).get('limits')
+    filt = command.get('params', {}).get('filter')
+    results = {
+      'VideoLibrary.GetMovies': ('movies', self.movies),
+      'VideoLibrary.GetTVShows': ('tvshows', self.tvshows),
+      'VideoLibrary.GetMusicVideos': ('musicvideos', self.musicvideos),
+      'AudioLibrary.GetArtists': ('artists', self.artists),
+      'AudioLibrary.GetAlbums': ('albums', self.albums),
+      'AudioLibrary.GetSongs': ('songs', self.songs),
+    }
+    if method in results:
+      key, items = results[method]
+      if filt:
+        items = [item for item in items if _matches_filter(item, filt)]
+      total = len(items)
+      start, end = 0, total
+      if limits:
+        start = limits.get('start', 0)
+        end = min(limits.get('end', total), total)
+        items = items[start:end]
+      return {'id': 1, 'jsonrpc': '2.0', 'result': {key: items, 'limits': {'start': start, 'end': end, 'total': total}}}
+    return {'id': 1, 'jsonrpc': '2.0', 'result': {}}
+
+
+# Evaluate a JSON-RPC List.Filter against an item, treating every "contains"
+# rule as applying to the label.
+def _matches_filter(item, filt):
+  if 'and' in filt:
+    return all(_matches_filter(item, f) for f in filt['and'])
+  if 'or' in filt:
+    return any(_matches_filter(item, f) for f in filt['or'])
+  if filt.get('operator') == 'contains':
+    return filt['value'].lower() in item['label'].lower()
+  return True
+
+
+# Say a label the way a voice assistant would hand it to us: lower case, no
+# accents, numbers and roman numerals spoken as words.  With `typo`, one pair
+# of adjacent letters is swapped to exercise the fuzzy path.
+def speak(label, rand, lang='en', typo=False):
+  words = []
+  for word in label.lower().split():
+    if word.isdigit():
+      word = num2words(int(word), lang=lang)
+    else:
+      try:
+        n = roman.fromRoman(word.upper())
+      except roman.InvalidRomanNumeralError:
+        pass
+      else:
+        if n > 1 and len(word) > 1:
+          word = num2words(n, lang=lang)
+    words.append(word)
+  heard = u' '.join(words).replace(u'-', u' ')
+  heard = unicodedata.normalize('NFKD', heard).encode('ASCII', 'ignore').decode('ascii')
+  if typo and len(heard) > 6:
+    i = rand.randint(1, len(heard) - 3)
+    if heard[i] != u' ' and heard[i + 1] != u' ':
+      heard = heard[:i] + heard[i + 1] + heard[i] + heard[i + 2:]
+  return heard
+
+
+# Build a corpus of (heard phrase, expected label) pairs for a list of items.
+def heard_corpus(items, count, seed=0, lookingFor='label', typo_rate=0.2):
+  rand = random.Random(seed)
+  corpus = []
+  for i in range(count):
+    item = rand.choice(items)
+    expected = item[lookingFor]
+    corpus.append((speak(expected, rand, typo=rand.random() < typo_rate), expected))
+  return corpus
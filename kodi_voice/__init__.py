@@ -2,6 +2,7 @@ from .kodi import (
   KodiConfigParser,
   Kodi
 )
+from .registry import KodiRegistry
 
 # Set default logging handler to avoid "No handler found" warnings.
 import logging
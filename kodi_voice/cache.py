@@ -2,9 +2,6 @@
 
 import json
 import requests
-import boto3
-import botocore
-import owncloud
 import hashlib
 import io
 import logging
@@ -36,6 +33,10 @@ class KodiCache():
     if self.bucket_name:
       # Amazon S3
       if self.aws_secret_access_key and self.aws_access_key_id:
+        # boto3 is slow to import, so only load it when it's needed
+        import boto3
+        import botocore
+
         self.s3 = boto3.resource('s3', aws_secret_access_key=self.aws_secret_access_key, aws_access_key_id=self.aws_access_key_id)
 
         log.info('Accessing bucket %s', self.bucket_name)
@@ -53,6 +54,8 @@ class KodiCache():
 
       # ownCloud/nextCloud
       elif self.oc_url and self.oc_user and self.oc_pass:
+        import owncloud
+
         self.oc = owncloud.Client(self.oc_url)
         self.oc.login(self.oc_user, self.oc_pass)
 
@@ -120,10 +123,11 @@ class KodiCache():
 
       log.info('Cleared all cache objects')
 
-  def add(self, cache_file, url, auth, command, timeout, wait_resp=True):
+  # session is the requests.Session to send the command with, if any.
+  def add(self, cache_file, url, auth, command, timeout, wait_resp=True, session=None):
     try:
       # Fetch the response from Kodi
-      r = requests.post(url, data=command, auth=auth, timeout=timeout)
+      r = (session or requests).post(url, data=command, auth=auth, timeout=timeout)
     except requests.exceptions.ReadTimeout:
       if not wait_resp:
         # Caller doesn't care about the response anyway -- this is mostly for
@@ -2,8 +2,9 @@
 
 # For a complete discussion, see http://forum.kodi.tv/showthread.php?tid=254502
 
-import datetime
 import threading
+import collections
+import functools
 import json
 import hashlib
 import time
@@ -17,12 +18,16 @@ import string
 import sys
 import unicodedata
 import logging
-import roman
 import requests
-from num2words import num2words
-from fuzzywuzzy import fuzz, process
 from ConfigParser import SafeConfigParser
 from .cache import KodiCache
+from .library import KodiLibraryMirror, VIDEO_MEDIATYPES, AUDIO_MEDIATYPES
+from .notify import get_notification_listener
+from .player import PLAYER_CHANGING_RE, get_player_snapshots
+from .recommend import get_recommendation_store
+from .settings import KodiSettings, compile_settings
+from .records import Movie, Show, Episode, make_record
+from .matcher import PARALLEL_MATCH_MIN_ITEMS, fuzzy_extract, get_parallel_matcher, reset_parallel_matcher
 
 
 log = logging.getLogger(__name__)
@@ -49,6 +54,70 @@ LIMIT_RECOMMENDED_ARTISTS = (0, 20)
 LIMIT_RECOMMENDED_ALBUMS = (0, 40)
 LIMIT_RECOMMENDED_SONGS = (0, 100)
 
+# Recommendation candidates for each mediatype:
+#   (answer type, JSON-RPC method, params, result key, id field, limits)
+RECOMMEND_MEDIATYPES = {
+  'movies': ('movie', 'VideoLibrary.GetMovies', None, 'movies', 'movieid', LIMIT_RECOMMENDED_MOVIES),
+  'tvshows': ('tvshow', 'VideoLibrary.GetTVShows', None, 'tvshows', 'tvshowid', LIMIT_RECOMMENDED_SHOWS),
+  'episodes': ('episode', 'VideoLibrary.GetEpisodes', None, 'episodes', 'episodeid', LIMIT_RECOMMENDED_EPISODES),
+  'musicvideos': ('musicvideo', 'VideoLibrary.GetMusicVideos', None, 'musicvideos', 'musicvideoid', LIMIT_RECOMMENDED_MUSICVIDEOS),
+  'artists': ('artist', 'AudioLibrary.GetArtists', {"albumartistsonly": False}, 'artists', 'artistid', LIMIT_RECOMMENDED_ARTISTS),
+  'albums': ('album', 'AudioLibrary.GetAlbums', None, 'albums', 'albumid', LIMIT_RECOMMENDED_ALBUMS),
+  'songs': ('song', 'AudioLibrary.GetSongs', None, 'songs', 'songid', LIMIT_RECOMMENDED_SONGS),
+}
+
+# Volume change for a single VolumeUp/VolumeDown step.
+VOLUME_STEP = 10
+
+# How far we expect one of Kodi's own volume increments to move the volume
+# until we've seen it: Kodi's default of 90 steps from 0 to 100.
+VOLUME_INCREMENT = 100.0 / 90
+
+# Increments ChangeVolume() needs to see before it trusts its measurement of
+# one.
+VOLUME_INCREMENT_SAMPLES = 5
+
+# Kodi's players, which always have the same ids.
+PLAYER_IDS = {'audio': 0, 'video': 1, 'picture': 2}
+
+# Which player GetNowPlaying() describes when several are active.
+NOW_PLAYING_ORDER = ['video', 'audio', 'picture']
+
+PLAYER_ITEM_FIELDS = ["title", "album", "artist", "season", "episode", "showtitle", "tvshowid", "description"]
+PLAYER_PROPERTIES = ["currentaudiostream", "currentsubtitle", "canshuffle", "shuffled", "canrepeat", "repeat", "canzoom", "canrotate", "canmove"]
+PLAYER_STATUS_PROPERTIES = ["percentage", "speed", "time", "totaltime"]
+
+# Playlist.Add chunk sizes.  Kodi won't take more than PLAYLIST_CHUNK_MAX
+# items in a single call.  When starting playback early (see PlaylistEnqueue),
+# the first PLAYLIST_FIRST_CHUNK items are added before the player starts and
+# the rest in chunks that adapt to keep each call around PLAYLIST_CHUNK_TARGET
+# seconds.
+PLAYLIST_CHUNK_MAX = 2000
+PLAYLIST_CHUNK_MIN = 50
+PLAYLIST_FIRST_CHUNK = 10
+PLAYLIST_CHUNK_TARGET = 0.5
+
+# Seconds Kodi.GetAddonCatalogue() keeps the addon list before asking again
+ADDON_CATALOGUE_TTL = 300
+
+# Seconds Kodi.GetShowsDetails() remembers a show's details
+SHOW_DETAILS_TTL = 3600
+
+# Addon content types searched by Kodi.FindAddon()
+ADDON_CONTENT_TYPES = ['video', 'audio', 'image', 'executable']
+
+# Libraries searched by Kodi.FindMedia(), in order of preference for equally
+# scored matches:
+#   (type, Kodi method, result key, id field, field to match on)
+SEARCH_MEDIATYPES = [
+  ('movie', 'GetMovies', 'movies', 'movieid', 'label'),
+  ('tvshow', 'GetShows', 'tvshows', 'tvshowid', 'label'),
+  ('musicvideo', 'GetMusicVideos', 'musicvideos', 'musicvideoid', 'label'),
+  ('artist', 'GetMusicArtists', 'artists', 'artistid', 'artist'),
+  ('album', 'GetAlbums', 'albums', 'albumid', 'label'),
+  ('song', 'GetSongs', 'songs', 'songid', 'label'),
+]
+
 
 def sanitize_name(media_name, normalize=True):
   if normalize:
@@ -73,6 +142,73 @@ def sanitize_name(media_name, normalize=True):
   return name
 
 
+# Words too common (in any of the supported languages) to be worth asking
+# Kodi to filter on.
+PUSHDOWN_STOPWORDS = set([
+  u'the', u'and', u'with', u'from', u'that', u'this', u'your', u'what',
+  u'der', u'die', u'das', u'und', u'mit', u'eine', u'einer',
+  u'les', u'des', u'une', u'avec', u'pour',
+  u'della', u'delle', u'degli', u'con', u'per', u'una',
+])
+PUSHDOWN_MIN_TOKEN = 4
+PUSHDOWN_MAX_TOKENS = 3
+
+
+# The most distinctive (longest, non-numeric, non-stopword) words in phrases.
+def distinctive_tokens(phrases, limit=PUSHDOWN_MAX_TOKENS):
+  tokens = []
+  for phrase in phrases:
+    for token in re.findall(r'\w+', phrase.lower(), re.UNICODE):
+      if len(token) >= PUSHDOWN_MIN_TOKEN and not token.isdigit() and token not in PUSHDOWN_STOPWORDS and token not in tokens:
+        tokens.append(token)
+  return sorted(tokens, key=len, reverse=True)[:limit]
+
+
+# Plan the server-side filters to try, in order, before fetching a whole
+# library to match match_strings (see Kodi.matchStrings()) against.  Returns
+# a list of (filters, filtertype) for RPCString():
+#
+#  - field contains all the distinctive words of what was heard
+#  - field contains any distinctive word of what was heard or its
+#    number-normalized forms
+def pushdown_filters(match_strings, field):
+  stages = []
+  for phrases, filtertype in ((match_strings[:1], 'and'), (match_strings, 'or')):
+    tokens = distinctive_tokens(phrases)
+    if not tokens:
+      continue
+    filters = [{"field": field, "operator": "contains", "value": token} for token in tokens]
+    if len(filters) == 1:
+      filtertype = 'and'
+    if (filters, filtertype) not in stages:
+      stages.append((filters, filtertype))
+  return stages
+
+
+# Call each of `calls` (functions taking no arguments) on its own thread and
+# return their results in the same order.  If a call raises, the exception
+# is returned in place of its result.
+def run_concurrently(calls):
+  results = [None] * len(calls)
+
+  def worker(idx, call):
+    try:
+      results[idx] = call()
+    except Exception as e:
+      results[idx] = e
+
+  threads = []
+  for idx, call in enumerate(calls):
+    t = threading.Thread(target=worker, args=(idx, call))
+    t.daemon = True
+    t.start()
+    threads.append(t)
+  for t in threads:
+    t.join()
+
+  return results
+
+
 # Remove extra slashes
 def http_normalize_slashes(url):
   url = str(url)
@@ -112,6 +248,8 @@ def RPCString(method, params=None, sort=None, filters=None, fields=None, limits=
 
 # Replace digits with word-form numbers.
 def digits2words(phrase, lang='en'):
+  from num2words import num2words
+
   wordified = ''
   for word in phrase.split():
     if word.isnumeric():
@@ -191,6 +329,8 @@ def words2digits(phrase, lang='en'):
 
 # Replace digits with roman numerals.
 def digits2roman(phrase, lang='en'):
+  import roman
+
   wordified = ''
   for word in phrase.split():
     if word.isnumeric():
@@ -204,40 +344,120 @@ def words2roman(phrase, lang='en'):
   return digits2roman(words2digits(phrase, lang=lang), lang=lang)
 
 
-# Provide a map from ISO code (both bibliographic and terminologic)
-# in ISO 639-2 to a dict with the two letter ISO 639-2 codes (alpha2)
-# English and french names
+# Compact, immutable record for a single ISO 639-2 language.
 #
 # "bibliographic" iso codes are derived from English word for the language
 # "terminologic" iso codes are derived from the pronunciation in the target
 # language (if different to the bibliographic code)
 #
+# Columns not available from the data are `None`.  The English, French and
+# German names are available as the `en`, `fr` and `de` fields.
+IsoLanguage = collections.namedtuple('IsoLanguage', ['bibliographic', 'terminologic', 'alpha2', 'en', 'fr', 'de'])
+
+# Lazily built (codes, names) index over ISO-639-2_utf-8.txt.  See
+# _isocodes_index().
+_isocodes = None
+_isocodes_lock = threading.Lock()
+
+
+# Normalize a spoken language name for lookup in the reverse index, so that
+# e.g. u'Fran\xe7ais' and 'francais' land on the same key.
+def _isoname_key(name):
+  if isinstance(name, bytes):
+    name = name.decode('utf-8')
+  name = unicodedata.normalize('NFKD', name).encode('ASCII', 'ignore').decode('ascii')
+  return ' '.join(name.lower().split())
+
+
+# All the keys a language name should be reachable by: the full name, each
+# of the '; ' separated alternates ("Dutch; Flemish"), and each of those
+# without its qualifiers ("Greek, Modern (1453-)" -> "greek").
+def _isoname_keys(name):
+  keys = []
+  for alt in [name] + name.split(';'):
+    key = _isoname_key(alt)
+    if key and key not in keys:
+      keys.append(key)
+    key = _isoname_key(re.split(r'[,(]', alt)[0])
+    if key and key not in keys:
+      keys.append(key)
+  return keys
+
+
+# Build the ISO 639-2 index once per process and return it as a tuple of:
+#
+#   codes: bibliographic, terminologic and alpha2 code -> IsoLanguage
+#   names: normalized English/French/German name -> IsoLanguage
+#
 # Source
 # http://stackoverflow.com/questions/2879856/get-system-language-in-iso-639-3-letter-codes-in-python/2879958#2879958
+def _isocodes_index():
+  global _isocodes
+  if _isocodes is None:
+    with _isocodes_lock:
+      if _isocodes is None:
+        records = []
+        country_dic_file = os.path.join(os.path.dirname(__file__), "ISO-639-2_utf-8.txt")
+        f = codecs.open(country_dic_file, 'rb', 'utf-8')
+        for line in f:
+          fields = line.strip().split('|')
+          if len(fields) != len(IsoLanguage._fields):
+            continue
+          records.append(IsoLanguage(*[field or None for field in fields]))
+        f.close()
+
+        codes = {}
+        for rec in records:
+          for code in (rec.bibliographic, rec.terminologic, rec.alpha2):
+            if code:
+              codes[code] = rec
+
+        # Living languages (those with an alpha2 code) win name collisions,
+        # so "greek" resolves to Modern Greek rather than Ancient Greek.
+        names = {}
+        for rec in sorted(records, key=lambda r: r.alpha2 is None):
+          for name in (rec.en, rec.fr, rec.de):
+            if name:
+              for key in _isoname_keys(name):
+                names.setdefault(key, rec)
+
+        _isocodes = (codes, names)
+  return _isocodes
+
+
+# Look up a language by its bibliographic, terminologic or alpha2 code.
 #
 # Usage
-# country_dic = getisocodes_dict()
-# print country_dic['eng']
-def getisocodes_dict():
-  D = {}
-  country_dic_file = os.path.join(os.path.dirname(__file__), "ISO-639-2_utf-8.txt")
-  f = codecs.open(country_dic_file, 'rb', 'utf-8')
-  for line in f:
-    iD = {}
-    iD['bibliographic'], iD['terminologic'], iD['alpha2'], iD['en'], iD['fr'], iD['de'] = line.encode("utf-8").strip().split('|')
-    D[iD['bibliographic']] = iD
+# getisocode('fre').en -> u'French'
+def getisocode(code):
+  if not code:
+    return None
+  return _isocodes_index()[0].get(code.lower())
 
-    if iD['terminologic']:
-      D[iD['terminologic']] = iD
 
-    if iD['alpha2']:
-      D[iD['alpha2']] = iD
+# Look up a language by its English, French or German name, e.g. for a heard
+# "switch subtitles to French."  Case and accents are ignored.
+#
+# Usage
+# getisocode_by_name('francais').bibliographic -> u'fre'
+def getisocode_by_name(name):
+  if not name:
+    return None
+  return _isocodes_index()[1].get(_isoname_key(name))
 
-    for k in iD:
-      # Assign `None` when columns not available from the data
-      iD[k] = iD[k] or None
-  f.close()
-  return D
+
+# Provide a map from ISO code (both bibliographic and terminologic)
+# in ISO 639-2 to a dict with the two letter ISO 639-2 codes (alpha2)
+# English and french names
+#
+# Kept for compatibility; new code should use getisocode(), which doesn't
+# copy the whole table.
+#
+# Usage
+# country_dic = getisocodes_dict()
+# print country_dic['eng']
+def getisocodes_dict():
+  return {k: dict(v._asdict()) for k, v in _isocodes_index()[0].items()}
 
 
 class KodiConfigParser(SafeConfigParser):
@@ -247,6 +467,9 @@ class KodiConfigParser(SafeConfigParser):
     # Seed the default values from the example
     self.config_file = os.path.join(os.path.dirname(__file__), "kodi.config.example")
     self.read(self.config_file)
+    # The example's placeholder device sections, until the config file
+    # turns out to have sections of the same name
+    self.example_sections = self.sections()
 
     if not os.path.isfile(config_file):
       # Fill out the rest of the config based on .env variables
@@ -286,6 +509,18 @@ class KodiConfigParser(SafeConfigParser):
       OWNCLOUD_CACHE_PASSWORD = os.getenv('OWNCLOUD_CACHE_PASSWORD')
       if OWNCLOUD_CACHE_PASSWORD and OWNCLOUD_CACHE_PASSWORD != 'None':
         self.set('DEFAULT', 'owncloud_cache_password', OWNCLOUD_CACHE_PASSWORD)
+      LIBRARY_MIRROR = os.getenv('LIBRARY_MIRROR')
+      if LIBRARY_MIRROR and LIBRARY_MIRROR != 'None':
+        self.set('DEFAULT', 'library_mirror', LIBRARY_MIRROR)
+      RECOMMEND_POOL_TTL = os.getenv('RECOMMEND_POOL_TTL')
+      if RECOMMEND_POOL_TTL and RECOMMEND_POOL_TTL != 'None':
+        self.set('DEFAULT', 'recommend_pool_ttl', RECOMMEND_POOL_TTL)
+      NOTIFICATION_PORT = os.getenv('NOTIFICATION_PORT')
+      if NOTIFICATION_PORT and NOTIFICATION_PORT != 'None':
+        self.set('DEFAULT', 'notification_port', NOTIFICATION_PORT)
+      PLAYER_STATE_TTL = os.getenv('PLAYER_STATE_TTL')
+      if PLAYER_STATE_TTL and PLAYER_STATE_TTL != 'None':
+        self.set('DEFAULT', 'player_state_ttl', PLAYER_STATE_TTL)
       READ_TIMEOUT = os.getenv('READ_TIMEOUT')
       if READ_TIMEOUT and READ_TIMEOUT != 'None':
         self.set('DEFAULT', 'read_timeout', READ_TIMEOUT)
@@ -319,6 +554,9 @@ class KodiConfigParser(SafeConfigParser):
       MAX_PLAYLIST_ITEMS = os.getenv('PLAYLIST_ITEMS')
       if MAX_PLAYLIST_ITEMS and MAX_PLAYLIST_ITEMS != 'None':
         self.set('global', 'playlist_max_items', MAX_PLAYLIST_ITEMS)
+      MATCH_PROCESSES = os.getenv('MATCH_PROCESSES')
+      if MATCH_PROCESSES and MATCH_PROCESSES != 'None':
+        self.set('global', 'match_processes', MATCH_PROCESSES)
       MAX_UNWATCHED_SHOWS = os.getenv('MAX_UNWATCHED_SHOWS')
       if MAX_UNWATCHED_SHOWS and MAX_UNWATCHED_SHOWS != 'None':
         self.set('global', 'unwatched_shows_max_results', MAX_UNWATCHED_SHOWS)
@@ -343,84 +581,212 @@ class KodiConfigParser(SafeConfigParser):
     else:
       self.config_file = config_file
       self.read(self.config_file)
+      own = SafeConfigParser()
+      own.read(self.config_file)
+      self.example_sections = [section for section in self.example_sections if not own.has_section(section)]
 
+  def set(self, section, option, value=None):
+    self._settings = None
+    SafeConfigParser.set(self, section, option, value)
 
-class Kodi:
-  def __init__(self, config=None, context=None):
-    self.config = config
-    self.config_error = False
+  # The typed, per-device KodiSettings for this config, built on first use.
+  def settings(self):
+    if getattr(self, '_settings', None) is None:
+      self._settings = compile_settings(self, self.config_file)
+    return self._settings
 
-    # When testing from the web simulator there is no context object (04/2017)
-    try:
-      self.deviceId = context.System.device.deviceId
-    except:
-      self.deviceId = 'Unknown Device'
 
-    if self.config.has_section(self.deviceId):
-      self.dev_cfg_section = self.deviceId
-    else:
-      self.dev_cfg_section = 'DEFAULT'
+# The id of the device a request came from.
+def device_id(context):
+  # When testing from the web simulator there is no context object (04/2017)
+  try:
+    return context.System.device.deviceId
+  except:
+    return 'Unknown Device'
 
-    self.language = self.config.get('global', 'language').lower()
-    self.playlist_limit = self.config.get('global', 'playlist_max_items')
-    if self.playlist_limit and self.playlist_limit != 'None':
-      self.playlist_limit = int(self.playlist_limit)
-    else:
-      self.playlist_limit = sys.maxint
-    self.max_unwatched_shows = int(self.config.get('global', 'unwatched_shows_max_results'))
-    self.max_unwatched_episodes = int(self.config.get('global', 'unwatched_episodes_max_results'))
-    self.max_unwatched_movies = int(self.config.get('global', 'unwatched_movies_max_results'))
-    self.logsensitive = self.config.getboolean('global', 'logsensitive')
 
-    try:
-      self.scheme = self.config.get(self.dev_cfg_section, 'scheme')
-      self.subpath = self.config.get(self.dev_cfg_section, 'subpath')
-      self.address = self.config.get(self.dev_cfg_section, 'address')
-      self.port = self.config.get(self.dev_cfg_section, 'port')
-      self.username = self.config.get(self.dev_cfg_section, 'username')
-      self.password = self.config.get(self.dev_cfg_section, 'password')
-      self.read_timeout = float(self.config.get(self.dev_cfg_section, 'read_timeout'))
-      self.read_timeout_async = float(self.config.get(self.dev_cfg_section, 'read_timeout_async'))
-    except:
-      self.config_error = True
-
-    if not self.scheme or not self.address or not self.port or not self.username or not self.password:
-      self.config_error = True
-
-    cache_bucket = self.config.get(self.dev_cfg_section, 'cache_bucket')
-    if not cache_bucket or cache_bucket == 'None':
-      cache_bucket = None
-    s3_cache_key_id = self.config.get(self.dev_cfg_section, 's3_cache_aws_access_key_id')
-    if not s3_cache_key_id or s3_cache_key_id == 'None':
-      s3_cache_key_id = None
-    s3_cache_key = self.config.get(self.dev_cfg_section, 's3_cache_aws_secret_access_key')
-    if not s3_cache_key or s3_cache_key == 'None':
-      s3_cache_key = None
-    oc_cache_url = self.config.get(self.dev_cfg_section, 'owncloud_cache_url')
-    if not oc_cache_url or oc_cache_url == 'None':
-      oc_cache_url = None
-    oc_cache_user = self.config.get(self.dev_cfg_section, 'owncloud_cache_user')
-    if not oc_cache_user or oc_cache_user == 'None':
-      oc_cache_user = None
-    oc_cache_pass = self.config.get(self.dev_cfg_section, 'owncloud_cache_password')
-    if not oc_cache_pass or oc_cache_pass == 'None':
-      oc_cache_pass = None
-
-    self.cache = KodiCache(cache_bucket,
-            aws_access_key_id=s3_cache_key_id, aws_secret_access_key=s3_cache_key,
-            oc_url=oc_cache_url, oc_user=oc_cache_user, oc_password=oc_cache_pass)
+_sessions = {}
+_sessions_lock = threading.Lock()
+
 
+# Return the process-wide requests.Session for a Kodi endpoint, so that
+# every instance talking to it reuses the same kept-alive connections.
+def get_http_session(endpoint):
+  with _sessions_lock:
+    if endpoint not in _sessions:
+      _sessions[endpoint] = requests.Session()
+    return _sessions[endpoint]
+
+
+class PlaylistEnqueue():
+  # Adds items to a Kodi playlist, starting playback after the first small
+  # chunk and streaming the rest from a background thread.  Chunk sizes adapt
+  # to how quickly Kodi answers: they grow while Playlist.Add calls come back
+  # within PLAYLIST_CHUNK_TARGET seconds and shrink when they don't.
+  #
+  # Cloud deployments may freeze or kill background threads once a request
+  # has been answered, so call wait() (let the background thread finish) or
+  # flush() (add whatever is left from the calling thread) before that.
+  #
+  # With shuffled, the player is told to shuffle the playlist as it starts.
+  def __init__(self, kodi, playlistid, items, shuffled=False):
+    self.kodi = kodi
+    self.playlistid = playlistid
+    self.items = items
+    self.shuffled = shuffled
+    self.added = 0
+    self.response = None
+    self.error = None
+    self.chunk_size = PLAYLIST_CHUNK_MIN
+    self.lock = threading.Lock()
+    self.stopping = False
+    self.thread = None
+
+  @property
+  def done(self):
+    return self.added >= len(self.items)
+
+  # Take the next chunk off the queue.  Returns an empty list when there's
+  # nothing left (or, from the background thread, once flush() has started).
+  def _next_chunk(self, size, background=False):
+    with self.lock:
+      if background and self.stopping:
+        return []
+      chunk = self.items[self.added:self.added + size]
+      self.added += len(chunk)
+      return chunk
+
+  def _add(self, chunk):
+    log.info('Adding %d items to the queue...', len(chunk))
+    t = time.time()
+    self.response = self.kodi.SendCommand(RPCString("Playlist.Add", {"playlistid": self.playlistid, "item": chunk}))
+    return time.time() - t
+
+  def _run(self):
     try:
-      # On a successful cache hit, this variable tells the skill to fetch a fresh
-      # copy from Kodi in the background on a worker thread.
-      #
-      # This is an undocumented/hidden option because a) it provides minimal real
-      # value, b) can be a source of confusion for the user, and c) doesn't work
-      # on most cloud deployments because the main thread terminates before the
-      # worker thread completes.
-      self.cache_bg_update = self.config.getboolean(self.dev_cfg_section, 'cache_bg_update')
-    except:
-      self.cache_bg_update = False
+      while True:
+        chunk = self._next_chunk(self.chunk_size, background=True)
+        if not chunk:
+          break
+        elapsed = self._add(chunk)
+        if elapsed < PLAYLIST_CHUNK_TARGET:
+          self.chunk_size = min(self.chunk_size * 2, PLAYLIST_CHUNK_MAX)
+        else:
+          self.chunk_size = max(self.chunk_size // 2, PLAYLIST_CHUNK_MIN)
+    except Exception as e:
+      log.error('Unable to add items to the queue: %s', repr(e))
+      self.error = e
+
+  # Add the first chunk, start the playlist and hand the rest to a
+  # background thread.
+  def start(self):
+    chunk = self._next_chunk(PLAYLIST_FIRST_CHUNK)
+    if chunk:
+      self._add(chunk)
+      params = {"item": {"playlistid": self.playlistid}}
+      if self.shuffled:
+        params["options"] = {"shuffled": True}
+      self.kodi.SendCommand(RPCString("Player.Open", params), False)
+    if not self.done:
+      self.thread = threading.Thread(target=self._run)
+      self.thread.daemon = True
+      self.thread.start()
+    return self
+
+  # Wait for the background thread to add everything.  Returns the last
+  # Playlist.Add response, or raises whatever stopped the background thread.
+  def wait(self, timeout=None):
+    if self.thread:
+      self.thread.join(timeout)
+    if self.error:
+      raise self.error
+    return self.response
+
+  # Stop the background thread after its current chunk and add whatever is
+  # left from the calling thread, in the largest chunks Kodi accepts.
+  def flush(self):
+    with self.lock:
+      self.stopping = True
+    if self.thread:
+      self.thread.join()
+    if self.error:
+      raise self.error
+    while True:
+      chunk = self._next_chunk(PLAYLIST_CHUNK_MAX)
+      if not chunk:
+        break
+      self._add(chunk)
+    return self.response
+
+
+class Kodi:
+  # deviceId picks the device directly, for talking to a device other than
+  # the one a request came from.
+  def __init__(self, config=None, context=None, deviceId=None):
+    self.config = config
+    self.deviceId = deviceId or device_id(context)
+
+    # config can be a KodiConfigParser or KodiSettings from load_settings()
+    if isinstance(config, KodiSettings):
+      self.settings = config
+    else:
+      self.settings = config.settings()
+    settings = self.settings.device(self.deviceId)
+    self.device_settings = settings
+    self.dev_cfg_section = settings.section
+    self.config_error = settings.config_error
+
+    self.language = settings.language
+    self.playlist_limit = settings.playlist_max_items
+    self.max_unwatched_shows = settings.unwatched_shows_max_results
+    self.max_unwatched_episodes = settings.unwatched_episodes_max_results
+    self.max_unwatched_movies = settings.unwatched_movies_max_results
+    self.logsensitive = settings.logsensitive
+    self.match_processes = settings.match_processes
+
+    self.scheme = settings.scheme
+    self.subpath = settings.subpath
+    self.address = settings.address
+    self.port = settings.port
+    self.username = settings.username
+    self.password = settings.password
+    self.read_timeout = settings.read_timeout
+    self.read_timeout_async = settings.read_timeout_async
+
+    # Identifies this Kodi in process-wide stores shared across instances.
+    self.endpoint = settings.endpoint()
+    self.session = get_http_session(self.endpoint)
+
+    self.cache = KodiCache(settings.cache_bucket,
+            aws_access_key_id=settings.s3_cache_aws_access_key_id, aws_secret_access_key=settings.s3_cache_aws_secret_access_key,
+            oc_url=settings.owncloud_cache_url, oc_user=settings.owncloud_cache_user, oc_password=settings.owncloud_cache_password)
+
+    if settings.library_mirror:
+      self.library_mirror = KodiLibraryMirror(settings.library_mirror)
+    else:
+      self.library_mirror = None
+
+    self.recommend_pool_ttl = settings.recommend_pool_ttl
+    self.player_state_ttl = settings.player_state_ttl
+
+    # On a successful cache hit, this variable tells the skill to fetch a fresh
+    # copy from Kodi in the background on a worker thread.
+    #
+    # This is an undocumented/hidden option because a) it provides minimal real
+    # value, b) can be a source of confusion for the user, and c) doesn't work
+    # on most cloud deployments because the main thread terminates before the
+    # worker thread completes.
+    self.cache_bg_update = settings.cache_bg_update
+
+    if settings.notification_port and not self.config_error:
+      self.notifications = get_notification_listener(self.address, settings.notification_port)
+      self.SubscribeNotifications()
+    else:
+      self.notifications = None
+
+    self.addon_catalogue = None
+    self.musicvideo_artist_index = None
+    self.show_details = {}
 
   # Construct the JSON-RPC message and send it to the Kodi player
   def SendCommand(self, command, wait_resp=True, cache_resp=False):
@@ -430,6 +796,12 @@ class Kodi:
     # Remove any double slashes in the url
     url = http_normalize_slashes(url)
 
+    if PLAYER_CHANGING_RE.search(command):
+      get_player_snapshots().invalidate(self.endpoint)
+      self.InvalidateRecommendationPools()
+      if self.notifications:
+        self.notifications.forget_players()
+
     log.info('Received request from device %s', self.deviceId if self.logsensitive else '[hidden]')
     log.info('Sending request to %s', url if self.logsensitive else '[hidden]')
     log.debug(command)
@@ -458,14 +830,68 @@ class Kodi:
       # fetched the response from cache, so let's return it immediately but
       # update the cache object in the background.
       if self.cache_bg_update:
-        t = threading.Thread(target=self.cache.add, args=(cache_file, url, auth, command, (60, 120)))
+        t = threading.Thread(target=self.cache.add, args=(cache_file, url, auth, command, (60, 120)), kwargs={'session': self.session})
         t.daemon = True
         t.start()
       return r
     else:
       # no cached response found, so send the command directly to Kodi and,
       # if caching is enabled, cache the response.
-      return self.cache.add(cache_file, url, auth, command, timeout, wait_resp)
+      return self.cache.add(cache_file, url, auth, command, timeout, wait_resp, self.session)
+
+  # Let go of what this instance holds open, e.g. when KodiRegistry replaces
+  # it after a config change.  The instance shouldn't be used afterwards.
+  def Close(self):
+    if self.notifications:
+      if self.library_mirror:
+        self.notifications.unsubscribe(('mirror', self.library_mirror.path), self.library_mirror.invalidate)
+      self.notifications.unsubscribe(('show_details', self.endpoint), self.ForgetShowDetails)
+    if self.library_mirror:
+      self.library_mirror.close()
+
+  # Have the notification listener drop what we keep about the libraries
+  # (cached responses, the library mirror, recommendation pools) as soon as
+  # Kodi reports a change, and the recommendation pools whenever playback
+  # stops.  Subscriptions are keyed on what they clear, so
+  # each instance replaces the last one's instead of adding to them.
+  def SubscribeNotifications(self):
+    endpoint = self.endpoint
+    if self.cache.enabled:
+      self.notifications.subscribe(('cache', self.cache.backend, self.cache.bucket_name), lambda mediatypes, cache=self.cache: cache.clear())
+    if self.library_mirror:
+      self.notifications.subscribe(('mirror', self.library_mirror.path), self.library_mirror.invalidate)
+    self.notifications.subscribe(('recommend', endpoint), lambda mediatypes: get_recommendation_store().invalidate(endpoint, mediatypes))
+    self.notifications.subscribe(('show_details', endpoint), self.ForgetShowDetails)
+    self.notifications.subscribe_playback(('recommend', endpoint), lambda: get_recommendation_store().invalidate(endpoint))
+
+  # Drop the show details GetShowsDetails() remembers if mediatypes include
+  # tvshows.
+  def ForgetShowDetails(self, mediatypes=None):
+    if mediatypes is None or 'tvshows' in mediatypes:
+      self.show_details = {}
+
+  # Send several JSON-RPC commands (from RPCString()) to Kodi as one batch
+  # request and return their responses in the same order.  A command that
+  # gets no response comes back as an empty dict.
+  def SendBatch(self, commands):
+    batch = []
+    for idx, command in enumerate(commands):
+      j = json.loads(command)
+      j["id"] = idx
+      batch.append(j)
+
+    responses = [{} for command in commands]
+    if not batch:
+      return responses
+
+    data = self.SendCommand(json.dumps(batch))
+    if isinstance(data, list):
+      for r in data:
+        if isinstance(r.get('id'), int) and 0 <= r['id'] < len(responses):
+          responses[r['id']] = r
+    else:
+      log.error('Batch request failed: %s', data)
+    return responses
 
 
   # Utilities
@@ -478,6 +904,30 @@ class Kodi:
 
   # Match heard string to something in the results
   def matchHeard(self, heard, results, lookingFor='label', limit=10):
+    return [item for item, score in self.matchHeardScored(heard, results, lookingFor, limit)]
+
+  # The heard string plus its number-normalized forms (roman numerals, digits
+  # and words), for matching against labels.
+  def matchStrings(self, heard_lower):
+    match_strings = []
+    for f in (None, digits2roman, words2roman, words2digits, digits2words):
+      try:
+        if f is not None:
+          match_string = f(heard_lower, self.language)
+          match_func = f.__name__
+        else:
+          match_string = heard_lower
+          match_func = 'heard'
+
+        match_strings.append(match_string)
+        log.info('  %s -> "%s"', match_func, match_string.encode("utf-8"))
+      except:
+        continue
+    return match_strings
+
+  # Like matchHeard(), but returns (item, score) tuples.  Simple (direct)
+  # matches score 100; fuzzy matches carry their fuzzywuzzy score.
+  def matchHeardScored(self, heard, results, lookingFor='label', limit=10):
     located = []
 
     heard_lower = heard.lower()
@@ -497,7 +947,7 @@ class Kodi:
       if type(heard_lower) is type(result_lower):
         if result_lower == heard_lower:
           log.info('Simple match on direct comparison')
-          located.append(result)
+          located.append((result, 100))
           continue
 
       # Strip out non-ascii symbols
@@ -506,48 +956,92 @@ class Kodi:
       # Direct comparison (ASCII)
       if result_name == heard_ascii:
         log.info('Simple match on direct comparison (ASCII)')
-        located.append(result)
+        located.append((result, 100))
         continue
 
     if not located:
       log.info('Simple match failed, trying fuzzy match')
       log.info('Processing %d items with fuzzywuzzy...', len(results))
 
-      match_strings = []
-      for f in (None, digits2roman, words2roman, words2digits, digits2words):
-        try:
-          if f is not None:
-            match_string = f(heard_lower, self.language)
-            match_func = f.__name__
-          else:
-            match_string = heard_lower
-            match_func = 'heard'
-
-          match_strings.append(match_string)
-          log.info('  %s -> "%s"', match_func, match_string.encode("utf-8"))
-        except:
-          continue
+      match_strings = self.matchStrings(heard_lower)
 
+      labels = [d[lookingFor] for d in results]
       fuzzy_results = []
-      for ms in set(match_strings):
-        log.info('  Trying with "%s"', ms.encode("utf-8"))
-        matches = process.extractBests(ms, [d[lookingFor] for d in results], limit=limit, scorer=fuzz.UQRatio, score_cutoff=75)
-        if matches:
-          log.info('    Best score %d%%', matches[0][1])
-          fuzzy_results += matches
+      if self.match_processes > 1 and len(labels) >= PARALLEL_MATCH_MIN_ITEMS:
+        log.info('  Sharding across %d match workers', self.match_processes)
+        try:
+          fuzzy_results = get_parallel_matcher(self.match_processes).extract(set(match_strings), labels, limit)
+        except (EOFError, IOError, OSError) as e:
+          log.warn('Parallel match failed, falling back to serial: %s', repr(e))
+          reset_parallel_matcher()
+          fuzzy_results = fuzzy_extract(set(match_strings), labels, limit)
+      else:
+        fuzzy_results = fuzzy_extract(set(match_strings), labels, limit)
 
       # Got a match?
       if fuzzy_results:
-        winners = sorted(fuzzy_results, key=lambda x: x[1], reverse=True)
-        log.info('BEST MATCH: "%s" @ %d%%', winners[0][0].encode("utf-8"), winners[0][1])
-        for winner in winners:
-          located.append((item for item in results if item[lookingFor] == winner[0]).next())
+        log.info('BEST MATCH: "%s" @ %d%%', fuzzy_results[0][0].encode("utf-8"), fuzzy_results[0][1])
+        located = [(results[idx], score) for label, score, idx in fuzzy_results]
     else:
-      log.info('BEST MATCH: "%s"', located[0][lookingFor].encode("utf-8"))
+      log.info('BEST MATCH: "%s"', located[0][0][lookingFor].encode("utf-8"))
 
     return located[:limit]
 
 
+  # Match heard_search against a library list of mediatype (movies, tvshows,
+  # episodes, musicvideos, artists, albums or songs), narrowing the list down
+  # as cheaply as possible first:
+  #
+  #  1. If the library mirror has been synced for mediatype, fuzzy match the
+  #     candidates from its full-text search.
+  #  2. If pushdown_field is given, ask Kodi for only the items whose
+  #     pushdown_field contains distinctive words from heard_search (see
+  #     pushdown_filters()).  fetch() has to accept filters, filtertype and
+  #     cache_resp; these responses depend on what was heard, so they are
+  #     not cached.
+  #  3. Fall back to the full list from fetch().
+  #
+  # We move on to the next step whenever a step turns up nothing that matches.
+  def matchLibrary(self, heard_search, mediatype, fetch, lookingFor='label', mirror=True, pushdown_field=None):
+    match_strings = None
+
+    if mirror and self.library_mirror and self.library_mirror.is_synced(mediatype):
+      match_strings = self.matchStrings(heard_search.lower())
+      candidates = self.library_mirror.search(mediatype, match_strings)
+      log.info('Library mirror returned %d candidate %s', len(candidates), mediatype)
+      if candidates:
+        ll = self.matchHeard(heard_search, candidates, lookingFor)
+        if ll:
+          return ll
+        log.info('No match among candidates, falling back')
+
+    if pushdown_field:
+      if match_strings is None:
+        match_strings = self.matchStrings(heard_search.lower())
+      for filters, filtertype in pushdown_filters(match_strings, pushdown_field):
+        data = fetch(filters=filters, filtertype=filtertype, cache_resp=False)
+        if 'result' in data and mediatype in data['result']:
+          log.info('Kodi returned %d %s for %s of %s', len(data['result'][mediatype]), mediatype, filtertype, ', '.join(f['value'] for f in filters).encode("utf-8"))
+          ll = self.matchHeard(heard_search, data['result'][mediatype], lookingFor)
+          if ll:
+            return ll
+      log.info('No match among filtered %s, fetching all of them', mediatype)
+
+    data = fetch()
+    if 'result' in data and mediatype in data['result']:
+      return self.matchHeard(heard_search, data['result'][mediatype], lookingFor)
+    return []
+
+  # Sync mediatypes (all of them by default) into the library mirror, if
+  # one is configured.  Returns {mediatype: item count}.
+  #
+  # With incremental, libraries that have been mirrored before only fetch
+  # what was added or removed since.
+  def SyncLibraryMirror(self, mediatypes=None, incremental=True):
+    if not self.library_mirror:
+      return {}
+    return self.library_mirror.sync(self, mediatypes, incremental)
+
   def FindVideoPlaylist(self, heard_search):
     log.info('Searching for video playlist "%s"', heard_search.encode("utf-8"))
 
@@ -588,11 +1082,9 @@ class Kodi:
     log.info('Searching for movie "%s"', heard_search.encode("utf-8"))
 
     located = []
-    movies = self.GetMovies()
-    if 'result' in movies and 'movies' in movies['result']:
-      ll = self.matchHeard(heard_search, movies['result']['movies'])
-      if ll:
-        located = [(item['movieid'], item['label']) for item in ll]
+    ll = self.matchLibrary(heard_search, 'movies', self.GetMovies, pushdown_field='title')
+    if ll:
+      located = [(item['movieid'], item['label']) for item in ll]
 
     return located
 
@@ -600,39 +1092,66 @@ class Kodi:
     log.info('Searching for show "%s"', heard_search.encode("utf-8"))
 
     located = []
-    shows = self.GetShows()
-    if 'result' in shows and 'tvshows' in shows['result']:
-      ll = self.matchHeard(heard_search, shows['result']['tvshows'])
-      if ll:
-        located = [(item['tvshowid'], item['label']) for item in ll]
+    ll = self.matchLibrary(heard_search, 'tvshows', self.GetShows)
+    if ll:
+      located = [(item['tvshowid'], item['label']) for item in ll]
 
     return located
 
   # There is no JSON-RPC method for VideoLibrary.GetArtists, so we need a way
   # to filter the library results here.
+  #
+  # Kodi gives us arrays for the artist fields (for videos with more than one
+  # artist), so we match against every name in them via the artist index.
   def FilterMusicVideosByArtist(self, results, artist):
     log.info('Searching for music videos by "%s"', artist.encode("utf-8"))
 
-    # Kodi.matchHeard() expects to match on strings, but Kodi gives us arrays
-    # for the artist fields.  I'm not entirely sure, but I presume it's for
-    # alternate artist names.  For simplicity (and until someone complains),
-    # let's just choose the first artist label to match on.
-    artistvideos = [{k: (v if k != u'artist' else v[0]) for k, v in d.items()} for d in results]
-    return self.matchHeard(artist, artistvideos, 'artist', sys.maxint)
+    index, names = self.GetMusicVideoArtistIndex(results)
+
+    located = []
+    seen = set()
+    for match in self.matchHeard(artist, names, 'artist', sys.maxint):
+      for mv in index[match['artist']]:
+        if mv['musicvideoid'] not in seen:
+          seen.add(mv['musicvideoid'])
+          located.append(mv)
+    return located
+
+  # Index music videos by every name in their artist arrays.  Returns a tuple
+  # of:
+  #
+  #   index: artist name -> list of music videos
+  #   names: [{'artist': name}, ...] for each distinct name, for matchHeard()
+  #
+  # The index for the most recent music videos is kept, so filtering the
+  # same library again, even from a fresh GetMusicVideos response, is just a
+  # lookup.  It is keyed on the fields it is built from, since cached
+  # responses are decoded into new lists on every request.
+  def GetMusicVideoArtistIndex(self, musicvideos):
+    key = (len(musicvideos), hash(tuple((mv['musicvideoid'], mv['label'], tuple(mv.get('artist') or ())) for mv in musicvideos)))
+    if self.musicvideo_artist_index is None or self.musicvideo_artist_index[0] != key:
+      index = collections.OrderedDict()
+      for mv in musicvideos:
+        for name in mv.get('artist') or []:
+          index.setdefault(name, []).append(mv)
+      names = [{'artist': name} for name in index]
+      self.musicvideo_artist_index = (key, index, names)
+    return self.musicvideo_artist_index[1:]
 
   def FindMusicVideo(self, heard_search, heard_artist=None):
     log.info('Searching for music video "%s"', heard_search.encode("utf-8"))
 
     located = []
-    mvs = self.GetMusicVideos()
-    if 'result' in mvs and 'musicvideos' in mvs['result']:
-      if heard_artist:
+    if heard_artist:
+      ll = []
+      mvs = self.GetMusicVideos()
+      if 'result' in mvs and 'musicvideos' in mvs['result']:
         musicvideos = self.FilterMusicVideosByArtist(mvs['result']['musicvideos'], heard_artist)
-      else:
-        musicvideos = mvs['result']['musicvideos']
-      ll = self.matchHeard(heard_search, musicvideos)
-      if ll:
-        located = [(item['musicvideoid'], item['label']) for item in ll]
+        ll = self.matchHeard(heard_search, musicvideos)
+    else:
+      ll = self.matchLibrary(heard_search, 'musicvideos', self.GetMusicVideos)
+    if ll:
+      located = [(item['musicvideoid'], item['label']) for item in ll]
 
     return located
 
@@ -652,11 +1171,9 @@ class Kodi:
     log.info('Searching for artist "%s"', heard_search.encode("utf-8"))
 
     located = []
-    artists = self.GetMusicArtists()
-    if 'result' in artists and 'artists' in artists['result']:
-      ll = self.matchHeard(heard_search, artists['result']['artists'], 'artist')
-      if ll:
-        located = [(item['artistid'], item['label']) for item in ll]
+    ll = self.matchLibrary(heard_search, 'artists', self.GetMusicArtists, 'artist')
+    if ll:
+      located = [(item['artistid'], item['label']) for item in ll]
 
     return located
 
@@ -665,14 +1182,11 @@ class Kodi:
 
     located = []
     if artist_id:
-      albums = self.GetArtistAlbums(artist_id)
+      ll = self.matchLibrary(heard_search, 'albums', functools.partial(self.GetArtistAlbums, artist_id), mirror=False)
     else:
-      albums = self.GetAlbums()
-    if 'result' in albums and 'albums' in albums['result']:
-      albums_list = albums['result']['albums']
-      ll = self.matchHeard(heard_search, albums['result']['albums'])
-      if ll:
-        located = [(item['albumid'], item['label']) for item in ll]
+      ll = self.matchLibrary(heard_search, 'albums', self.GetAlbums, pushdown_field='album')
+    if ll:
+      located = [(item['albumid'], item['label']) for item in ll]
 
     return located
 
@@ -681,15 +1195,13 @@ class Kodi:
 
     located = []
     if album_id:
-      songs = self.GetAlbumSongs(album_id)
+      ll = self.matchLibrary(heard_search, 'songs', functools.partial(self.GetAlbumSongs, album_id), mirror=False)
     elif artist_id:
-      songs = self.GetArtistSongs(artist_id)
+      ll = self.matchLibrary(heard_search, 'songs', functools.partial(self.GetArtistSongs, artist_id), mirror=False)
     else:
-      songs = self.GetSongs()
-    if 'result' in songs and 'songs' in songs['result']:
-      ll = self.matchHeard(heard_search, songs['result']['songs'])
-      if ll:
-        located = [(item['songid'], item['label']) for item in ll]
+      ll = self.matchLibrary(heard_search, 'songs', self.GetSongs, pushdown_field='title')
+    if ll:
+      located = [(item['songid'], item['label']) for item in ll]
 
     return located
 
@@ -697,12 +1209,44 @@ class Kodi:
     log.info('Searching for addon "%s"', heard_search.encode("utf-8"))
 
     located = []
-    for content in ['video', 'audio', 'image', 'executable']:
-      addons = self.GetAddons(content)
-      if 'result' in addons and 'addons' in addons['result']:
-        ll = self.matchHeard(heard_search, addons['result']['addons'], 'name')
-        if ll:
-          located = [(item['addonid'], item['name']) for item in ll]
+    ll = self.matchHeard(heard_search, self.GetAddonCatalogue(), 'name')
+    if ll:
+      located = [(item['addonid'], item['name']) for item in ll]
+
+    return located
+
+  # Search every library in mediatypes (all of SEARCH_MEDIATYPES by default)
+  # for heard_search at once.  The libraries are fetched concurrently and
+  # matched as one combined index, so scores are comparable across types.
+  #
+  # Returns a ranked list of hits like:
+  #   {'type': 'movie', 'movieid': 12, 'label': u'Heat', 'score': 100}
+  #
+  # where type is one of:
+  #   movie, tvshow, musicvideo, artist, album, song
+  def FindMedia(self, heard_search, mediatypes=None, limit=10):
+    log.info('Searching all libraries for "%s"', heard_search.encode("utf-8"))
+
+    if mediatypes is None:
+      mediatypes = [m[0] for m in SEARCH_MEDIATYPES]
+    searches = [m for m in SEARCH_MEDIATYPES if m[0] in mediatypes]
+
+    libraries = run_concurrently([getattr(self, m[1]) for m in searches])
+
+    combined = []
+    for (mediatype, getter, key, idfield, lookingFor), library in zip(searches, libraries):
+      if isinstance(library, Exception):
+        log.warn('Unable to fetch %s library: %s', mediatype, repr(library))
+        continue
+      if 'result' in library and key in library['result']:
+        for item in library['result'][key]:
+          combined.append({'type': mediatype, idfield: item[idfield], 'label': item[lookingFor]})
+
+    located = []
+    for item, score in self.matchHeardScored(heard_search, combined, limit=limit):
+      hit = dict(item)
+      hit['score'] = score
+      located.append(hit)
 
     return located
 
@@ -715,29 +1259,102 @@ class Kodi:
   def AddSongToPlaylist(self, song_id):
     return self.SendCommand(RPCString("Playlist.Add", {"playlistid": 0, "item": {"songid": int(song_id)}}))
 
-  def AddSongsToPlaylist(self, song_ids, shuffle=False):
-    songs_array = []
+  def AddSongsToPlaylist(self, song_ids, shuffle=False, play=False):
+    return self.AddItemsToPlaylist(0, [dict(songid=song_id) for song_id in song_ids], shuffle, play)
 
+  # Add items (Playlist.Item dicts) to playlistid, trimmed to playlist_limit.
+  #
+  # By default the items are added in chunks that Kodi will accept in a
+  # single call and the last response is returned.
+  #
+  # With play, only a small first chunk is added before the playlist starts
+  # playing, so playback begins at once no matter how long the playlist is.
+  # The rest is added on a background thread and a PlaylistEnqueue is
+  # returned; call wait() or flush() on it before exiting.
+  def AddItemsToPlaylist(self, playlistid, items, shuffle=False, play=False):
     if shuffle:
-      random.shuffle(song_ids)
+      # a random sample is already in random order, and doesn't need the
+      # whole list shuffled when we're only keeping playlist_limit of it
+      items = random.sample(items, min(len(items), self.playlist_limit))
+    items = items[:self.playlist_limit]
 
-    songs_array = [dict(songid=song_id) for song_id in song_ids[:self.playlist_limit]]
+    if play:
+      return PlaylistEnqueue(self, playlistid, items).start()
 
-    # Segment the requests into chunks that Kodi will accept in a single call
-    for a in [songs_array[x:x+2000] for x in range(0, len(songs_array), 2000)]:
+    res = None
+    for a in [items[x:x+PLAYLIST_CHUNK_MAX] for x in range(0, len(items), PLAYLIST_CHUNK_MAX)]:
       log.info('Adding %d items to the queue...', len(a))
-      res = self.SendCommand(RPCString("Playlist.Add", {"playlistid": 0, "item": a}))
+      res = self.SendCommand(RPCString("Playlist.Add", {"playlistid": playlistid, "item": a}))
 
     return res
 
-  def AddAlbumToPlaylist(self, album_id, shuffle=False):
-    songs_result = self.GetAlbumSongs(album_id)
-    songs = songs_result['result']['songs']
-    songs_array = []
-    for song in songs:
-      songs_array.append(song['songid'])
+  # Add the songs matching filters to the audio playlist.
+  #
+  # If that won't run into playlist_limit, we let Kodi expand `item` (an
+  # albumid, artistid or genreid item) itself rather than sending it the
+  # song ids.  Shuffling is then left to the player, so it's only possible
+  # when we start it (play).  Otherwise, we fall back to adding explicit
+  # song ids.
+  def AddSongSetToPlaylist(self, item, filters, shuffle=False, play=False):
+    if shuffle and not play:
+      return self.AddRandomSongsToPlaylist(filters, play)
+
+    songs = []
+    fits = True
+    if self.playlist_limit != sys.maxint:
+      # One more than the limit, so the same request tells us whether the
+      # set fits and, if it doesn't, which songs to add instead.
+      data = self.GetSongs(filters=filters, limits=(0, self.playlist_limit + 1))
+      if 'result' in data:
+        songs = [song['songid'] for song in data['result'].get('songs', [])]
+      fits = 'result' in data and len(songs) <= self.playlist_limit
+
+    if fits:
+      log.info('Adding %s to the queue...', item)
+      enqueue = PlaylistEnqueue(self, 0, [item], shuffled=shuffle)
+      if play:
+        return enqueue.start()
+      return enqueue.flush()
+
+    if shuffle:
+      return self.AddRandomSongsToPlaylist(filters, play)
+    return self.AddSongsToPlaylist(songs, False, play)
+
+  # Have Kodi pick up to playlist_limit random items from a library (filtered
+  # by filters) and add them to playlistid, so shuffling a huge library
+  # doesn't mean downloading and shuffling all of it here.
+  #
+  # method, key and idfield are the JSON-RPC method, result key and id field
+  # for the library, e.g. AudioLibrary.GetSongs, songs and songid.
+  def AddRandomItemsToPlaylist(self, playlistid, method, key, idfield, filters=None, play=False):
+    limits = None
+    if self.playlist_limit != sys.maxint:
+      limits = (0, self.playlist_limit)
+    # Not cached -- we want a different pick every time.
+    data = self.SendCommand(RPCString(method, sort=SORT_RANDOM, filters=filters, limits=limits))
+    items = []
+    if 'result' in data and key in data['result']:
+      items = [{idfield: item[idfield]} for item in data['result'][key]]
+    log.info('Kodi picked %d random %s', len(items), key)
+    return self.AddItemsToPlaylist(playlistid, items, play=play)
+
+  def AddRandomSongsToPlaylist(self, filters=None, play=False):
+    return self.AddRandomItemsToPlaylist(0, "AudioLibrary.GetSongs", 'songs', 'songid', filters, play)
+
+  def AddRandomEpisodesToPlaylist(self, filters=None, play=False):
+    return self.AddRandomItemsToPlaylist(1, "VideoLibrary.GetEpisodes", 'episodes', 'episodeid', filters, play)
+
+  def AddRandomMusicVideosToPlaylist(self, filters=None, play=False):
+    return self.AddRandomItemsToPlaylist(1, "VideoLibrary.GetMusicVideos", 'musicvideos', 'musicvideoid', filters, play)
+
+  def AddAlbumToPlaylist(self, album_id, shuffle=False, play=False):
+    return self.AddSongSetToPlaylist({"albumid": int(album_id)}, [{"albumid": int(album_id)}], shuffle, play)
 
-    return self.AddSongsToPlaylist(songs_array, shuffle)
+  def AddArtistToPlaylist(self, artist_id, shuffle=False, play=False):
+    return self.AddSongSetToPlaylist({"artistid": int(artist_id)}, [{"artistid": int(artist_id)}], shuffle, play)
+
+  def AddMusicGenreToPlaylist(self, genre_id, shuffle=False, play=False):
+    return self.AddSongSetToPlaylist({"genreid": int(genre_id)}, [{"genreid": int(genre_id)}], shuffle, play)
 
   def GetAudioPlaylistItems(self):
     return self.SendCommand(RPCString("Playlist.GetItems", {"playlistid": 0}))
@@ -758,50 +1375,17 @@ class Kodi:
   def AddEpisodeToPlayList(self, ep_id):
     return self.SendCommand(RPCString("Playlist.Add", {"playlistid": 1, "item": {"episodeid": int(ep_id)}}))
 
-  def AddEpisodesToPlaylist(self, episode_ids, shuffle=False):
-    if shuffle:
-      random.shuffle(episode_ids)
-
-    episodes_array = [dict(episodeid=episode_id) for episode_id in episode_ids[:self.playlist_limit]]
-
-    # Segment the requests into chunks that Kodi will accept in a single call
-    episode_groups = [episodes_array[x:x+2000] for x in range(0, len(episodes_array), 2000)]
-    for a in episode_groups:
-      log.info('Adding %d items to the queue...', len(a))
-      res = self.SendCommand(RPCString("Playlist.Add", {"playlistid": 1, "item": a}))
-
-    return res
+  def AddEpisodesToPlaylist(self, episode_ids, shuffle=False, play=False):
+    return self.AddItemsToPlaylist(1, [dict(episodeid=episode_id) for episode_id in episode_ids], shuffle, play)
 
-  def AddMusicVideosToPlaylist(self, musicvideo_ids, shuffle=False):
-    if shuffle:
-      random.shuffle(musicvideo_ids)
-
-    musicvideos_array = [dict(musicvideoid=musicvideo_id) for musicvideo_id in musicvideo_ids[:self.playlist_limit]]
-
-    # Segment the requests into chunks that Kodi will accept in a single call
-    musicvideo_groups = [musicvideos_array[x:x+2000] for x in range(0, len(musicvideos_array), 2000)]
-    for a in musicvideo_groups:
-      log.info('Adding %d items to the queue...', len(a))
-      res = self.SendCommand(RPCString("Playlist.Add", {"playlistid": 1, "item": a}))
-
-    return res
+  def AddMusicVideosToPlaylist(self, musicvideo_ids, shuffle=False, play=False):
+    return self.AddItemsToPlaylist(1, [dict(musicvideoid=musicvideo_id) for musicvideo_id in musicvideo_ids], shuffle, play)
 
   def AddMovieToPlaylist(self, movie_id):
     return self.SendCommand(RPCString("Playlist.Add", {"playlistid": 1, "item": {"movieid": int(movie_id)}}))
 
-  def AddVideosToPlaylist(self, video_files, shuffle=False):
-    if shuffle:
-      random.shuffle(video_files)
-
-    videos_array = [dict(file=video_file) for video_file in video_files[:self.playlist_limit]]
-
-    # Segment the requests into chunks that Kodi will accept in a single call
-    video_groups = [videos_array[x:x+2000] for x in range(0, len(videos_array), 2000)]
-    for a in video_groups:
-      log.info('Adding %d items to the queue...', len(a))
-      res = self.SendCommand(RPCString("Playlist.Add", {"playlistid": 1, "item": a}))
-
-    return res
+  def AddVideosToPlaylist(self, video_files, shuffle=False, play=False):
+    return self.AddItemsToPlaylist(1, [dict(file=video_file) for video_file in video_files], shuffle, play)
 
   def GetVideoPlaylistItems(self):
     return self.SendCommand(RPCString("Playlist.GetItems", {"playlistid": 1}))
@@ -837,18 +1421,32 @@ class Kodi:
 
   def UpdateVideo(self):
     self.cache.clear()
+    self.ForgetShowDetails()
+    if self.library_mirror:
+      self.library_mirror.invalidate(VIDEO_MEDIATYPES)
+    self.InvalidateRecommendationPools(VIDEO_MEDIATYPES)
     return self.SendCommand(RPCString("VideoLibrary.Scan"), False)
 
   def CleanVideo(self):
     self.cache.clear()
+    self.ForgetShowDetails()
+    if self.library_mirror:
+      self.library_mirror.invalidate(VIDEO_MEDIATYPES)
+    self.InvalidateRecommendationPools(VIDEO_MEDIATYPES)
     return self.SendCommand(RPCString("VideoLibrary.Clean"), False)
 
   def UpdateMusic(self):
     self.cache.clear()
+    if self.library_mirror:
+      self.library_mirror.invalidate(AUDIO_MEDIATYPES)
+    self.InvalidateRecommendationPools(AUDIO_MEDIATYPES)
     return self.SendCommand(RPCString("AudioLibrary.Scan"), False)
 
   def CleanMusic(self):
     self.cache.clear()
+    if self.library_mirror:
+      self.library_mirror.invalidate(AUDIO_MEDIATYPES)
+    self.InvalidateRecommendationPools(AUDIO_MEDIATYPES)
     return self.SendCommand(RPCString("AudioLibrary.Clean"), False)
 
 
@@ -946,31 +1544,50 @@ class Kodi:
     return self.SendCommand(RPCString("Application.SetMute", {"mute": "toggle"}), False)
 
   def GetCurrentVolume(self):
+    if self.notifications and self.notifications.volume is not None:
+      return {'result': {'volume': self.notifications.volume, 'muted': self.notifications.muted}}
     return self.SendCommand(RPCString("Application.GetProperties", fields=["volume", "muted"]))
 
-  def VolumeUp(self):
-    resp = self.GetCurrentVolume()
-    vol = resp['result']['volume']
-    if vol % 10 == 0:
-      # already modulo 10, so just add 10
-      vol += 10
-    else:
-      # round up to nearest 10
-      vol -= vol % -10
-    if vol > 100:
-      vol = 100
+  # vol is a level from 0 to 100, or "increment"/"decrement" to have Kodi
+  # step it by its own volume step.
+  def SetVolume(self, vol):
     return self.SendCommand(RPCString("Application.SetVolume", {"volume": vol}))
 
-  def VolumeDown(self):
-    resp = self.GetCurrentVolume()
-    vol = resp['result']['volume']
-    if vol % 10 != 0:
-      # round up to nearest 10 first
-      vol -= vol % -10
-    vol -= 10
-    if vol < 0:
-      vol = 0
-    return self.SendCommand(RPCString("Application.SetVolume", {"volume": vol}))
+  # Change the volume by steps * step percent (or steps of Kodi's own
+  # increment with step=None) as a batch of Kodi's increments/decrements.
+  # That is one round trip, and since each increment is relative to wherever
+  # Kodi's volume is at the time, repeated requests add up instead of racing
+  # each other.  Returns the response to the last increment.
+  #
+  # The number of increments needed is worked out from what one increment
+  # did last time on this endpoint (VOLUME_INCREMENT until we know).
+  def ChangeVolume(self, direction, steps=1, step=VOLUME_STEP):
+    if steps < 1:
+      raise ValueError('steps must be at least 1, got %r' % steps)
+
+    increment = get_player_snapshots().get_volume_increment(self.endpoint, VOLUME_INCREMENT)
+    if step:
+      count = max(int(round(steps * step / increment)), 1)
+    else:
+      count = int(steps)
+    responses = self.SendBatch([RPCString("Application.SetVolume", {"volume": direction})] * count)
+
+    # Kodi reports whole percents, so only learn from a run of increments
+    # long enough to average out the rounding, and that didn't hit 0 or 100.
+    levels = [r.get('result') for r in responses]
+    levels = [v for v in levels if isinstance(v, int) and 0 < v < 100]
+    if len(levels) > VOLUME_INCREMENT_SAMPLES and levels[-1] != levels[0]:
+      get_player_snapshots().put_volume_increment(self.endpoint, abs(levels[-1] - levels[0]) / float(len(levels) - 1))
+    return responses[-1]
+
+  # Raise the volume by steps * step percent ("up by 30" is steps=3).  See
+  # ChangeVolume().
+  def VolumeUp(self, steps=1, step=VOLUME_STEP):
+    return self.ChangeVolume("increment", steps, step)
+
+  # Lower the volume by steps * step percent.  See ChangeVolume().
+  def VolumeDown(self, steps=1, step=VOLUME_STEP):
+    return self.ChangeVolume("decrement", steps, step)
 
   def VolumeSet(self, vol, percent=True):
     if vol < 0:
@@ -980,7 +1597,7 @@ class Kodi:
       vol *= 10
     if vol > 100:
       vol = 100
-    return self.SendCommand(RPCString("Application.SetVolume", {"volume": vol}))
+    return self.SetVolume(vol)
 
   def SendText(self, send_text):
     return self.SendCommand(RPCString("Input.SendText", {"done": False, "text": send_text}))
@@ -1158,145 +1775,136 @@ class Kodi:
   # where type is one of:
   #   movie, tvshow, episode, musicvideo, artist, album, song
   def GetRecommendedItem(self, mediatype=None, mediagenre=None):
-    answer = ['', '', 0, mediagenre]
-
     if not mediatype:
-      return answer
-
-    m = []
-    if mediatype == 'movies':
-      if mediagenre:
-        m = self.GetUnwatchedMoviesByGenre(mediagenre, sort=SORT_RATING, limits=LIMIT_RECOMMENDED_MOVIES)
-      else:
-        m = self.GetUnwatchedMovies(sort=SORT_RATING, limits=LIMIT_RECOMMENDED_MOVIES)
-      if not m:
-        # Fall back to all movies if no unwatched available
-        if mediagenre:
-          movies = self.GetMoviesByGenre(mediagenre, sort=SORT_RATING, limits=LIMIT_RECOMMENDED_MOVIES)
-        else:
-          movies = self.GetMovies(sort=SORT_RATING, limits=LIMIT_RECOMMENDED_MOVIES)
-        if 'result' in movies and 'movies' in movies['result']:
-          m = movies['result']['movies']
-      if m:
-        r = random.choice(m)
-        answer[0] = 'movie'
-        answer[1] = r['label']
-        answer[2] = r['movieid']
-    elif mediatype == 'tvshows':
-      if mediagenre:
-        m = self.GetUnwatchedShowsByGenre(mediagenre, sort=SORT_RATING, limits=LIMIT_RECOMMENDED_SHOWS)
-      else:
-        m = self.GetUnwatchedShows(sort=SORT_RATING, limits=LIMIT_RECOMMENDED_SHOWS)
-      if not m:
-        # Fall back to all shows if no unwatched available
-        if mediagenre:
-          shows = self.GetShowsByGenre(mediagenre, sort=SORT_RATING, limits=LIMIT_RECOMMENDED_SHOWS)
-        else:
-          shows = self.GetShows(sort=SORT_RATING, limits=LIMIT_RECOMMENDED_SHOWS)
-        if 'result' in shows and 'tvshows' in shows['result']:
-          m = shows['result']['tvshows']
-      if m:
-        r = random.choice(m)
-        answer[0] = 'tvshow'
-        answer[1] = r['label']
-        answer[2] = r['tvshowid']
+      return ['', '', 0, mediagenre]
+    return self.GetRecommendedItems([mediatype], mediagenre)[0]
+
+  # Like GetRecommendedItem(), for each of mediatypes.
+  def GetRecommendedItems(self, mediatypes, mediagenre=None):
+    pools = self.GetRecommendationPools(mediatypes, mediagenre)
+    return [self.PickRecommendation(mediatype, mediagenre, pools[mediatype]) for mediatype in mediatypes]
+
+  # The JSON-RPC commands to find candidates for recommending a mediatype,
+  # best first: we recommend from the first one that returns anything.
+  # Returns a list of (result key, command).
+  def RecommendationQueries(self, mediatype, mediagenre=None):
+    answer_type, method, params, key, idfield, limits = RECOMMEND_MEDIATYPES[mediatype]
+
+    genre_filters = []
+    unwatched_genre_filters = []
+    if mediagenre:
+      genre_filters = [{"field": "genre", "operator": "is", "value": mediagenre}]
+      unwatched_genre_filters = [{"field": "genre", "operator": "contains", "value": mediagenre}]
+
+    queries = []
+    if mediatype in ('movies', 'tvshows'):
+      queries.append((key, RPCString(method, sort=SORT_RATING, filters=[FILTER_UNWATCHED] + unwatched_genre_filters, fields=["title", "playcount", "dateadded"], limits=limits)))
     elif mediatype == 'episodes':
-      if mediagenre:
-        shows = self.GetUnwatchedShowsByGenre(mediagenre, sort=SORT_RATING, limits=LIMIT_RECOMMENDED_SHOWS)
-      else:
-        shows = self.GetUnwatchedShows(sort=SORT_RATING, limits=LIMIT_RECOMMENDED_SHOWS)
-      if shows:
-        r = random.choice(shows)
-        m = self.GetUnwatchedEpisodesFromShow(r['tvshowid'], limits=(0, 1))
-      if not m:
-        # Fall back to all episodes if no unwatched available
-        if mediagenre:
-          episodes = self.GetEpisodesByGenre(mediagenre, sort=SORT_RATING, limits=LIMIT_RECOMMENDED_EPISODES)
-        else:
-          episodes = self.GetEpisodes(sort=SORT_RATING, limits=LIMIT_RECOMMENDED_EPISODES)
-        if 'result' in episodes and 'episodes' in episodes['result']:
-          m = episodes['result']['episodes']
-      if m:
-        r = random.choice(m)
-        answer[0] = 'episode'
-        answer[1] = r['label']
-        answer[2] = r['episodeid']
-    elif mediatype == 'musicvideos':
-      if mediagenre:
-        musicvideos = self.GetMusicVideosByGenre(mediagenre, sort=SORT_RATING, limits=LIMIT_RECOMMENDED_MUSICVIDEOS)
-      else:
-        musicvideos = self.GetMusicVideos(sort=SORT_RATING, limits=LIMIT_RECOMMENDED_MUSICVIDEOS)
-      if 'result' in musicvideos and 'musicvideos' in musicvideos['result']:
-        m = musicvideos['result']['musicvideos']
-      if m:
-        r = random.choice(m)
-        answer[0] = 'musicvideo'
-        answer[1] = r['label']
-        answer[2] = r['musicvideoid']
-    elif mediatype == 'artists':
-      if mediagenre:
-        artists = self.GetMusicArtistsByGenre(mediagenre, sort=SORT_RATING, limits=LIMIT_RECOMMENDED_ARTISTS)
-      else:
-        artists = self.GetMusicArtists(sort=SORT_RATING, limits=LIMIT_RECOMMENDED_ARTISTS)
-      if 'result' in artists and 'artists' in artists['result']:
-        m = artists['result']['artists']
-      if m:
-        r = random.choice(m)
-        answer[0] = 'artist'
-        answer[1] = r['label']
-        answer[2] = r['artistid']
-    elif mediatype == 'albums':
-      if mediagenre:
-        albums = self.GetAlbumsByGenre(mediagenre, sort=SORT_RATING, limits=LIMIT_RECOMMENDED_ALBUMS)
-      else:
-        albums = self.GetAlbums(sort=SORT_RATING, limits=LIMIT_RECOMMENDED_ALBUMS)
-      if 'result' in albums and 'albums' in albums['result']:
-        m = albums['result']['albums']
-      if m:
-        r = random.choice(m)
-        answer[0] = 'album'
-        answer[1] = r['label']
-        answer[2] = r['albumid']
-    elif mediatype == 'songs':
-      if mediagenre:
-        songs = self.GetSongsByGenre(mediagenre, sort=SORT_RATING, limits=LIMIT_RECOMMENDED_SONGS)
-      else:
-        songs = self.GetSongs(sort=SORT_RATING, limits=LIMIT_RECOMMENDED_SONGS)
-      if 'result' in songs and 'songs' in songs['result']:
-        m = songs['result']['songs']
-      if m:
-        r = random.choice(m)
-        answer[0] = 'song'
-        answer[1] = r['label']
-        answer[2] = r['songid']
-
-    return answer
+      # Unwatched shows first; we then pick the next episode of one of them.
+      queries.append(('tvshows', RPCString("VideoLibrary.GetTVShows", sort=SORT_RATING, filters=[FILTER_UNWATCHED] + unwatched_genre_filters, fields=["title", "playcount", "dateadded"], limits=LIMIT_RECOMMENDED_SHOWS)))
+    queries.append((key, RPCString(method, dict(params) if params else None, sort=SORT_RATING, filters=genre_filters, limits=limits)))
+    return queries
+
+  # Identifies the library the recommendation pools for mediatypes were
+  # computed from.  Without a library mirror we can't tell cheaply, so pools
+  # are only refreshed once they expire (or on a library scan/clean).
+  def RecommendationFingerprint(self, mediatypes):
+    if self.library_mirror:
+      return self.library_mirror.fingerprint(mediatypes)
+    return None
 
-  def GetRecommendedVideoItem(self):
-    answer = []
-    items = []
-    for content in ['movies', 'tvshows', 'episodes', 'musicvideos']:
-      item = self.GetRecommendedItem(content)
-      if item[0]:
-        items.append(item)
+  # Returns {mediatype: [candidate, ...]}, each candidate a record with the
+  # label and library id of an item to recommend.
+  #
+  # Pools are kept in the process-wide recommendation store for
+  # recommend_pool_ttl seconds, so repeated requests are answered from
+  # memory.  Pass refresh=True to recompute them regardless, e.g. from a
+  # scheduled job to keep them warm.
+  def GetRecommendationPools(self, mediatypes, mediagenre=None, refresh=False):
+    store = get_recommendation_store()
+    pools = {}
+    if self.recommend_pool_ttl and not refresh:
+      for mediatype in mediatypes:
+        pool = store.get((self.endpoint, mediatype, mediagenre), self.recommend_pool_ttl, self.RecommendationFingerprint([mediatype]))
+        if pool is not None:
+          pools[mediatype] = pool
+
+    missing = [mediatype for mediatype in mediatypes if mediatype not in pools]
+    if missing:
+      log.info('Computing recommendation pools for %s', ', '.join(missing))
+      pools.update(self.FetchRecommendationPools(missing, mediagenre))
+      if self.recommend_pool_ttl:
+        for mediatype in missing:
+          store.put((self.endpoint, mediatype, mediagenre), pools[mediatype], self.RecommendationFingerprint([mediatype]))
+    return pools
+
+  # Ask Kodi for the recommendation candidates for each of mediatypes.  All
+  # the RecommendationQueries() go in one batch, each distinct one once (the
+  # unwatched shows serve both tvshows and episodes); when episodes are to
+  # be picked from unwatched shows, the next unwatched episode of each of
+  # those shows is fetched in a second one.
+  def FetchRecommendationPools(self, mediatypes, mediagenre=None):
+    queries = [self.RecommendationQueries(mediatype, mediagenre) for mediatype in mediatypes]
+    commands = []
+    for qs in queries:
+      for key, command in qs:
+        if command not in commands:
+          commands.append(command)
+    responses = dict(zip(commands, self.SendBatch(commands)))
+
+    results = {}
+    for mediatype, qs in zip(mediatypes, queries):
+      results[mediatype] = [(key, responses[command].get('result', {}).get(key, [])) for key, command in qs]
+
+    shows = []
+    for mediatype in mediatypes:
+      if mediatype == 'episodes' and results[mediatype][0][0] == 'tvshows':
+        shows = results[mediatype][0][1]
+    if shows:
+      responses = self.SendBatch([RPCString("VideoLibrary.GetEpisodes", {"tvshowid": int(show['tvshowid'])}, filters=[FILTER_UNWATCHED], limits=(0, 1)) for show in shows])
+      results['episodes'][0] = ('episodes', [e for data in responses for e in data.get('result', {}).get('episodes', [])])
+
+    pools = {}
+    for mediatype in mediatypes:
+      answer_type, method, params, result_key, idfield, limits = RECOMMEND_MEDIATYPES[mediatype]
+      pools[mediatype] = []
+      for key, items in results[mediatype]:
+        if key == result_key and items:
+          pools[mediatype] = [make_record(mediatype, {'label': item['label'], idfield: item[idfield]}) for item in items]
+          break
+    return pools
 
-    if items:
-      answer = random.choice(items)
+  # Drop the stored recommendation pools for mediatypes (all by default).
+  def InvalidateRecommendationPools(self, mediatypes=None):
+    get_recommendation_store().invalidate(self.endpoint, mediatypes)
 
+  # Pick a random item from a recommendation pool (see
+  # GetRecommendationPools()).
+  def PickRecommendation(self, mediatype, mediagenre, pool):
+    answer = ['', '', 0, mediagenre]
+    if pool:
+      answer_type, method, params, result_key, idfield, limits = RECOMMEND_MEDIATYPES[mediatype]
+      r = random.choice(pool)
+      answer[0] = answer_type
+      answer[1] = r['label']
+      answer[2] = r[idfield]
     return answer
 
-  def GetRecommendedAudioItem(self):
+  # Recommend a random item out of mediatypes.
+  def GetRecommendedItemOf(self, mediatypes):
     answer = []
-    items = []
-    for content in ['musicvideos', 'artists', 'albums', 'songs']:
-      item = self.GetRecommendedItem(content)
-      if item[0]:
-        items.append(item)
+    pools = self.GetRecommendationPools(mediatypes)
+    candidates = [mediatype for mediatype in mediatypes if pools[mediatype]]
+    if candidates:
+      mediatype = random.choice(candidates)
+      answer = self.PickRecommendation(mediatype, None, pools[mediatype])
+    return answer
 
-    if items:
-      answer = random.choice(items)
+  def GetRecommendedVideoItem(self):
+    return self.GetRecommendedItemOf(['movies', 'tvshows', 'episodes', 'musicvideos'])
 
-    return answer
+  def GetRecommendedAudioItem(self):
+    return self.GetRecommendedItemOf(['musicvideos', 'artists', 'albums', 'songs'])
 
   # content can be: video, audio, image, executable, or unknown
   def GetAddons(self, content):
@@ -1305,6 +1913,45 @@ class Kodi:
     else:
       return self.SendCommand(RPCString("Addons.GetAddons", fields=["name"]))
 
+  # Returns every addon providing one of ADDON_CONTENT_TYPES, once each, tagged
+  # with the content types it provides:
+  #   {'addonid': 'plugin.video.youtube', 'name': u'YouTube', 'content': ['video', 'audio']}
+  #
+  # The per-content lists are fetched concurrently and the result is kept
+  # for ADDON_CATALOGUE_TTL seconds, so newly installed addons show up
+  # without a restart.
+  def GetAddonCatalogue(self):
+    if self.addon_catalogue is not None and time.time() - self.addon_catalogue[0] > ADDON_CATALOGUE_TTL:
+      self.addon_catalogue = None
+    if self.addon_catalogue is None:
+      catalogue = []
+      complete = True
+      by_id = {}
+      responses = run_concurrently([functools.partial(self.GetAddons, content) for content in ADDON_CONTENT_TYPES])
+      for content, addons in zip(ADDON_CONTENT_TYPES, responses):
+        if isinstance(addons, Exception):
+          log.warn('Unable to fetch %s addons: %s', content, repr(addons))
+          complete = False
+          continue
+        if 'result' not in addons:
+          log.warn('Unable to fetch %s addons: %s', content, addons)
+          complete = False
+          continue
+        if 'addons' in addons['result']:
+          for addon in addons['result']['addons']:
+            entry = by_id.get(addon['addonid'])
+            if entry is None:
+              entry = {'addonid': addon['addonid'], 'name': addon['name'], 'content': []}
+              by_id[addon['addonid']] = entry
+              catalogue.append(entry)
+            entry['content'].append(content)
+
+      if not complete:
+        # don't hang on to a partial catalogue
+        return catalogue
+      self.addon_catalogue = (time.time(), catalogue)
+    return self.addon_catalogue[1]
+
   def GetAddonDetails(self, addon_id):
     return self.SendCommand(RPCString("Addons.GetAddonDetails", {"addonid": addon_id}, fields=["name", "version", "description", "summary"]))
 
@@ -1334,8 +1981,8 @@ class Kodi:
     else:
       return None
 
-  def GetSongs(self, sort=None, filters=None, filtertype=None, limits=None):
-    return self.SendCommand(RPCString("AudioLibrary.GetSongs", sort=sort, filters=filters, filtertype=filtertype, limits=limits), cache_resp=True)
+  def GetSongs(self, sort=None, filters=None, filtertype=None, limits=None, cache_resp=True):
+    return self.SendCommand(RPCString("AudioLibrary.GetSongs", sort=sort, filters=filters, filtertype=filtertype, limits=limits), cache_resp=cache_resp)
 
   def GetSongsByGenre(self, genre, sort=None, limits=None):
     return self.GetSongs(sort=sort, filters=[{"field": "genre", "operator": "is", "value": genre}], limits=limits)
@@ -1359,8 +2006,8 @@ class Kodi:
   def GetArtistSongsPath(self, artist_id):
     return self.SendCommand(RPCString("AudioLibrary.GetSongs", filters=[{"artistid": int(artist_id)}], fields=["file"]), cache_resp=True)
 
-  def GetAlbums(self, sort=None, filters=None, filtertype=None, limits=None):
-    return self.SendCommand(RPCString("AudioLibrary.GetAlbums", sort=sort, filters=filters, filtertype=filtertype, limits=limits), cache_resp=True)
+  def GetAlbums(self, sort=None, filters=None, filtertype=None, limits=None, cache_resp=True):
+    return self.SendCommand(RPCString("AudioLibrary.GetAlbums", sort=sort, filters=filters, filtertype=filtertype, limits=limits), cache_resp=cache_resp)
 
   def GetAlbumsByGenre(self, genre, sort=None, limits=None):
     return self.GetAlbums(sort=sort, filters=[{"field": "genre", "operator": "is", "value": genre}], limits=limits)
@@ -1400,8 +2047,8 @@ class Kodi:
     data = self.SendCommand(RPCString("VideoLibrary.GetMusicVideoDetails", {"musicvideoid": int(mv_id)}, fields=["artist"]))
     return data['result']['musicvideodetails']
 
-  def GetMovies(self, sort=None, filters=None, filtertype=None, limits=None):
-    return self.SendCommand(RPCString("VideoLibrary.GetMovies", sort=sort, filters=filters, filtertype=filtertype, limits=limits), cache_resp=True)
+  def GetMovies(self, sort=None, filters=None, filtertype=None, limits=None, cache_resp=True):
+    return self.SendCommand(RPCString("VideoLibrary.GetMovies", sort=sort, filters=filters, filtertype=filtertype, limits=limits), cache_resp=cache_resp)
 
   def GetMoviesByGenre(self, genre, sort=None, limits=None):
     return self.GetMovies(sort=sort, fiters=[{"genre": genre}], limits=limits)
@@ -1420,6 +2067,26 @@ class Kodi:
     data = self.SendCommand(RPCString("VideoLibrary.GetTVShowDetails", {"tvshowid": show_id}, fields=["art"]))
     return data['result']['tvshowdetails']
 
+  # GetShowDetails() for several shows in one batch request.  Returns
+  # {show_id: tvshowdetails}; details are remembered for SHOW_DETAILS_TTL
+  # seconds (or until the video library changes), so only shows we haven't
+  # seen lately are fetched.
+  def GetShowsDetails(self, show_ids):
+    now = time.time()
+    known = {}
+    for show_id in set(show_ids):
+      entry = self.show_details.get(show_id)
+      if entry is not None and now - entry[0] <= SHOW_DETAILS_TTL:
+        known[show_id] = entry[1]
+    missing = [show_id for show_id in set(show_ids) if show_id not in known]
+    if missing:
+      responses = self.SendBatch([RPCString("VideoLibrary.GetTVShowDetails", {"tvshowid": show_id}, fields=["art"]) for show_id in missing])
+      for show_id, data in zip(missing, responses):
+        if 'tvshowdetails' in data.get('result', {}):
+          known[show_id] = data['result']['tvshowdetails']
+          self.show_details[show_id] = (now, known[show_id])
+    return dict((show_id, known[show_id]) for show_id in show_ids if show_id in known)
+
   def GetEpisodes(self, sort=None, filters=None, filtertype=None, limits=None):
     return self.SendCommand(RPCString("VideoLibrary.GetEpisodes", sort=sort, filters=filters, filtertype=filtertype, limits=limits), cache_resp=True)
 
@@ -1468,7 +2135,7 @@ class Kodi:
   def GetEpisodesFromShowDetails(self, show_id):
     return self.SendCommand(RPCString("VideoLibrary.GetEpisodes", {"tvshowid": int(show_id)}, fields=["season", "episode"]))
 
-  # Returns a list of dictionaries with information about unwatched movies. Useful for
+  # Returns a list of records (dict-like, see records.py) with information about unwatched movies. Useful for
   # telling/showing users what's ready to be watched. Setting max to very high values
   # can take a long time.
   def GetUnwatchedMovies(self, sort=SORT_DATEADDED, limits=None):
@@ -1478,10 +2145,10 @@ class Kodi:
     answer = []
     if 'movies' in data['result']:
       for d in data['result']['movies']:
-        answer.append({'title': d['title'], 'movieid': d['movieid'], 'label': d['label'], 'dateadded': datetime.datetime.strptime(d['dateadded'], "%Y-%m-%d %H:%M:%S")})
+        answer.append(Movie(title=d['title'], movieid=d['movieid'], label=d['label'], dateadded=d['dateadded']))
     return answer
 
-  # Returns a list of dictionaries with information about unwatched movies in a particular genre. Useful for
+  # Returns a list of records with information about unwatched movies in a particular genre. Useful for
   # telling/showing users what's ready to be watched. Setting max to very high values
   # can take a long time.
   def GetUnwatchedMoviesByGenre(self, genre, sort=SORT_DATEADDED, limits=None):
@@ -1491,10 +2158,10 @@ class Kodi:
     answer = []
     if 'movies' in data['result']:
       for d in data['result']['movies']:
-        answer.append({'title': d['title'], 'movieid': d['movieid'], 'label': d['label'], 'dateadded': datetime.datetime.strptime(d['dateadded'], "%Y-%m-%d %H:%M:%S")})
+        answer.append(Movie(title=d['title'], movieid=d['movieid'], label=d['label'], dateadded=d['dateadded']))
     return answer
 
-  # Returns a list of dictionaries with information about unwatched shows. Useful for
+  # Returns a list of records with information about unwatched shows. Useful for
   # telling/showing users what's ready to be watched. Setting max to very high values
   # can take a long time.
   def GetUnwatchedShows(self, sort=SORT_DATEADDED, limits=None):
@@ -1504,10 +2171,10 @@ class Kodi:
     answer = []
     if 'tvshows' in data['result']:
       for d in data['result']['tvshows']:
-        answer.append({'title': d['title'], 'tvshowid': d['tvshowid'], 'label': d['label'], 'dateadded': datetime.datetime.strptime(d['dateadded'], "%Y-%m-%d %H:%M:%S")})
+        answer.append(Show(title=d['title'], tvshowid=d['tvshowid'], label=d['label'], dateadded=d['dateadded']))
     return answer
 
-  # Returns a list of dictionaries with information about unwatched shows in a particular genre. Useful for
+  # Returns a list of records with information about unwatched shows in a particular genre. Useful for
   # telling/showing users what's ready to be watched. Setting max to very high values
   # can take a long time.
   def GetUnwatchedShowsByGenre(self, genre, sort=SORT_DATEADDED, limits=None):
@@ -1517,29 +2184,32 @@ class Kodi:
     answer = []
     if 'tvshows' in data['result']:
       for d in data['result']['tvshows']:
-        answer.append({'title': d['title'], 'tvshowid': d['tvshowid'], 'label': d['label'], 'dateadded': datetime.datetime.strptime(d['dateadded'], "%Y-%m-%d %H:%M:%S")})
+        answer.append(Show(title=d['title'], tvshowid=d['tvshowid'], label=d['label'], dateadded=d['dateadded']))
     return answer
 
   # Returns a list of dictionaries with information about episodes that have been watched.
   def GetWatchedEpisodes(self, sort=None, limits=None):
     return self.SendCommand(RPCString("VideoLibrary.GetEpisodes", sort=sort, filters=[FILTER_WATCHED], fields=["playcount", "showtitle", "season", "episode", "lastplayed"], limits=limits))
 
-  # Returns a list of dictionaries with information about unwatched episodes. Useful for
+  # Returns a list of records with information about unwatched episodes. Useful for
   # telling/showing users what's ready to be watched. Setting max to very high values
   # can take a long time.
-  def GetUnwatchedEpisodes(self, sort=SORT_DATEADDED, limits=None):
+  # With show_art, each episode also gets the 'art' of its show, fetched for
+  # all the shows at once (see GetShowsDetails()).
+  def GetUnwatchedEpisodes(self, sort=SORT_DATEADDED, limits=None, show_art=False):
     if not limits:
       limits = (0, self.max_unwatched_shows)
     data = self.SendCommand(RPCString("VideoLibrary.GetEpisodes", sort=sort, filters=[FILTER_UNWATCHED], fields=["title", "playcount", "showtitle", "tvshowid", "dateadded"], limits=limits))
     answer = []
     if 'episodes' in data['result']:
-      shows = set([d['tvshowid'] for d in data['result']['episodes']])
       show_info = {}
-      for show in shows:
-        show_info[show] = self.GetShowDetails(show_id=show)
+      if show_art:
+        show_info = self.GetShowsDetails([d['tvshowid'] for d in data['result']['episodes']])
       for d in data['result']['episodes']:
-        showinfo = show_info[d['tvshowid']]
-        answer.append({'title': d['title'], 'episodeid': d['episodeid'], 'show': d['showtitle'], 'label': d['label'], 'dateadded': datetime.datetime.strptime(d['dateadded'], "%Y-%m-%d %H:%M:%S")})
+        episode = Episode(title=d['title'], episodeid=d['episodeid'], show=d['showtitle'], label=d['label'], dateadded=d['dateadded'])
+        if show_art:
+          episode['art'] = show_info.get(d['tvshowid'], {}).get('art', {})
+        answer.append(episode)
     return answer
 
   def GetUnwatchedEpisodesFromShow(self, show_id, limits=None):
@@ -1547,7 +2217,7 @@ class Kodi:
     answer = []
     if 'episodes' in data['result']:
       for d in data['result']['episodes']:
-        answer.append({'title': d['title'], 'episodeid': d['episodeid'], 'show': d['showtitle'], 'label': d['label'], 'dateadded': datetime.datetime.strptime(d['dateadded'], "%Y-%m-%d %H:%M:%S")})
+        answer.append(Episode(title=d['title'], episodeid=d['episodeid'], show=d['showtitle'], label=d['label'], dateadded=d['dateadded']))
     return answer
 
 
@@ -1585,132 +2255,190 @@ class Kodi:
     url = http_normalize_slashes(url)
     url = url + '/' + path
 
-    accepted_answers = ['y', 'yes', 'Y', 'Yes', 'YES', 'true', 'True']
-
-    if self.config.get(self.dev_cfg_section, 'use_proxy') in accepted_answers:
+    if self.device_settings.use_proxy:
       stream_url = 'https://proxy.lexigr.am/proxy?file=' + url
-    elif self.config.get(self.dev_cfg_section, 'alt_proxy'):
-      stream_url = self.config.get(self.dev_cfg_section, 'alt_proxy') + url
+    elif self.device_settings.alt_proxy:
+      stream_url = self.device_settings.alt_proxy + url
     else:
       stream_url = url
 
     return stream_url
 
+  # The active players, as returned by Player.GetActivePlayers.  The result
+  # is kept for player_state_ttl seconds (shared with other instances talking
+  # to the same Kodi), or until a command that opens or stops a player is
+  # sent.
+  def GetActivePlayers(self):
+    if self.notifications and self.notifications.players is not None:
+      return self.notifications.players
+    snapshots = get_player_snapshots()
+    if self.player_state_ttl:
+      players = snapshots.get(self.endpoint, self.player_state_ttl)
+      if players is not None:
+        return players
+    data = self.SendCommand(RPCString("Player.GetActivePlayers"))
+    players = data.get("result", [])
+    if self.player_state_ttl and "result" in data:
+      snapshots.put(self.endpoint, players)
+    return players
+
   # Get the first active player.
   def GetPlayerID(self, playertype=['picture', 'audio', 'video']):
-    data = self.SendCommand(RPCString("Player.GetActivePlayers"))
-    result = data.get("result", [])
-    if result:
-      for curitem in result:
-        if curitem.get("type") in playertype:
-          return curitem.get("playerid")
+    for curitem in self.GetActivePlayers():
+      if curitem.get("type") in playertype:
+        return curitem.get("playerid")
     return None
 
   # Get the first active Video player.
   def GetVideoPlayerID(self, playertype=['video']):
-    data = self.SendCommand(RPCString("Player.GetActivePlayers"))
-    result = data.get("result", [])
-    if result:
-      for curitem in result:
-        if curitem.get("type") in playertype:
-          return curitem.get("playerid")
-    return None
-
+    return self.GetPlayerID(playertype)
 
   # Get the first active Audio player.
   def GetAudioPlayerID(self, playertype=['audio']):
-    data = self.SendCommand(RPCString("Player.GetActivePlayers"))
-    result = data.get("result", [])
-    if result:
-      for curitem in result:
-        if curitem.get("type") in playertype:
-          return curitem.get("playerid")
-    return None
+    return self.GetPlayerID(playertype)
 
   # Get the first active Picture player.
   def GetPicturePlayerID(self, playertype=['picture']):
-    data = self.SendCommand(RPCString("Player.GetActivePlayers"))
-    result = data.get("result", [])
-    if result:
-      for curitem in result:
-        if curitem.get("type") in playertype:
-          return curitem.get("playerid")
-    return None
+    return self.GetPlayerID(playertype)
 
   # Information about the video or audio that's currently playing
 
   def GetActivePlayItem(self):
     playerid = self.GetPlayerID()
     if playerid is not None:
-      data = self.SendCommand(RPCString("Player.GetItem", {"playerid": playerid}, fields=["title", "album", "artist", "season", "episode", "showtitle", "tvshowid", "description"]))
+      data = self.SendCommand(RPCString("Player.GetItem", {"playerid": playerid}, fields=PLAYER_ITEM_FIELDS))
       return data['result']['item']
 
   def GetActivePlayProperties(self):
     playerid = self.GetPlayerID()
     if playerid is not None:
-      data = self.SendCommand(RPCString("Player.GetProperties", {"playerid": playerid}, fields=["currentaudiostream", "currentsubtitle", "canshuffle", "shuffled", "canrepeat", "repeat", "canzoom", "canrotate", "canmove"]))
+      data = self.SendCommand(RPCString("Player.GetProperties", {"playerid": playerid}, fields=PLAYER_PROPERTIES))
       return data['result']
 
+  # Turns a subtitle or audio stream from Player.GetProperties into a
+  # speakable string, e.g. "French External"
+  def SpeakableStream(self, stream):
+    speakable = ""
+    try:
+      # gets 3 character country code e.g. fre
+      lang = stream['language']
+      # looks up 3 character code in the dictionary e.g. fre|fra|fr|French|francais
+      streamlang = getisocode(lang)
+      # matches 3 character code with the lang name
+      speakable = getattr(streamlang, self.language)
+      # joins full language name with the name of the subtitle file e.g. French External
+      name = stream['name']
+      if name:
+        speakable += " " + name
+    except:
+      pass
+    return speakable
+
   # Returns current subtitles as a speakable string
   def GetCurrentSubtitles(self):
     subs = ""
-    country_dic = getisocodes_dict()
     curprops = self.GetActivePlayProperties()
     if curprops is not None:
-      try:
-        # gets 3 character country code e.g. fre
-        lang = curprops['currentsubtitle']['language']
-        # looks up 3 character code in the dictionary e.g. fre|fra|fr|French|francais
-        subslang = country_dic[lang]
-        # matches 3 character code with the lang name
-        subs = subslang[self.language]
-        # joins full language name with the name of the subtitle file e.g. French External
-        name = curprops['currentsubtitle']['name']
-        if name:
-          subs += " " + name
-      except:
-        pass
+      subs = self.SpeakableStream(curprops.get('currentsubtitle'))
     return subs
 
   # Returns current audio stream as a speakable string
   def GetCurrentAudioStream(self):
     stream = ""
-    country_dic = getisocodes_dict()
     curprops = self.GetActivePlayProperties()
     if curprops is not None:
-      try:
-        # gets 3 character country code e.g. fre
-        lang = curprops['currentaudiostream']['language']
-        # looks up 3 character code in the dictionary e.g. fre|fra|fr|French|francais
-        streamlang = country_dic[lang]
-        # matches 3 character code with the lang name
-        stream = streamlang[self.language]
-        # joins full language name with the name of the subtitle file e.g. French External
-        name = curprops['currentaudiostream']['name']
-        if name:
-          stream += " " + name
-      except:
-        pass
+      stream = self.SpeakableStream(curprops.get('currentaudiostream'))
     return stream
 
+  # Turns the timing properties from Player.GetProperties into the
+  # GetPlayerStatus() dict
+  def PlayerStatusFromProperties(self, props):
+    hours_total = props['totaltime']['hours']
+    hours_cur = props['time']['hours']
+    mins_total = hours_total * 60 + props['totaltime']['minutes']
+    mins_cur = hours_cur * 60 + props['time']['minutes']
+    speed = props['speed']
+    if hours_total > 0:
+      total = '%d:%02d:%02d' % (hours_total, props['totaltime']['minutes'], props['totaltime']['seconds'])
+      cur = '%d:%02d:%02d' % (props['time']['hours'], props['time']['minutes'], props['time']['seconds'])
+    else:
+      total = '%02d:%02d' % (props['totaltime']['minutes'], props['totaltime']['seconds'])
+      cur = '%02d:%02d' % (props['time']['minutes'], props['time']['seconds'])
+    return {'state': 'play' if speed > 0 else 'pause', 'time': cur, 'time_hours': hours_cur, 'time_mins': mins_cur, 'totaltime': total, 'total_hours': hours_total, 'total_mins': mins_total, 'pct': props['percentage']}
+
   # Returns information useful for building a progress bar to show an item's play time
   def GetPlayerStatus(self):
     playerid = self.GetVideoPlayerID()
     if playerid is None:
       playerid = self.GetAudioPlayerID()
     if playerid is not None:
-      data = self.SendCommand(RPCString("Player.GetProperties", {"playerid": playerid}, fields=["percentage", "speed", "time", "totaltime"]))
+      data = self.SendCommand(RPCString("Player.GetProperties", {"playerid": playerid}, fields=PLAYER_STATUS_PROPERTIES))
       if 'result' in data:
-        hours_total = data['result']['totaltime']['hours']
-        hours_cur = data['result']['time']['hours']
-        mins_total = hours_total * 60 + data['result']['totaltime']['minutes']
-        mins_cur = hours_cur * 60 + data['result']['time']['minutes']
-        speed = data['result']['speed']
-        if hours_total > 0:
-          total = '%d:%02d:%02d' % (hours_total, data['result']['totaltime']['minutes'], data['result']['totaltime']['seconds'])
-          cur = '%d:%02d:%02d' % (data['result']['time']['hours'], data['result']['time']['minutes'], data['result']['time']['seconds'])
-        else:
-          total = '%02d:%02d' % (data['result']['totaltime']['minutes'], data['result']['totaltime']['seconds'])
-          cur = '%02d:%02d' % (data['result']['time']['minutes'], data['result']['time']['seconds'])
-        return {'state': 'play' if speed > 0 else 'pause', 'time': cur, 'time_hours': hours_cur, 'time_mins': mins_cur, 'totaltime': total, 'total_hours': hours_total, 'total_mins': mins_total, 'pct': data['result']['percentage']}
+        return self.PlayerStatusFromProperties(data['result'])
     return {'state': 'stop'}
+
+  # Everything a "now playing" card needs, in one request:
+  #
+  #   {'playerid': 1, 'type': 'video',
+  #    'item': <Player.GetItem item>,
+  #    'properties': <Player.GetProperties result>,
+  #    'status': <as GetPlayerStatus()>,
+  #    'subtitles': <as GetCurrentSubtitles()>,
+  #    'audiostream': <as GetCurrentAudioStream()>}
+  #
+  # The video player is preferred over the audio player, like
+  # GetPlayerStatus().  When nothing is playing, status is {'state': 'stop'}
+  # and the rest is empty.
+  #
+  # If the active players aren't known already (see GetActivePlayers()),
+  # the item and properties are asked of each of Kodi's players in the same
+  # batch as Player.GetActivePlayers, and we keep the active one's.
+  def GetNowPlaying(self):
+    answer = {'playerid': None, 'type': None, 'item': None, 'properties': None, 'status': {'state': 'stop'}, 'subtitles': "", 'audiostream': ""}
+
+    players = None
+    if self.notifications and self.notifications.players is not None:
+      players = self.notifications.players
+    elif self.player_state_ttl:
+      players = get_player_snapshots().get(self.endpoint, self.player_state_ttl)
+
+    if players is None:
+      candidates = sorted(PLAYER_IDS.items(), key=lambda p: NOW_PLAYING_ORDER.index(p[0]))
+      commands = [RPCString("Player.GetActivePlayers")]
+    else:
+      candidates = [(p.get("type"), p.get("playerid")) for p in players if p.get("type") in NOW_PLAYING_ORDER]
+      candidates = sorted(candidates, key=lambda p: NOW_PLAYING_ORDER.index(p[0]))[:1]
+      commands = []
+    for playertype, playerid in candidates:
+      commands.append(RPCString("Player.GetItem", {"playerid": playerid}, fields=PLAYER_ITEM_FIELDS))
+      commands.append(RPCString("Player.GetProperties", {"playerid": playerid}, fields=PLAYER_PROPERTIES + PLAYER_STATUS_PROPERTIES))
+    if not candidates:
+      return answer
+
+    responses = self.SendBatch(commands)
+    if players is None:
+      players = responses.pop(0).get("result")
+      if players is None:
+        return answer
+      if self.player_state_ttl:
+        get_player_snapshots().put(self.endpoint, players)
+
+    active = [(p.get("type"), p.get("playerid")) for p in players]
+    for idx, (playertype, playerid) in enumerate(candidates):
+      if (playertype, playerid) not in active:
+        continue
+      item = responses[idx * 2].get('result', {}).get('item')
+      props = responses[idx * 2 + 1].get('result')
+      if item is None or props is None:
+        continue
+      answer['playerid'] = playerid
+      answer['type'] = playertype
+      answer['item'] = item
+      answer['properties'] = props
+      if playertype != 'picture':
+        answer['status'] = self.PlayerStatusFromProperties(props)
+      answer['subtitles'] = self.SpeakableStream(props.get('currentsubtitle'))
+      answer['audiostream'] = self.SpeakableStream(props.get('currentaudiostream'))
+      break
+
+    return answer
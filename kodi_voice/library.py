@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+import json
+import logging
+import re
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+# Libraries we mirror:
+#   mediatype: (JSON-RPC method, params, id field, field to match on, properties)
+#
+# The mediatype doubles as the key Kodi returns the items under.
+MIRROR_MEDIATYPES = {
+  'movies': ('VideoLibrary.GetMovies', None, 'movieid', 'label', ['dateadded']),
+  'tvshows': ('VideoLibrary.GetTVShows', None, 'tvshowid', 'label', ['dateadded']),
+  'episodes': ('VideoLibrary.GetEpisodes', None, 'episodeid', 'label', ['tvshowid', 'dateadded']),
+  'musicvideos': ('VideoLibrary.GetMusicVideos', None, 'musicvideoid', 'label', ['artist', 'dateadded']),
+  'artists': ('AudioLibrary.GetArtists', {"albumartistsonly": False}, 'artistid', 'artist', []),
+  'albums': ('AudioLibrary.GetAlbums', None, 'albumid', 'label', ['dateadded']),
+  'songs': ('AudioLibrary.GetSongs', None, 'songid', 'label', ['dateadded']),
+}
+
+VIDEO_MEDIATYPES = ['movies', 'tvshows', 'episodes', 'musicvideos']
+AUDIO_MEDIATYPES = ['artists', 'albums', 'songs']
+
+# Items fetched from Kodi per request while syncing.
+SYNC_PAGE_SIZE = 5000
+
+# Items fetched in the first request of an incremental sync.  Later pages
+# grow up to SYNC_PAGE_SIZE if that wasn't enough to reach the known items.
+DELTA_PAGE_SIZE = 50
+
+SORT_DATEADDED = {"method": "dateadded", "order": "descending"}
+
+# Candidates returned by a search, for the fuzzy matcher to rerank.
+SEARCH_CANDIDATES = 200
+
+SCHEMA = [
+  '''CREATE TABLE IF NOT EXISTS items (
+       mediatype TEXT NOT NULL,
+       itemid INTEGER NOT NULL,
+       label TEXT NOT NULL,
+       dateadded TEXT,
+       data TEXT NOT NULL,
+       PRIMARY KEY (mediatype, itemid))''',
+  '''CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+       label, mediatype UNINDEXED,
+       tokenize='unicode61 remove_diacritics 1')''',
+  '''CREATE TABLE IF NOT EXISTS sync_state (
+       mediatype TEXT PRIMARY KEY,
+       synced_at REAL NOT NULL,
+       total INTEGER NOT NULL)''',
+]
+
+
+# Build an FTS5 query matching any word of any of the given phrases.
+def fts_query(phrases):
+  tokens = []
+  for phrase in phrases:
+    for token in re.findall(r'\w+', phrase.lower(), re.UNICODE):
+      if token not in tokens:
+        tokens.append(token)
+  return ' OR '.join('"%s"' % t.replace('"', '""') for t in tokens)
+
+
+class KodiLibraryMirror():
+  # A local SQLite copy of the Kodi libraries with a full-text index over
+  # the labels.  Searches return a small candidate set for matchHeard() to
+  # rerank instead of the whole library.
+  #
+  # A mediatype is only searched once it has been synced; until then (or
+  # after invalidate()) callers should fall back to asking Kodi.
+  #
+  # Once closed, the mirror acts as if nothing had been synced, so a request
+  # still using it when it is closed from another thread falls back the
+  # same way.  enabled is only checked under the lock for that reason.
+  def __init__(self, path):
+    self.path = path
+    self.enabled = False
+    self.lock = threading.Lock()
+
+    log.info('Opening library mirror %s', path)
+    import sqlite3
+    try:
+      self.db = sqlite3.connect(path, check_same_thread=False)
+      with self.db:
+        for statement in SCHEMA:
+          self.db.execute(statement)
+    except sqlite3.Error as e:
+      log.error('Unable to open library mirror %s: %s', path, repr(e))
+    else:
+      self.enabled = True
+
+  def close(self):
+    with self.lock:
+      if self.enabled:
+        self.db.close()
+        self.enabled = False
+
+  def is_synced(self, mediatype):
+    with self.lock:
+      if not self.enabled:
+        return False
+      row = self.db.execute('SELECT 1 FROM sync_state WHERE mediatype = ?', (mediatype,)).fetchone()
+    return row is not None
+
+  # When each of mediatypes was last synced (None if it hasn't been), as a
+  # cheap way to tell whether the library has changed.
+  def fingerprint(self, mediatypes):
+    with self.lock:
+      if not self.enabled:
+        return None
+      synced = dict(self.db.execute('SELECT mediatype, synced_at FROM sync_state').fetchall())
+    return tuple(synced.get(mediatype) for mediatype in mediatypes)
+
+  # Forget that mediatypes have been synced, e.g. when Kodi is told to scan or
+  # clean its library.  The items stay until the next sync replaces them.
+  def invalidate(self, mediatypes=None):
+    if mediatypes is None:
+      mediatypes = MIRROR_MEDIATYPES.keys()
+    with self.lock:
+      if not self.enabled:
+        return
+      with self.db:
+        for mediatype in mediatypes:
+          self.db.execute('DELETE FROM sync_state WHERE mediatype = ?', (mediatype,))
+
+  # Fetch every item of mediatype from Kodi, SYNC_PAGE_SIZE at a time.  Pass
+  # fields=[] to fetch just ids and labels.
+  def fetch(self, kodi, mediatype, sort=None, filters=None, fields=None):
+    from .kodi import RPCString
+
+    method, params, idfield, lookingFor, default_fields = MIRROR_MEDIATYPES[mediatype]
+    if fields is None:
+      fields = default_fields
+    items = []
+    start = 0
+    while True:
+      data = kodi.SendCommand(RPCString(method, dict(params) if params else None, sort=sort, filters=filters, fields=fields or None, limits=(start, start + SYNC_PAGE_SIZE)))
+      page = data.get('result', {}).get(mediatype, [])
+      items += page
+      total = data.get('result', {}).get('limits', {}).get('total', 0)
+      start += SYNC_PAGE_SIZE
+      if len(page) < SYNC_PAGE_SIZE or start >= total:
+        break
+    return items
+
+  def _insert(self, mediatype, items):
+    method, params, idfield, lookingFor, fields = MIRROR_MEDIATYPES[mediatype]
+    for item in items:
+      cur = self.db.execute('INSERT INTO items (mediatype, itemid, label, dateadded, data) VALUES (?, ?, ?, ?, ?)',
+                            (mediatype, item[idfield], item[lookingFor], item.get('dateadded'), json.dumps(item)))
+      self.db.execute('INSERT INTO items_fts (rowid, label, mediatype) VALUES (?, ?, ?)',
+                      (cur.lastrowid, item[lookingFor], mediatype))
+
+  def _delete(self, mediatype, itemids=None):
+    if itemids is None:
+      self.db.execute('DELETE FROM items_fts WHERE rowid IN (SELECT rowid FROM items WHERE mediatype = ?)', (mediatype,))
+      self.db.execute('DELETE FROM items WHERE mediatype = ?', (mediatype,))
+    else:
+      for itemid in itemids:
+        self.db.execute('DELETE FROM items_fts WHERE rowid IN (SELECT rowid FROM items WHERE mediatype = ? AND itemid = ?)', (mediatype, itemid))
+        self.db.execute('DELETE FROM items WHERE mediatype = ? AND itemid = ?', (mediatype, itemid))
+
+  def _mark_synced(self, mediatype):
+    total = self.db.execute('SELECT COUNT(*) FROM items WHERE mediatype = ?', (mediatype,)).fetchone()[0]
+    self.db.execute('INSERT OR REPLACE INTO sync_state (mediatype, synced_at, total) VALUES (?, ?, ?)',
+                    (mediatype, time.time(), total))
+    return total
+
+  # Bring the mirrored copy of each of mediatypes (all of them by default) up
+  # to date with Kodi.  Returns {mediatype: item count}.
+  #
+  # With incremental, a mediatype that has been mirrored before is patched in
+  # place (see sync_delta()) instead of being fetched in full.
+  def sync(self, kodi, mediatypes=None, incremental=True):
+    counts = {}
+    if not self.enabled:
+      return counts
+    if mediatypes is None:
+      mediatypes = VIDEO_MEDIATYPES + AUDIO_MEDIATYPES
+
+    for mediatype in mediatypes:
+      if incremental and self.count(mediatype):
+        counts[mediatype] = self.sync_delta(kodi, mediatype)
+      else:
+        counts[mediatype] = self.sync_full(kodi, mediatype)
+
+    return counts
+
+  def count(self, mediatype):
+    with self.lock:
+      if not self.enabled:
+        return 0
+      return self.db.execute('SELECT COUNT(*) FROM items WHERE mediatype = ?', (mediatype,)).fetchone()[0]
+
+  # Replace the mirrored copy of mediatype with a fresh one from Kodi.
+  def sync_full(self, kodi, mediatype):
+    log.info('Syncing %s into library mirror', mediatype)
+    items = self.fetch(kodi, mediatype)
+    with self.lock:
+      if not self.enabled:
+        return 0
+      with self.db:
+        self._delete(mediatype)
+        self._insert(mediatype, items)
+        total = self._mark_synced(mediatype)
+    log.info('Mirrored %d %s', total, mediatype)
+    return total
+
+  # Patch the mirrored copy of mediatype with what changed in Kodi since the
+  # last sync:
+  #
+  #  - Items added since the newest one we have are fetched newest first,
+  #    starting with a small page, until we reach ones we already know.
+  #  - If Kodi's item count then differs from ours, items were removed (or
+  #    added out of order), so we compare id sets.  Removals are deleted;
+  #    anything else we can't account for triggers a full sync.
+  #
+  # Libraries without dateadded (artists) skip straight to the count check.
+  #
+  # Changes to existing items (renames) aren't picked up; an occasional sync
+  # with incremental=False takes care of those.
+  def sync_delta(self, kodi, mediatype):
+    from .kodi import RPCString
+
+    method, params, idfield, lookingFor, fields = MIRROR_MEDIATYPES[mediatype]
+    log.info('Updating %s in library mirror', mediatype)
+
+    with self.lock:
+      if not self.enabled:
+        return 0
+      newest = self.db.execute('SELECT MAX(dateadded) FROM items WHERE mediatype = ?', (mediatype,)).fetchone()[0]
+
+    added = []
+    remote_total = None
+    start = 0
+    page_size = DELTA_PAGE_SIZE
+    while True:
+      if 'dateadded' in fields and newest:
+        limits = (start, start + page_size)
+        data = kodi.SendCommand(RPCString(method, dict(params) if params else None, sort=SORT_DATEADDED, fields=fields, limits=limits))
+        page = data.get('result', {}).get(mediatype, [])
+      else:
+        # just ask for the count
+        data = kodi.SendCommand(RPCString(method, dict(params) if params else None, limits=(0, 1)))
+        page = []
+      remote_total = data.get('result', {}).get('limits', {}).get('total', 0)
+
+      # >= rather than >, since items added in the same second as the
+      # newest one we have may not have made it into the last sync.
+      fresh = [item for item in page if item.get('dateadded') and item['dateadded'] >= newest]
+      added += fresh
+      if len(fresh) < len(page) or len(page) < page_size:
+        break
+      start += page_size
+      page_size = min(page_size * 4, SYNC_PAGE_SIZE)
+
+    with self.lock:
+      if not self.enabled:
+        return 0
+      with self.db:
+        self._delete(mediatype, [item[idfield] for item in added])
+        self._insert(mediatype, added)
+      local_total = self.db.execute('SELECT COUNT(*) FROM items WHERE mediatype = ?', (mediatype,)).fetchone()[0]
+
+    if local_total != remote_total:
+      log.info('Have %d %s, Kodi has %d; comparing ids', local_total, mediatype, remote_total)
+      remote_ids = set(item[idfield] for item in self.fetch(kodi, mediatype, fields=[]))
+      with self.lock:
+        if not self.enabled:
+          return 0
+        local_ids = set(row[0] for row in self.db.execute('SELECT itemid FROM items WHERE mediatype = ?', (mediatype,)))
+      if remote_ids - local_ids:
+        log.info('%d %s missing from the delta', len(remote_ids - local_ids), mediatype)
+        return self.sync_full(kodi, mediatype)
+      with self.lock:
+        if not self.enabled:
+          return 0
+        with self.db:
+          self._delete(mediatype, local_ids - remote_ids)
+      log.info('Removed %d %s', len(local_ids - remote_ids), mediatype)
+
+    with self.lock:
+      if not self.enabled:
+        return 0
+      with self.db:
+        total = self._mark_synced(mediatype)
+    log.info('Added %d %s, now mirroring %d', len(added), mediatype, total)
+    return total
+
+  # Full-text search for items of mediatype matching any word of phrases.
+  # Returns up to `limit` items, best first, shaped like Kodi's own results.
+  def search(self, mediatype, phrases, limit=SEARCH_CANDIDATES):
+    query = fts_query(phrases)
+    if not query:
+      return []
+    with self.lock:
+      if not self.enabled:
+        return []
+      rows = self.db.execute('''SELECT items.data FROM items_fts
+                                JOIN items ON items.rowid = items_fts.rowid
+                                WHERE items_fts MATCH ? AND items_fts.mediatype = ?
+                                ORDER BY rank LIMIT ?''', (query, mediatype, limit)).fetchall()
+    return [json.loads(row[0]) for row in rows]
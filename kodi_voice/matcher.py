@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+import logging
+import threading
+
+
+log = logging.getLogger(__name__)
+
+# Minimum fuzzywuzzy score for a label to be considered a match at all.
+FUZZY_SCORE_CUTOFF = 75
+
+# Below this many labels, the cost of shipping work to the pool outweighs the
+# gain and we always match in-process.
+PARALLEL_MATCH_MIN_ITEMS = 10000
+
+# Number of distinct label sets (libraries) each worker keeps loaded.  A skill
+# typically alternates between a handful of them (songs, albums, movies...).
+WORKER_LABEL_SETS = 4
+
+
+# Score every match string against a {index: label} dict and return a list
+# of (label, score, index) tuples, best first.  Ties are broken on index so
+# results are the same no matter how the labels were sharded.
+def _extract(match_strings, choices, limit, score_cutoff):
+  from fuzzywuzzy import fuzz, process
+
+  best = {}
+  for ms in match_strings:
+    for label, score, idx in process.extractBests(ms, choices, limit=limit, scorer=fuzz.UQRatio, score_cutoff=score_cutoff):
+      if idx not in best or best[idx][1] < score:
+        best[idx] = (label, score, idx)
+  return sorted(best.values(), key=lambda x: (-x[1], x[2]))[:limit]
+
+
+# Fuzzy match in the current process.
+def fuzzy_extract(match_strings, labels, limit=10, score_cutoff=FUZZY_SCORE_CUTOFF):
+  return _extract(match_strings, dict(enumerate(labels)), limit, score_cutoff)
+
+
+# Worker loop.  Each worker holds its shard of each recently used label set,
+# so a request only has to send the (small) match strings once a label set
+# has been loaded.
+#
+# Messages are tuples:
+#   ('load', key, offset, labels)
+#   ('match', key, match_strings, limit, score_cutoff) -> [(label, score, index), ...]
+#                                                        or None if key isn't loaded
+#   None to exit
+#
+# Loading and matching both count as a use of the label set for the LRU,
+# the same way ParallelMatcher tracks it.
+def _worker(conn):
+  label_sets = {}
+  lru = []
+
+  def use(key):
+    if key in lru:
+      lru.remove(key)
+    lru.append(key)
+    while len(lru) > WORKER_LABEL_SETS:
+      del label_sets[lru.pop(0)]
+
+  while True:
+    try:
+      msg = conn.recv()
+    except EOFError:
+      break
+    if msg is None:
+      break
+
+    if msg[0] == 'load':
+      key, offset, labels = msg[1:]
+      label_sets[key] = dict((offset + i, label) for i, label in enumerate(labels))
+      use(key)
+    elif msg[0] == 'match':
+      key, match_strings, limit, score_cutoff = msg[1:]
+      if key not in label_sets:
+        conn.send(None)
+        continue
+      use(key)
+      conn.send(_extract(match_strings, label_sets[key], limit, score_cutoff))
+  conn.close()
+
+
+class ParallelMatcher():
+  # Shards label lists across a fixed set of worker processes.  The workers
+  # are started once and reused across requests; a given label set is only
+  # sent to them the first time it is seen.
+  #
+  # Requests from multiple threads are serialized.
+  def __init__(self, processes):
+    self.processes = processes
+    self.workers = []
+    self.lock = threading.Lock()
+
+    import multiprocessing
+
+    log.info('Starting %d match workers', processes)
+    for i in range(processes):
+      parent_conn, child_conn = multiprocessing.Pipe()
+      p = multiprocessing.Process(target=_worker, args=(child_conn,))
+      p.daemon = True
+      p.start()
+      child_conn.close()
+      # (process, connection, keys of label sets loaded in the worker)
+      self.workers.append((p, parent_conn, []))
+
+  def close(self):
+    with self.lock:
+      for p, conn, loaded in self.workers:
+        try:
+          conn.send(None)
+          conn.close()
+        except (IOError, OSError):
+          pass
+        p.join(1)
+      self.workers = []
+
+  # Identifies a label set by content, since cached library responses are
+  # decoded into fresh lists on every request.  Hashing the labels as a
+  # tuple runs in C and is a fraction of the cost of matching them.
+  @staticmethod
+  def label_set_key(labels):
+    return (len(labels), hash(tuple(labels)))
+
+  def extract(self, match_strings, labels, limit=10, score_cutoff=FUZZY_SCORE_CUTOFF):
+    match_strings = list(match_strings)
+    key = self.label_set_key(labels)
+
+    with self.lock:
+      shard_size = -(-len(labels) // len(self.workers))
+
+      def load(i, conn, loaded):
+        log.debug('Loading label set %s into worker %d', key, i)
+        conn.send(('load', key, i * shard_size, labels[i * shard_size:(i + 1) * shard_size]))
+        if key in loaded:
+          loaded.remove(key)
+        loaded.append(key)
+        while len(loaded) > WORKER_LABEL_SETS:
+          loaded.pop(0)
+
+      for i, (p, conn, loaded) in enumerate(self.workers):
+        if key not in loaded:
+          load(i, conn, loaded)
+        else:
+          # keep the parent's view of the worker LRU in step
+          loaded.remove(key)
+          loaded.append(key)
+        conn.send(('match', key, match_strings, limit, score_cutoff))
+
+      matches = []
+      for i, (p, conn, loaded) in enumerate(self.workers):
+        result = conn.recv()
+        if result is None:
+          # the worker dropped it after all; load it again rather than fail
+          log.warning('Worker %d lost label set %s, reloading', i, key)
+          load(i, conn, loaded)
+          conn.send(('match', key, match_strings, limit, score_cutoff))
+          result = conn.recv()
+        matches += result
+
+    return sorted(matches, key=lambda x: (-x[1], x[2]))[:limit]
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+# Return the process-wide ParallelMatcher, starting it on first use.
+def get_parallel_matcher(processes):
+  global _matcher
+  with _matcher_lock:
+    if _matcher is None or _matcher.processes != processes:
+      if _matcher is not None:
+        _matcher.close()
+      _matcher = ParallelMatcher(processes)
+    return _matcher
+
+
+# Tear down the process-wide ParallelMatcher, e.g. after a worker has died.
+# The next call to get_parallel_matcher() starts a fresh one.
+def reset_parallel_matcher():
+  global _matcher
+  with _matcher_lock:
+    if _matcher is not None:
+      _matcher.close()
+      _matcher = None
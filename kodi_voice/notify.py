@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+
+import codecs
+import json
+import logging
+import socket
+import threading
+from .library import VIDEO_MEDIATYPES, AUDIO_MEDIATYPES
+
+
+log = logging.getLogger(__name__)
+
+# Kodi's JSON-RPC TCP port
+NOTIFICATION_PORT = 9090
+
+# Seconds to wait before reconnecting after the connection drops.  Doubles on
+# each failed attempt, up to RECONNECT_MAX.
+RECONNECT_MIN = 1
+RECONNECT_MAX = 60
+
+CONNECT_TIMEOUT = 10
+
+# Library notifications and the mediatypes they affect, by namespace.
+LIBRARY_NAMESPACES = {
+  'VideoLibrary': VIDEO_MEDIATYPES,
+  'AudioLibrary': AUDIO_MEDIATYPES,
+}
+
+# Player notifications after which we ask Kodi again for the active players.
+PLAYER_EVENTS = ['Player.OnPlay', 'Player.OnAVStart', 'Player.OnStop']
+
+
+class KodiNotificationListener():
+  # Keeps a connection open to Kodi's JSON-RPC TCP interface and follows the
+  # notifications it pushes:
+  #
+  #  - players and volume/muted mirror Kodi's active players and volume, so
+  #    they can be answered without a request.  Either is None while unknown
+  #    (not connected, or a change is being looked up).
+  #  - Library changes are passed to the callbacks registered with
+  #    subscribe(), as a list of the affected mediatypes.  Item updates that
+  #    happen during a scan or clean are folded into the single call made
+  #    when it finishes.
+  #
+  # Callbacks run one at a time on a thread of their own, so a slow one
+  # (clearing a remote cache) doesn't hold up the notifications behind it.
+  #
+  # The connection is retried with exponential backoff when it drops.
+  def __init__(self, address, port=NOTIFICATION_PORT):
+    self.address = address
+    self.port = port
+    self.connected = False
+    self.players = None
+    self.volume = None
+    self.muted = None
+    self.callbacks = {}
+    self.playback_callbacks = {}
+    self.lock = threading.Lock()
+    self.send_lock = threading.Lock()
+    self.sock = None
+    self.scanning = set()
+    self.stopped = threading.Event()
+    import Queue
+    self.calls = Queue.Queue()
+
+    self.dispatcher = threading.Thread(target=self._dispatch, name='kodi-notify-callbacks-%s:%s' % (address, port))
+    self.dispatcher.daemon = True
+    self.dispatcher.start()
+
+    self.thread = threading.Thread(target=self._run, name='kodi-notify-%s:%s' % (address, port))
+    self.thread.daemon = True
+    self.thread.start()
+
+  # Call callback(mediatypes) whenever the libraries change.  Registering
+  # again under the same key replaces the previous callback, so short-lived
+  # callers can subscribe every time without piling up.
+  def subscribe(self, key, callback):
+    with self.lock:
+      self.callbacks[key] = callback
+
+  # Drop the callbacks registered under key; with callback, only if that is
+  # still what's registered.
+  def unsubscribe(self, key, callback=None):
+    with self.lock:
+      for callbacks in (self.callbacks, self.playback_callbacks):
+        if callback is None or callbacks.get(key) == callback:
+          callbacks.pop(key, None)
+
+  # Call callback() whenever playback stops.  Keys work as with subscribe().
+  def subscribe_playback(self, key, callback):
+    with self.lock:
+      self.playback_callbacks[key] = callback
+
+  def close(self):
+    self.stopped.set()
+    sock = self.sock
+    if sock:
+      try:
+        sock.shutdown(socket.SHUT_RDWR)
+      except (socket.error, IOError):
+        pass
+    self.thread.join(1)
+    self.calls.put(None)
+    self.dispatcher.join(1)
+
+  # Stop trusting what we know about the active players until Kodi tells us
+  # again, e.g. right after asking it to open or stop one.
+  def forget_players(self):
+    self.players = None
+    self._send("Player.GetActivePlayers", request_id="players")
+
+  def _send(self, method, params=None, request_id=None):
+    j = {"jsonrpc": "2.0", "method": method, "params": params or {}}
+    if request_id:
+      j["id"] = request_id
+    sock = self.sock
+    if sock and self.connected:
+      try:
+        # request threads and the listener thread both send
+        with self.send_lock:
+          sock.sendall(json.dumps(j).encode('utf-8'))
+      except (socket.error, IOError) as e:
+        log.debug('Unable to send %s: %s', method, repr(e))
+
+  def _run(self):
+    delay = RECONNECT_MIN
+    while not self.stopped.is_set():
+      try:
+        self.sock = socket.create_connection((self.address, self.port), CONNECT_TIMEOUT)
+        self.sock.settimeout(None)
+        log.info('Listening for notifications from %s:%s', self.address, self.port)
+        self.connected = True
+        delay = RECONNECT_MIN
+        self._listen()
+      except (socket.error, IOError, ValueError) as e:
+        log.info('Notification connection to %s:%s failed: %s', self.address, self.port, repr(e))
+      finally:
+        self._disconnect()
+
+      if self.stopped.wait(delay):
+        break
+      delay = min(delay * 2, RECONNECT_MAX)
+
+  def _disconnect(self):
+    was_connected = self.connected
+    self.connected = False
+    self.players = None
+    self.volume = None
+    self.muted = None
+    self.scanning.clear()
+    if self.sock:
+      try:
+        self.sock.close()
+      except (socket.error, IOError):
+        pass
+      self.sock = None
+    if was_connected and not self.stopped.is_set():
+      # we may have missed changes while disconnected
+      self._library_changed(VIDEO_MEDIATYPES + AUDIO_MEDIATYPES)
+
+  # Kodi sends a stream of JSON objects with nothing in between, so decode
+  # them off the front of a buffer as they complete.
+  def _listen(self):
+    self._send("Player.GetActivePlayers", request_id="players")
+    self._send("Application.GetProperties", {"properties": ["volume", "muted"]}, request_id="volume")
+
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buf = u''
+    while not self.stopped.is_set():
+      data = self.sock.recv(65536)
+      if not data:
+        raise IOError('connection closed by Kodi')
+      buf += utf8.decode(data)
+      while True:
+        buf = buf.lstrip()
+        if not buf:
+          break
+        try:
+          msg, end = decoder.raw_decode(buf)
+        except ValueError:
+          # incomplete; wait for more
+          break
+        buf = buf[end:]
+        self._handle(msg)
+
+  def _handle(self, msg):
+    if not isinstance(msg, dict):
+      return
+    if 'id' in msg:
+      result = msg.get('result')
+      if msg['id'] == 'players' and isinstance(result, list):
+        self.players = result
+      elif msg['id'] == 'volume' and isinstance(result, dict):
+        self.volume = result.get('volume')
+        self.muted = result.get('muted')
+      return
+
+    method = msg.get('method', '')
+    data = msg.get('params', {}).get('data') or {}
+    log.debug('Notification %s', method)
+
+    if method in PLAYER_EVENTS:
+      self.forget_players()
+      if method == 'Player.OnStop':
+        self._playback_stopped()
+    elif method == 'Application.OnVolumeChanged':
+      self.volume = data.get('volume', self.volume)
+      self.muted = data.get('muted', self.muted)
+    else:
+      namespace, sep, event = method.partition('.')
+      if namespace not in LIBRARY_NAMESPACES:
+        return
+      if event in ('OnScanStarted', 'OnCleanStarted'):
+        self.scanning.add(namespace)
+      elif event in ('OnScanFinished', 'OnCleanFinished'):
+        self.scanning.discard(namespace)
+        self._library_changed(LIBRARY_NAMESPACES[namespace])
+      elif namespace in self.scanning:
+        pass
+      elif event == 'OnRemove' or (event == 'OnUpdate' and data.get('added')):
+        self._library_changed(LIBRARY_NAMESPACES[namespace])
+
+  def _playback_stopped(self):
+    with self.lock:
+      callbacks = list(self.playback_callbacks.values())
+    for callback in callbacks:
+      self.calls.put((callback, ()))
+
+  def _library_changed(self, mediatypes):
+    with self.lock:
+      callbacks = list(self.callbacks.values())
+    for callback in callbacks:
+      self.calls.put((callback, (mediatypes,)))
+
+  def _dispatch(self):
+    while True:
+      call = self.calls.get()
+      if call is None:
+        break
+      callback, args = call
+      try:
+        callback(*args)
+      except Exception as e:
+        log.error('Notification callback failed: %s', repr(e))
+
+
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+# Return the process-wide listener for a Kodi host, starting it on first use.
+def get_notification_listener(address, port=NOTIFICATION_PORT):
+  with _listeners_lock:
+    key = (address, int(port))
+    if key not in _listeners:
+      _listeners[key] = KodiNotificationListener(address, int(port))
+    return _listeners[key]
+
+
+# Stop every listener, e.g. on shutdown.
+def close_notification_listeners():
+  with _listeners_lock:
+    for listener in _listeners.values():
+      listener.close()
+    _listeners.clear()
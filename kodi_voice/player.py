@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+import re
+import threading
+import time
+
+
+# Commands that change which players are active.  Sending one of these drops
+# the snapshot for that Kodi.
+PLAYER_CHANGING_RE = re.compile(r'"method":\s*"Player\.(Open|Stop)"')
+
+
+class PlayerSnapshots():
+  # The active players (as returned by Player.GetActivePlayers) of each Kodi
+  # endpoint, shared by every Kodi instance in the process.  Transport
+  # commands arriving in quick succession ("skip", "skip", "volume up") can
+  # then find their player without asking Kodi each time.
+  #
+  # Also remembers how far one of Kodi's volume increments moves the volume
+  # on each endpoint, which is a Kodi setting.
+  def __init__(self):
+    self.snapshots = {}
+    self.volume_increments = {}
+    self.lock = threading.Lock()
+
+  # Return the active players of endpoint if we looked them up less than
+  # ttl seconds ago, otherwise None.
+  def get(self, endpoint, ttl):
+    with self.lock:
+      snapshot = self.snapshots.get(endpoint)
+    if snapshot is None:
+      return None
+    taken_at, players = snapshot
+    if time.time() - taken_at > ttl:
+      return None
+    return players
+
+  def put(self, endpoint, players):
+    with self.lock:
+      self.snapshots[endpoint] = (time.time(), players)
+
+  def invalidate(self, endpoint):
+    with self.lock:
+      self.snapshots.pop(endpoint, None)
+
+  # Return the volume change of one increment on endpoint, or default if we
+  # haven't seen one yet.
+  def get_volume_increment(self, endpoint, default):
+    with self.lock:
+      return self.volume_increments.get(endpoint, default)
+
+  def put_volume_increment(self, endpoint, increment):
+    with self.lock:
+      self.volume_increments[endpoint] = increment
+
+
+_snapshots = PlayerSnapshots()
+
+
+# Return the process-wide PlayerSnapshots.
+def get_player_snapshots():
+  return _snapshots
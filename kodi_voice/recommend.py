@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+import logging
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class RecommendationPoolStore():
+  # Recommendation candidates, kept in memory and shared by every Kodi
+  # instance in the process so that repeated "what should I watch" requests
+  # can be answered without asking Kodi.
+  #
+  # Pools are keyed on (Kodi endpoint, mediatype, genre).  A pool is dropped
+  # when it is older than the ttl the caller asks for, or when the library
+  # fingerprint it was computed against no longer matches.
+  def __init__(self):
+    self.pools = {}
+    self.lock = threading.Lock()
+
+  # Return the pool stored under key, or None if there is none that is both
+  # younger than ttl seconds and computed against fingerprint.
+  def get(self, key, ttl, fingerprint=None):
+    with self.lock:
+      entry = self.pools.get(key)
+    if entry is None:
+      return None
+    stored_at, stored_fingerprint, pool = entry
+    if time.time() - stored_at > ttl:
+      log.debug('Recommendation pool %s expired', key)
+      return None
+    if stored_fingerprint != fingerprint:
+      log.debug('Library changed, recommendation pool %s is stale', key)
+      return None
+    return pool
+
+  def put(self, key, pool, fingerprint=None):
+    with self.lock:
+      self.pools[key] = (time.time(), fingerprint, pool)
+
+  # Drop the pools for endpoint, optionally only those for mediatypes.
+  def invalidate(self, endpoint, mediatypes=None):
+    with self.lock:
+      for key in list(self.pools):
+        if key[0] == endpoint and (mediatypes is None or key[1] in mediatypes):
+          del self.pools[key]
+
+
+_store = RecommendationPoolStore()
+
+
+# Return the process-wide RecommendationPoolStore.
+def get_recommendation_store():
+  return _store
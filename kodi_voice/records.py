@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+import collections
+import datetime
+
+
+DATEADDED_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_dateadded(value):
+  if isinstance(value, basestring):
+    return datetime.datetime.strptime(value, DATEADDED_FORMAT) if value else None
+  return value
+
+
+class Record(object):
+  # A compact library item.  Each record type lists its FIELDS and keeps
+  # them in __slots__, which takes a fraction of the memory of the dict Kodi
+  # returns for it.
+  #
+  # Records read like the dicts they replace (item['label'], item.get(...),
+  # 'art' in item, dict(item), ==) and are registered as a Mapping.  Fields
+  # can also be read as attributes (movie.label).  A field that was never
+  # set is simply absent.
+  #
+  # Like the dicts they replace, whose dateadded was a datetime, they need
+  # json.dumps(..., default=json_default).
+  __slots__ = ()
+  FIELDS = ()
+
+  def __init__(self, *args, **kwargs):
+    for key, value in dict(*args, **kwargs).items():
+      self[key] = value
+
+  def __getitem__(self, key):
+    if key not in self.FIELDS:
+      raise KeyError(key)
+    try:
+      return getattr(self, key)
+    except AttributeError:
+      raise KeyError(key)
+
+  def __setitem__(self, key, value):
+    if key not in self.FIELDS:
+      raise KeyError(key)
+    setattr(self, key, value)
+
+  def __delitem__(self, key):
+    if key not in self:
+      raise KeyError(key)
+    delattr(self, key)
+
+  def __contains__(self, key):
+    return key in self.FIELDS and hasattr(self, key)
+
+  has_key = __contains__
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def __len__(self):
+    return len(self.keys())
+
+  def __eq__(self, other):
+    if isinstance(other, (Record, dict)):
+      return self.to_dict() == dict(other.items())
+    return NotImplemented
+
+  def __ne__(self, other):
+    equal = self.__eq__(other)
+    return equal if equal is NotImplemented else not equal
+
+  __hash__ = None
+
+  def __repr__(self):
+    return '%s(%s)' % (self.__class__.__name__, ', '.join('%s=%r' % (k, self[k]) for k in self.keys()))
+
+  def get(self, key, default=None):
+    try:
+      return self[key]
+    except KeyError:
+      return default
+
+  def pop(self, key, *default):
+    try:
+      value = self[key]
+    except KeyError:
+      if default:
+        return default[0]
+      raise
+    delattr(self, key)
+    return value
+
+  def keys(self):
+    return [key for key in self.FIELDS if hasattr(self, key)]
+
+  def values(self):
+    return [self[key] for key in self.keys()]
+
+  def items(self):
+    return [(key, self[key]) for key in self.keys()]
+
+  def iterkeys(self):
+    return iter(self.keys())
+
+  def itervalues(self):
+    return iter(self.values())
+
+  def iteritems(self):
+    return iter(self.items())
+
+  def copy(self):
+    return self.__class__(self.items())
+
+  def to_dict(self):
+    return dict(self.items())
+
+collections.Mapping.register(Record)
+
+
+class DatedRecord(Record):
+  # A record with a dateadded field.  dateadded is kept as Kodi sends it and
+  # only turned into a datetime the first time it is read.
+  __slots__ = ('_dateadded',)
+
+  @property
+  def dateadded(self):
+    value = self._dateadded
+    if isinstance(value, basestring):
+      value = parse_dateadded(value)
+      self._dateadded = value
+    return value
+
+  @dateadded.setter
+  def dateadded(self, value):
+    self._dateadded = value
+
+  @dateadded.deleter
+  def dateadded(self):
+    del self._dateadded
+
+
+class Movie(DatedRecord):
+  __slots__ = ('movieid', 'label', 'title')
+  FIELDS = ('movieid', 'label', 'title', 'dateadded')
+
+
+class Show(DatedRecord):
+  __slots__ = ('tvshowid', 'label', 'title')
+  FIELDS = ('tvshowid', 'label', 'title', 'dateadded')
+
+
+class Episode(DatedRecord):
+  __slots__ = ('episodeid', 'label', 'title', 'show', 'art')
+  FIELDS = ('episodeid', 'label', 'title', 'show', 'dateadded', 'art')
+
+
+class MusicVideo(DatedRecord):
+  __slots__ = ('musicvideoid', 'label', 'title', 'artist')
+  FIELDS = ('musicvideoid', 'label', 'title', 'artist', 'dateadded')
+
+
+class Artist(Record):
+  __slots__ = ('artistid', 'label', 'artist')
+  FIELDS = ('artistid', 'label', 'artist')
+
+
+class Album(DatedRecord):
+  __slots__ = ('albumid', 'label', 'title', 'artist')
+  FIELDS = ('albumid', 'label', 'title', 'artist', 'dateadded')
+
+
+class Song(DatedRecord):
+  __slots__ = ('songid', 'label', 'title', 'artist')
+  FIELDS = ('songid', 'label', 'title', 'artist', 'dateadded')
+
+
+# Record type for each mediatype, keyed like Kodi's results.
+RECORD_TYPES = {
+  'movies': Movie,
+  'tvshows': Show,
+  'episodes': Episode,
+  'musicvideos': MusicVideo,
+  'artists': Artist,
+  'albums': Album,
+  'songs': Song,
+}
+
+
+# Build a record of mediatype from an item as Kodi returns it, keeping only
+# the fields the record type has.
+def make_record(mediatype, item):
+  cls = RECORD_TYPES[mediatype]
+  record = cls()
+  for key in cls.FIELDS:
+    if key in item:
+      setattr(record, key, item[key])
+  return record
+
+
+# json.dumps() default for records and the datetimes in them, with
+# dateadded written back the way Kodi sends it.
+def json_default(obj):
+  if isinstance(obj, Record):
+    return obj.to_dict()
+  if isinstance(obj, datetime.datetime):
+    return obj.strftime(DATEADDED_FORMAT)
+  raise TypeError('%r is not JSON serializable' % (obj,))
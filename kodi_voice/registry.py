@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+import logging
+import threading
+import time
+from .kodi import Kodi, device_id
+from .settings import load_settings
+
+
+log = logging.getLogger(__name__)
+
+# Seconds broadcast() waits for each device before giving up on it.
+BROADCAST_TIMEOUT = 5
+
+
+class KodiRegistry():
+  # Hands out one Kodi instance per config section and reuses it across
+  # requests, along with its response cache, library mirror and whatever it
+  # has remembered, instead of building a fresh one for every request.
+  # Devices without a section of their own all share the DEFAULT one.
+  #
+  # If the config file changes on disk, it is read again, the old instances
+  # are closed and new ones are built as they are next asked for.  A request
+  # still using an old instance can carry on; it just stops using the
+  # library mirror.  See load_settings() for compiled_file.
+  #
+  # Safe to use from multiple threads.
+  def __init__(self, config_file, compiled_file=None):
+    self.config_file = config_file
+    self.compiled_file = compiled_file
+    self.lock = threading.Lock()
+    self.clients = {}
+    self.building = {}
+    self.settings = None
+
+  # The Kodi instance for the device a request came from.
+  def client(self, context=None):
+    return self.device(device_id(context))
+
+  # The Kodi instance for deviceId, which may be any section of the config
+  # file.
+  #
+  # Building an instance can be slow (it connects the cache backend and may
+  # start a notification listener), so it happens outside self.lock.  Only
+  # threads after the same section wait for it, on that section's lock in
+  # self.building.
+  def device(self, deviceId):
+    while True:
+      settings = load_settings(self.config_file, self.compiled_file)
+      replaced = []
+      with self.lock:
+        if settings is not self.settings:
+          if self.settings is not None:
+            log.info('Config file changed, rebuilding Kodi clients')
+          self.settings = settings
+          replaced = self.clients.values()
+          self.clients = {}
+
+        section = settings.device(deviceId).section
+        kodi = self.clients.get(section)
+        building = self.building.setdefault(section, threading.Lock())
+
+      for old in replaced:
+        old.Close()
+      if kodi is not None:
+        return kodi
+
+      with building:
+        with self.lock:
+          if settings is self.settings:
+            kodi = self.clients.get(section)
+        if kodi is not None:
+          # built while we waited
+          return kodi
+
+        kodi = Kodi(settings, deviceId=section)
+        with self.lock:
+          if settings is self.settings:
+            self.clients[section] = kodi
+            return kodi
+
+      # the config changed while we were building; start over with the new one
+      kodi.Close()
+
+  # The devices configured with a section of their own in the config file.
+  # The placeholder sections kodi.config.example comes with don't count.
+  def devices(self):
+    settings = load_settings(self.config_file, self.compiled_file)
+    return sorted(section for section, device in settings.devices.items() if section != 'DEFAULT' and not device.from_example)
+
+  # Run command on several devices at once, e.g. "pause everything".
+  #
+  # command is the name of a Kodi method (called with args) or a function
+  # taking the Kodi instance.  It goes to deviceIds, or every device from
+  # devices() plus DEFAULT, which is the Kodi for every Echo without a
+  # section of its own.  Devices pointing at the same Kodi as one before
+  # them are skipped, so each Kodi gets command once: a toggle like
+  # PlayerPlayPause would otherwise undo itself.  Each Kodi gets its own
+  # thread and timeout seconds to answer, so an offline box costs at most
+  # timeout rather than holding up the rest; its thread is left to finish in
+  # the background.
+  #
+  # Returns a dict of deviceId to a dict with:
+  #   status   'ok', 'error' (command raised or device misconfigured),
+  #            'timeout' or 'skipped' (same Kodi as another device)
+  #   result   what command returned, when 'ok'
+  #   error    repr of the exception, when 'error'
+  #   same_as  the deviceId that command went to instead, when 'skipped'
+  #   elapsed  seconds until it finished or was given up on
+  def broadcast(self, command, deviceIds=None, timeout=BROADCAST_TIMEOUT, args=()):
+    if deviceIds is None:
+      deviceIds = self.devices() + ['DEFAULT']
+
+    settings = load_settings(self.config_file, self.compiled_file)
+    targets = []
+    skipped = {}
+    handled_by = {}
+    for deviceId in deviceIds:
+      endpoint = settings.device(deviceId).endpoint()
+      if endpoint in handled_by:
+        if handled_by[endpoint] != deviceId:
+          skipped[deviceId] = {'status': 'skipped', 'same_as': handled_by[endpoint], 'elapsed': 0}
+        continue
+      handled_by[endpoint] = deviceId
+      targets.append(deviceId)
+
+    results = {}
+    lock = threading.Lock()
+    start = time.time()
+
+    def worker(deviceId):
+      try:
+        kodi = self.device(deviceId)
+        if kodi.config_error:
+          raise ValueError('Config error in [%s]' % kodi.dev_cfg_section)
+        if callable(command):
+          outcome = {'status': 'ok', 'result': command(kodi)}
+        else:
+          outcome = {'status': 'ok', 'result': getattr(kodi, command)(*args)}
+      except Exception as e:
+        log.error('Broadcast to %s failed: %s', deviceId, repr(e))
+        outcome = {'status': 'error', 'error': repr(e)}
+      outcome['elapsed'] = time.time() - start
+      with lock:
+        # a late answer doesn't replace the timeout we already reported
+        results.setdefault(deviceId, outcome)
+
+    threads = []
+    for deviceId in targets:
+      t = threading.Thread(target=worker, args=(deviceId,), name='kodi-broadcast-%s' % deviceId)
+      t.daemon = True
+      t.start()
+      threads.append((deviceId, t))
+
+    deadline = start + timeout
+    for deviceId, t in threads:
+      t.join(max(0, deadline - time.time()))
+
+    with lock:
+      for deviceId, t in threads:
+        if deviceId not in results:
+          log.info('Broadcast to %s timed out after %.1fs', deviceId, timeout)
+          results[deviceId] = {'status': 'timeout', 'elapsed': time.time() - start}
+      results.update(skipped)
+      return dict(results)
+
+  # Close and drop every instance.
+  def clear(self):
+    with self.lock:
+      replaced = self.clients.values()
+      self.settings = None
+      self.clients = {}
+    for old in replaced:
+      old.Close()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from ConfigParser import NoOptionError, NoSectionError
+
+
+log = logging.getLogger(__name__)
+
+# Bump when the layout of compiled settings files changes.
+COMPILED_VERSION = 2
+
+BOOLEAN_STATES = {'1': True, 'yes': True, 'true': True, 'on': True,
+                  '0': False, 'no': False, 'false': False, 'off': False}
+
+
+def _boolean(value):
+  if value.lower() not in BOOLEAN_STATES:
+    raise ValueError('Not a boolean: %s' % value)
+  return BOOLEAN_STATES[value.lower()]
+
+
+def _string(value):
+  return value
+
+
+def _lower(value):
+  return value.lower()
+
+
+# Like the skill has always read use_proxy
+def _yes(value):
+  return value in ['y', 'yes', 'Y', 'Yes', 'YES', 'true', 'True']
+
+
+# Options Kodi uses:
+#   (option, parse, default)
+#
+# An option that is missing, empty or 'None' takes the default; otherwise
+# it is converted with parse.  A default of REQUIRED marks the device
+# config as being in error when the option has no value.
+REQUIRED = object()
+
+GLOBAL_OPTIONS = [
+  ('language', _lower, 'en'),
+  ('playlist_max_items', int, sys.maxint),
+  ('unwatched_shows_max_results', int, REQUIRED),
+  ('unwatched_episodes_max_results', int, REQUIRED),
+  ('unwatched_movies_max_results', int, REQUIRED),
+  ('logsensitive', _boolean, True),
+  ('match_processes', int, 0),
+]
+
+DEVICE_OPTIONS = [
+  ('scheme', _string, REQUIRED),
+  ('subpath', _string, ''),
+  ('address', _string, REQUIRED),
+  ('port', _string, REQUIRED),
+  ('username', _string, REQUIRED),
+  ('password', _string, REQUIRED),
+  ('read_timeout', float, REQUIRED),
+  ('read_timeout_async', float, REQUIRED),
+  ('cache_bucket', _string, None),
+  ('s3_cache_aws_access_key_id', _string, None),
+  ('s3_cache_aws_secret_access_key', _string, None),
+  ('owncloud_cache_url', _string, None),
+  ('owncloud_cache_user', _string, None),
+  ('owncloud_cache_password', _string, None),
+  ('cache_bg_update', _boolean, False),
+  ('library_mirror', _string, None),
+  ('recommend_pool_ttl', float, 0),
+  ('player_state_ttl', float, 0),
+  ('notification_port', int, None),
+  ('use_proxy', _yes, False),
+  ('alt_proxy', _string, None),
+]
+
+# Sections that aren't devices
+NON_DEVICE_SECTIONS = ['global', 'alexa']
+
+
+# JSON gives back unicode; the settings were str when compiled.
+def _native(value):
+  if isinstance(value, unicode):
+    return value.encode('utf-8')
+  return value
+
+
+def _get(config, section, option):
+  try:
+    value = config.get(section, option)
+  except (NoOptionError, NoSectionError):
+    return None
+  if not value or value == 'None':
+    return None
+  return value
+
+
+class DeviceSettings():
+  # The resolved settings for one device: every option in GLOBAL_OPTIONS and
+  # DEVICE_OPTIONS as an attribute, already converted, plus section (the
+  # config section they came from) and config_error (whether a device
+  # option was missing or invalid) and from_example (whether the section
+  # only exists in kodi.config.example, not in the config file itself).
+  def __init__(self, values):
+    self.__dict__.update(values)
+
+  # Identifies the Kodi these settings point at.
+  def endpoint(self):
+    return (self.scheme, self.address, self.port, self.subpath)
+
+  def to_dict(self):
+    return dict(self.__dict__)
+
+
+class KodiSettings():
+  # A typed snapshot of a KodiConfigParser, with the settings for each
+  # device resolved up front so building a Kodi instance doesn't parse
+  # anything.
+  #
+  # Build one with compile_settings() or load_settings().
+  def __init__(self, devices, source=None, mtime=None):
+    self.devices = devices
+    self.source = source
+    self.mtime = mtime
+
+  # The settings for deviceId, or the DEFAULT ones if it has no section of
+  # its own.
+  def device(self, deviceId):
+    return self.devices.get(deviceId) or self.devices['DEFAULT']
+
+  def to_dict(self):
+    return {
+      'version': COMPILED_VERSION,
+      'source': self.source,
+      'mtime': self.mtime,
+      'devices': dict((section, d.to_dict()) for section, d in self.devices.items()),
+    }
+
+  @classmethod
+  def from_dict(cls, data):
+    devices = {}
+    for section, values in data['devices'].items():
+      devices[_native(section)] = DeviceSettings(dict((_native(k), _native(v)) for k, v in values.items()))
+    return cls(devices, _native(data.get('source')), data.get('mtime'))
+
+
+# Build KodiSettings from a (Kodi)ConfigParser.  Raises ValueError if a
+# global option is invalid; problems with a device's options only set its
+# config_error.
+def compile_settings(config, source=None, mtime=None):
+  global_values = {}
+  for option, parse, default in GLOBAL_OPTIONS:
+    value = _get(config, 'global', option)
+    if value is None:
+      if default is REQUIRED:
+        raise ValueError('Missing [global] %s' % option)
+      global_values[option] = default
+    else:
+      global_values[option] = parse(value)
+
+  example_sections = getattr(config, 'example_sections', [])
+  devices = {}
+  for section in ['DEFAULT'] + [s for s in config.sections() if s not in NON_DEVICE_SECTIONS]:
+    values = dict(global_values)
+    values['section'] = section
+    values['config_error'] = False
+    values['from_example'] = section in example_sections
+    for option, parse, default in DEVICE_OPTIONS:
+      value = _get(config, section, option)
+      if value is None:
+        if default is REQUIRED:
+          values['config_error'] = True
+          default = None
+        values[option] = default
+        continue
+      try:
+        values[option] = parse(value)
+      except ValueError as e:
+        log.error('Invalid %s in [%s]: %s', option, section, repr(e))
+        values['config_error'] = True
+        values[option] = None
+    devices[section] = DeviceSettings(values)
+
+  return KodiSettings(devices, source, mtime)
+
+
+# Write settings to compiled_file, readable only by its owner, through a
+# temporary file so other processes never see it half written.
+def _write_compiled(compiled_file, settings):
+  tmp = None
+  try:
+    # mkstemp creates the file with mode 0600
+    fd, tmp = tempfile.mkstemp(prefix='.kodi-settings-', dir=os.path.dirname(os.path.abspath(compiled_file)))
+    with os.fdopen(fd, 'w') as f:
+      json.dump(settings.to_dict(), f)
+    try:
+      os.rename(tmp, compiled_file)
+    except OSError:
+      # Windows won't rename over an existing file
+      os.remove(compiled_file)
+      os.rename(tmp, compiled_file)
+  except (IOError, OSError) as e:
+    log.error('Unable to write compiled settings %s: %s', compiled_file, repr(e))
+    if tmp and os.path.exists(tmp):
+      os.remove(tmp)
+
+
+_settings = {}
+_settings_lock = threading.Lock()
+
+
+# Return KodiSettings for config_file, reading it only when it has changed
+# since the last call.  Without a config file, settings come from the
+# environment as with KodiConfigParser and are read once.
+#
+# With compiled_file, the settings are also written there and, in a fresh
+# process, loaded from it without touching the config file again as long as
+# the config file's mtime still matches.  The compiled file holds the
+# passwords and keys from the config file, so it is only readable by its
+# owner.
+def load_settings(config_file, compiled_file=None):
+  from .kodi import KodiConfigParser
+
+  try:
+    mtime = os.path.getmtime(config_file)
+  except OSError:
+    mtime = None
+
+  with _settings_lock:
+    settings = _settings.get(config_file)
+    if settings is not None and settings.mtime == mtime:
+      return settings
+
+    settings = None
+    if compiled_file and mtime is not None:
+      try:
+        with open(compiled_file) as f:
+          data = json.load(f)
+        if data.get('version') == COMPILED_VERSION and data.get('source') == config_file and data.get('mtime') == mtime:
+          settings = KodiSettings.from_dict(data)
+          log.debug('Loaded compiled settings from %s', compiled_file)
+      except (IOError, OSError, ValueError, KeyError):
+        pass
+
+    if settings is None:
+      settings = compile_settings(KodiConfigParser(config_file), config_file, mtime)
+      if compiled_file and mtime is not None:
+        _write_compiled(compiled_file, settings)
+
+    _settings[config_file] = settings
+    return settings
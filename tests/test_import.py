@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+BENCH_IMPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'bench_import.py')
+
+
+class ImportBudgetTest(unittest.TestCase):
+  # benchmarks/bench_import.py with its default budget: `import kodi_voice`
+  # stays fast and leaves the optional dependencies for first use.
+  def test_import_budget(self):
+    p = subprocess.Popen([sys.executable, BENCH_IMPORT, '--runs', '3'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    self.assertEqual(p.returncode, 0, (out + err).decode('utf-8'))
+
+
+if __name__ == '__main__':
+  unittest.main()
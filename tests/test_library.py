@@ -0,0 +1,84 @@
+import json
+import unittest
+
+from kodi_voice.library import DELTA_PAGE_SIZE, KodiLibraryMirror
+
+
+# Answers the library queries the mirror sends, from a list of movies, and
+# keeps every command it was sent.
+class FakeKodi():
+  def __init__(self, movies):
+    self.movies = movies
+    self.commands = []
+
+  def SendCommand(self, command, wait_resp=True, cache_resp=False):
+    command = json.loads(command)
+    self.commands.append(command)
+    params = command.get('params', {})
+    items = list(self.movies)
+    if params.get('sort', {}).get('method') == 'dateadded':
+      items.sort(key=lambda item: item['dateadded'], reverse=True)
+    limits = params.get('limits', {})
+    start = limits.get('start', 0)
+    end = limits.get('end', len(items))
+    properties = params.get('properties', [])
+    page = [dict((k, v) for k, v in item.items() if k in ['movieid', 'label'] + properties) for item in items[start:end]]
+    return {'result': {'movies': page, 'limits': {'start': start, 'end': min(end, len(items)), 'total': len(items)}}}
+
+
+def movie(movieid, label, day):
+  return {'movieid': movieid, 'label': label, 'dateadded': '2017-01-%02d 12:00:00' % day}
+
+
+class LibraryMirrorTest(unittest.TestCase):
+  def setUp(self):
+    self.mirror = KodiLibraryMirror(':memory:')
+    self.kodi = FakeKodi([movie(i, u'Movie %d' % i, i) for i in range(1, 21)])
+    self.mirror.sync(self.kodi, ['movies'])
+    self.kodi.commands = []
+
+  def tearDown(self):
+    self.mirror.close()
+
+  def ids(self):
+    return set(row[0] for row in self.mirror.db.execute('SELECT itemid FROM items WHERE mediatype = ?', ('movies',)))
+
+  def test_full_sync(self):
+    self.assertTrue(self.mirror.is_synced('movies'))
+    self.assertEqual(self.mirror.count('movies'), 20)
+    self.assertEqual(self.ids(), set(range(1, 21)))
+    self.assertEqual([m['label'] for m in self.mirror.search('movies', [u'movie 7'])][0], u'Movie 7')
+
+  def test_delta_fetches_only_new_items(self):
+    self.kodi.movies.append(movie(21, u'Alien', 25))
+    self.kodi.movies.append(movie(22, u'Aliens', 26))
+    self.assertEqual(self.mirror.sync(self.kodi, ['movies']), {'movies': 22})
+    self.assertEqual(len(self.kodi.commands), 1)
+    self.assertEqual(self.kodi.commands[0]['params']['limits'], {'start': 0, 'end': DELTA_PAGE_SIZE})
+    self.assertEqual(self.ids(), set(range(1, 23)))
+    self.assertEqual(self.mirror.search('movies', [u'aliens'])[0]['movieid'], 22)
+
+  def test_delta_deletes_removed_items(self):
+    del self.kodi.movies[4]
+    self.assertEqual(self.mirror.sync(self.kodi, ['movies']), {'movies': 19})
+    self.assertNotIn(5, self.ids())
+    self.assertEqual(self.mirror.search('movies', [u'5']), [])
+
+  def test_delta_falls_back_to_full_sync(self):
+    # added with an old dateadded, so the delta can't see it
+    self.kodi.movies.append(movie(21, u'Old Find', 1))
+    self.assertEqual(self.mirror.sync(self.kodi, ['movies']), {'movies': 21})
+    self.assertIn(21, self.ids())
+
+  def test_invalidate(self):
+    fingerprint = self.mirror.fingerprint(['movies'])
+    self.assertIsNotNone(fingerprint[0])
+    self.mirror.invalidate(['movies'])
+    self.assertFalse(self.mirror.is_synced('movies'))
+    self.assertEqual(self.mirror.fingerprint(['movies']), (None,))
+    # the items stay until the next sync
+    self.assertEqual(self.mirror.count('movies'), 20)
+
+
+if __name__ == '__main__':
+  unittest.main()
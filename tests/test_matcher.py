@@ -0,0 +1,49 @@
+import unittest
+
+from kodi_voice.matcher import WORKER_LABEL_SETS, ParallelMatcher, fuzzy_extract
+
+
+def library(name, size=20):
+  return [u'%s %d' % (name, i) for i in range(size)]
+
+
+class ParallelMatcherTest(unittest.TestCase):
+  def setUp(self):
+    self.matcher = ParallelMatcher(2)
+
+  def tearDown(self):
+    self.matcher.close()
+
+  def assertMatches(self, heard, labels):
+    self.assertEqual(self.matcher.extract([heard], labels, limit=3), fuzzy_extract([heard], labels, limit=3))
+
+  def test_matches_like_serial(self):
+    labels = library('Movie')
+    self.assertMatches(u'movie 7', labels)
+    self.assertEqual(self.matcher.extract([u'movie 7'], labels)[0][0], u'Movie 7')
+
+  def test_reused_label_set_survives_eviction(self):
+    sets = [library(u'Set %d' % i) for i in range(WORKER_LABEL_SETS + 1)]
+    for labels in sets[:WORKER_LABEL_SETS]:
+      self.assertMatches(u'x 3', labels)
+    # reusing the oldest keeps it; loading one more evicts the next oldest
+    self.assertMatches(u'set 0 3', sets[0])
+    self.assertMatches(u'x 3', sets[WORKER_LABEL_SETS])
+    self.assertMatches(u'set 0 4', sets[0])
+    self.assertMatches(u'set 1 4', sets[1])
+    for p, conn, loaded in self.matcher.workers:
+      self.assertEqual(len(loaded), WORKER_LABEL_SETS)
+      self.assertTrue(p.is_alive())
+
+  def test_reloads_label_set_the_worker_lost(self):
+    labels = library('Movie')
+    self.assertMatches(u'movie 5', labels)
+    other = library('Song')
+    # pretend the parent thinks the workers still have it
+    for p, conn, loaded in self.matcher.workers:
+      loaded.append(ParallelMatcher.label_set_key(other))
+    self.assertMatches(u'song 5', other)
+
+
+if __name__ == '__main__':
+  unittest.main()
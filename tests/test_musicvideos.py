@@ -0,0 +1,37 @@
+import json
+import unittest
+
+from kodi_voice.kodi import Kodi, KodiConfigParser
+
+
+MUSICVIDEOS = [
+  {'musicvideoid': 1, 'label': 'Under Pressure', 'artist': ['Queen', 'David Bowie']},
+  {'musicvideoid': 2, 'label': 'Heroes', 'artist': ['David Bowie']},
+  {'musicvideoid': 3, 'label': 'Radio Ga Ga', 'artist': ['Queen']},
+]
+
+
+class MusicVideoArtistIndexTest(unittest.TestCase):
+  def setUp(self):
+    self.kodi = Kodi(KodiConfigParser(''))
+
+  # a fresh list, as a (cached) GetMusicVideos response decodes to
+  def musicvideos(self):
+    return json.loads(json.dumps(MUSICVIDEOS))
+
+  def test_every_artist_is_indexed(self):
+    index, names = self.kodi.GetMusicVideoArtistIndex(self.musicvideos())
+    self.assertEqual([n['artist'] for n in names], ['Queen', 'David Bowie'])
+    self.assertEqual([mv['musicvideoid'] for mv in index['David Bowie']], [1, 2])
+
+  def test_index_is_reused_for_the_same_library(self):
+    index, names = self.kodi.GetMusicVideoArtistIndex(self.musicvideos())
+    self.assertIs(self.kodi.GetMusicVideoArtistIndex(self.musicvideos())[0], index)
+
+    changed = self.musicvideos()
+    changed[1]['artist'].append('Queen')
+    self.assertIsNot(self.kodi.GetMusicVideoArtistIndex(changed)[0], index)
+
+
+if __name__ == '__main__':
+  unittest.main()
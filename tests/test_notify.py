@@ -0,0 +1,164 @@
+import json
+import socket
+import threading
+import time
+import unittest
+
+from kodi_voice import notify
+from kodi_voice.library import AUDIO_MEDIATYPES, VIDEO_MEDIATYPES
+
+
+# Wait up to a couple of seconds for condition() to hold.
+def wait_for(condition, timeout=2):
+  deadline = time.time() + timeout
+  while time.time() < deadline:
+    if condition():
+      return True
+    time.sleep(0.01)
+  return condition()
+
+
+class FakeKodiServer():
+  # Kodi's JSON-RPC TCP interface, as far as the listener uses it: answers
+  # the "players" and "volume" requests and pushes whatever notifications
+  # the test sends.
+  def __init__(self):
+    self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.server.bind(('127.0.0.1', 0))
+    self.server.listen(5)
+    self.port = self.server.getsockname()[1]
+    self.conn = None
+    self.connections = 0
+    self.requests = []
+    self.players = [{'type': 'video', 'playerid': 1}]
+    self.volume = {'volume': 40, 'muted': False}
+    self.thread = threading.Thread(target=self._run)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def _run(self):
+    while True:
+      try:
+        conn, addr = self.server.accept()
+      except socket.error:
+        return
+      self.conn = conn
+      self.connections += 1
+      decoder = json.JSONDecoder()
+      buf = ''
+      while True:
+        try:
+          data = conn.recv(65536)
+        except socket.error:
+          break
+        if not data:
+          break
+        buf += data
+        while buf.strip():
+          try:
+            msg, end = decoder.raw_decode(buf.lstrip())
+          except ValueError:
+            break
+          buf = buf.lstrip()[end:]
+          self.requests.append(msg)
+          if msg.get('id') == 'players':
+            self.send({'id': 'players', 'jsonrpc': '2.0', 'result': self.players})
+          elif msg.get('id') == 'volume':
+            self.send({'id': 'volume', 'jsonrpc': '2.0', 'result': self.volume})
+
+  def send(self, msg):
+    self.conn.sendall(json.dumps(msg))
+
+  def notify(self, method, data=None):
+    self.send({'jsonrpc': '2.0', 'method': method, 'params': {'sender': 'xbmc', 'data': data}})
+
+  def drop(self):
+    self.conn.shutdown(socket.SHUT_RDWR)
+    self.conn.close()
+
+  def close(self):
+    if self.conn:
+      self.conn.close()
+    self.server.close()
+
+
+class NotificationListenerTest(unittest.TestCase):
+  def setUp(self):
+    self.reconnect_min = notify.RECONNECT_MIN
+    notify.RECONNECT_MIN = 0.05
+    self.server = FakeKodiServer()
+    self.listener = notify.KodiNotificationListener('127.0.0.1', self.server.port)
+    self.changes = []
+    self.stops = []
+    self.listener.subscribe('test', self.changes.append)
+    self.listener.subscribe_playback('test', lambda: self.stops.append(True))
+    self.assertTrue(wait_for(lambda: self.listener.players is not None and self.listener.volume is not None))
+
+  def tearDown(self):
+    self.listener.close()
+    self.server.close()
+    notify.RECONNECT_MIN = self.reconnect_min
+
+  def test_initial_state(self):
+    self.assertEqual(self.listener.players, [{'type': 'video', 'playerid': 1}])
+    self.assertEqual(self.listener.volume, 40)
+    self.assertFalse(self.listener.muted)
+
+  def test_volume_changes(self):
+    self.server.notify('Application.OnVolumeChanged', {'volume': 55, 'muted': True})
+    self.assertTrue(wait_for(lambda: self.listener.volume == 55))
+    self.assertTrue(self.listener.muted)
+
+  def test_player_events(self):
+    self.server.players = []
+    self.server.notify('Player.OnStop', {'item': {'type': 'movie', 'id': 1}, 'end': True})
+    self.assertTrue(wait_for(lambda: self.listener.players == []))
+    self.assertTrue(wait_for(lambda: self.stops == [True]))
+    self.assertEqual(self.changes, [])
+
+  def test_playcount_updates_are_not_library_changes(self):
+    self.server.notify('VideoLibrary.OnUpdate', {'item': {'type': 'movie', 'id': 1}, 'playcount': 1})
+    self.server.notify('VideoLibrary.OnUpdate', {'item': {'type': 'movie', 'id': 2}, 'added': True})
+    self.assertTrue(wait_for(lambda: self.changes))
+    time.sleep(0.1)
+    self.assertEqual(self.changes, [VIDEO_MEDIATYPES])
+
+  def test_removals(self):
+    self.server.notify('AudioLibrary.OnRemove', {'type': 'song', 'id': 3})
+    self.assertTrue(wait_for(lambda: self.changes == [AUDIO_MEDIATYPES]))
+
+  def test_scan_is_one_change(self):
+    self.server.notify('VideoLibrary.OnScanStarted')
+    for i in range(5):
+      self.server.notify('VideoLibrary.OnUpdate', {'item': {'type': 'movie', 'id': i}, 'added': True, 'transaction': True})
+    self.server.notify('VideoLibrary.OnScanFinished')
+    self.assertTrue(wait_for(lambda: self.changes))
+    time.sleep(0.1)
+    self.assertEqual(self.changes, [VIDEO_MEDIATYPES])
+
+  def test_slow_callbacks_run_off_the_listener_thread(self):
+    release = threading.Event()
+    self.listener.subscribe('slow', lambda mediatypes: release.wait(2))
+    self.server.notify('VideoLibrary.OnRemove', {'type': 'movie', 'id': 1})
+    self.server.notify('Application.OnVolumeChanged', {'volume': 70, 'muted': False})
+    self.assertTrue(wait_for(lambda: self.listener.volume == 70, timeout=1))
+    release.set()
+
+  def test_reconnects(self):
+    self.server.drop()
+    # anything may have changed while we were away
+    self.assertTrue(wait_for(lambda: VIDEO_MEDIATYPES + AUDIO_MEDIATYPES in self.changes))
+    self.assertTrue(wait_for(lambda: self.server.connections == 2 and self.listener.players is not None))
+
+  def test_concurrent_sends(self):
+    threads = [threading.Thread(target=self.listener.forget_players) for i in range(20)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    self.assertTrue(wait_for(lambda: len([r for r in self.server.requests if r.get('id') == 'players']) == 21))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,35 @@
+import time
+import unittest
+
+from kodi_voice.player import PLAYER_CHANGING_RE, PlayerSnapshots
+
+
+class PlayerSnapshotsTest(unittest.TestCase):
+  def test_players_expire(self):
+    snapshots = PlayerSnapshots()
+    endpoint = ('http', 'kodi', '8080', '')
+    self.assertIsNone(snapshots.get(endpoint, 3))
+    snapshots.put(endpoint, [{'type': 'video', 'playerid': 1}])
+    self.assertEqual(snapshots.get(endpoint, 3), [{'type': 'video', 'playerid': 1}])
+    self.assertIsNone(snapshots.get(('http', 'other', '8080', ''), 3))
+
+    snapshots.snapshots[endpoint] = (time.time() - 10, [])
+    self.assertIsNone(snapshots.get(endpoint, 3))
+
+  def test_invalidate(self):
+    snapshots = PlayerSnapshots()
+    snapshots.put('kodi', [])
+    snapshots.put_volume_increment('kodi', 2.0)
+    snapshots.invalidate('kodi')
+    self.assertIsNone(snapshots.get('kodi', 3))
+    self.assertEqual(snapshots.get_volume_increment('kodi', 1.0), 2.0)
+    self.assertEqual(snapshots.get_volume_increment('other', 1.0), 1.0)
+
+  def test_player_changing_commands(self):
+    self.assertTrue(PLAYER_CHANGING_RE.search('{"method": "Player.Open", "params": {}}'))
+    self.assertTrue(PLAYER_CHANGING_RE.search('{"method":"Player.Stop"}'))
+    self.assertFalse(PLAYER_CHANGING_RE.search('{"method": "Player.PlayPause"}'))
+
+
+if __name__ == '__main__':
+  unittest.main()
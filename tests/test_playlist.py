@@ -0,0 +1,53 @@
+import json
+import sys
+import unittest
+
+from kodi_voice.kodi import Kodi, KodiConfigParser
+
+
+# Answers AudioLibrary.GetSongs for an album of `songs` songs and keeps
+# every request.
+class FakeAlbum():
+  def __init__(self, songs):
+    self.songs = [{'songid': i, 'label': 'Song %d' % i} for i in range(1, songs + 1)]
+    self.sent = []
+
+  def SendCommand(self, command, wait_resp=True, cache_resp=False):
+    command = json.loads(command)
+    self.sent.append(command)
+    if command['method'] == 'AudioLibrary.GetSongs':
+      start, end = command['params']['limits']['start'], command['params']['limits']['end']
+      return {'result': {'songs': self.songs[start:end], 'limits': {'start': start, 'end': end, 'total': len(self.songs)}}}
+    return {'result': 'OK'}
+
+
+class AddSongSetTest(unittest.TestCase):
+  def setUp(self):
+    self.kodi = Kodi(KodiConfigParser(''))
+    self.kodi.playlist_limit = 10
+
+  def enqueue(self, songs):
+    self.fake = FakeAlbum(songs)
+    self.kodi.SendCommand = self.fake.SendCommand
+    self.kodi.AddAlbumToPlaylist(7)
+    return self.fake.sent
+
+  def test_no_limit_is_one_request(self):
+    self.kodi.playlist_limit = sys.maxint
+    sent = self.enqueue(25)
+    self.assertEqual([c['method'] for c in sent], ['Playlist.Add'])
+
+  def test_album_that_fits_is_expanded_by_kodi(self):
+    sent = self.enqueue(8)
+    self.assertEqual([c['method'] for c in sent], ['AudioLibrary.GetSongs', 'Playlist.Add'])
+    self.assertEqual(sent[1]['params']['item'], [{'albumid': 7}])
+
+  def test_album_over_the_limit_adds_song_ids(self):
+    sent = self.enqueue(25)
+    self.assertEqual([c['method'] for c in sent], ['AudioLibrary.GetSongs', 'Playlist.Add'])
+    self.assertEqual(sent[0]['params']['limits'], {'start': 0, 'end': 11})
+    self.assertEqual(sent[1]['params']['item'], [{'songid': i} for i in range(1, 11)])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,47 @@
+import json
+import unittest
+
+from kodi_voice.kodi import Kodi, KodiConfigParser
+
+
+MOVIES = [{'movieid': i, 'label': label} for i, label in enumerate(['Alien', 'Aliens', 'Heat', 'Up'], 1)]
+
+
+# Answers VideoLibrary.GetMovies, applying "title contains" filters, and
+# keeps each command along with whether it was to be cached.
+class FakeMovies():
+  def __init__(self):
+    self.sent = []
+
+  def SendCommand(self, command, wait_resp=True, cache_resp=False):
+    params = json.loads(command).get('params', {})
+    self.sent.append((params, cache_resp))
+    movies = MOVIES
+    if 'filter' in params:
+      f = params['filter']
+      filters = f.get('and') or f.get('or') or [f]
+      movies = [m for m in movies if any(c['value'].lower() in m['label'].lower() for c in filters)]
+    return {'result': {'movies': movies}}
+
+
+class PushdownTest(unittest.TestCase):
+  def setUp(self):
+    self.kodi = Kodi(KodiConfigParser(''))
+    self.fake = FakeMovies()
+    self.kodi.SendCommand = self.fake.SendCommand
+
+  def test_filtered_fetches_are_not_cached(self):
+    self.assertEqual(self.kodi.FindMovie(u'aliens')[0], (2, 'Aliens'))
+    self.assertTrue(self.fake.sent)
+    self.assertTrue(all('filter' in params for params, cache_resp in self.fake.sent))
+    self.assertEqual([cache_resp for params, cache_resp in self.fake.sent], [False] * len(self.fake.sent))
+
+  def test_whole_library_is_cached(self):
+    self.assertEqual(self.kodi.FindMovie(u'the thing'), [])
+    params, cache_resp = self.fake.sent[-1]
+    self.assertNotIn('filter', params)
+    self.assertTrue(cache_resp)
+
+
+if __name__ == '__main__':
+  unittest.main()
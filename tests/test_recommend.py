@@ -0,0 +1,46 @@
+import json
+import unittest
+
+from kodi_voice.kodi import Kodi, KodiConfigParser
+
+
+# Answers JSON-RPC batches of library queries with one item per library, and
+# keeps each batch, without the ids.
+class FakeLibrary():
+  def __init__(self):
+    self.batches = []
+
+  def SendCommand(self, command, wait_resp=True, cache_resp=False):
+    batch = json.loads(command)
+    self.batches.append([dict((k, v) for k, v in c.items() if k != 'id') for c in batch])
+    responses = []
+    for c in batch:
+      key = c['method'].split('.Get')[1].lower()
+      idfield = key[:-1] + 'id'
+      item = {'label': '%s 1' % key, idfield: 1}
+      if key == 'tvshows':
+        item['tvshowid'] = 5
+      responses.append({'id': c['id'], 'jsonrpc': '2.0', 'result': {key: [item]}})
+    return responses
+
+
+class RecommendationPoolsTest(unittest.TestCase):
+  def setUp(self):
+    self.kodi = Kodi(KodiConfigParser(''))
+    self.fake = FakeLibrary()
+    self.kodi.SendCommand = self.fake.SendCommand
+
+  def test_unwatched_shows_are_fetched_once(self):
+    pools = self.kodi.FetchRecommendationPools(['movies', 'tvshows', 'episodes', 'musicvideos'])
+    first, second = self.fake.batches
+    unwatched_shows = [c for c in first if c['method'] == 'VideoLibrary.GetTVShows' and 'filter' in c['params']]
+    self.assertEqual(len(unwatched_shows), 1)
+    self.assertEqual(len(first), len(set(json.dumps(c, sort_keys=True) for c in first)))
+    self.assertEqual([c['method'] for c in second], ['VideoLibrary.GetEpisodes'])
+    self.assertEqual(pools['tvshows'][0]['tvshowid'], 5)
+    self.assertEqual(pools['episodes'][0]['episodeid'], 1)
+    self.assertEqual(pools['movies'][0]['label'], 'movies 1')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,53 @@
+import collections
+import datetime
+import json
+import sys
+import unittest
+
+from kodi_voice.records import Artist, Episode, Movie, json_default, make_record
+
+
+class RecordTest(unittest.TestCase):
+  def test_reads_like_a_dict(self):
+    movie = Movie(title='Alien', movieid=1, label='Alien', dateadded='2017-01-02 03:04:05')
+    self.assertIsInstance(movie, collections.Mapping)
+    self.assertEqual(movie['label'], 'Alien')
+    self.assertEqual(movie.label, 'Alien')
+    self.assertEqual(movie.get('missing', 'x'), 'x')
+    self.assertNotIn('missing', movie)
+    self.assertEqual(movie, {'title': 'Alien', 'movieid': 1, 'label': 'Alien',
+                             'dateadded': datetime.datetime(2017, 1, 2, 3, 4, 5)})
+    self.assertEqual(dict(movie), movie.to_dict())
+    self.assertEqual(movie, movie.copy())
+    self.assertNotEqual(movie, Movie(label='Aliens'))
+
+  def test_compact(self):
+    item = {'movieid': 1, 'label': 'Alien', 'title': 'Alien', 'dateadded': '2017-01-02 03:04:05'}
+    movie = make_record('movies', item)
+    self.assertFalse(hasattr(movie, '__dict__'))
+    self.assertLess(sys.getsizeof(movie), sys.getsizeof(item))
+
+  def test_dateadded_is_parsed_once(self):
+    movie = Movie(dateadded='2017-01-02 03:04:05')
+    self.assertEqual(movie['dateadded'], datetime.datetime(2017, 1, 2, 3, 4, 5))
+    self.assertIs(movie.get('dateadded'), movie['dateadded'])
+    self.assertEqual(dict(movie.items())['dateadded'], datetime.datetime(2017, 1, 2, 3, 4, 5))
+
+  def test_json(self):
+    episode = Episode(label='Pilot', episodeid=3)
+    episode['art'] = {'poster': 'p.jpg'}
+    self.assertEqual(json.loads(json.dumps(episode, default=json_default)), {'label': 'Pilot', 'episodeid': 3, 'art': {'poster': 'p.jpg'}})
+    movie = Movie(label='Alien', dateadded='2017-01-02 03:04:05')
+    movie['dateadded']
+    self.assertEqual(json.loads(json.dumps([movie], default=json_default))[0]['dateadded'], '2017-01-02 03:04:05')
+
+  def test_make_record_keeps_only_its_fields(self):
+    artist = make_record('artists', {'artistid': 1, 'label': 'ABBA', 'dateadded': '2017-01-02 03:04:05', 'thumbnail': ''})
+    self.assertIsInstance(artist, Artist)
+    self.assertEqual(artist, {'artistid': 1, 'label': 'ABBA'})
+    self.assertFalse(hasattr(artist, 'dateadded'))
+    self.assertRaises(KeyError, artist.__setitem__, 'dateadded', '')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,176 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from kodi_voice import KodiRegistry
+from kodi_voice import registry as registry_module
+
+
+CONFIG = '''[DEFAULT]
+address = 127.0.0.1
+port = 8080
+library_mirror = %(mirror)s
+
+[global]
+unwatched_shows_max_results = 5
+unwatched_episodes_max_results = 5
+unwatched_movies_max_results = 5
+
+[living-room-echo]
+address = 127.0.0.2
+
+[kitchen-echo]
+address = 127.0.0.2
+
+[office-echo]
+address = 127.0.0.3
+'''
+
+
+# A request context as the skill gets it
+class Context():
+  def __init__(self, deviceId):
+    self.System = Context.Attrs(device=Context.Attrs(deviceId=deviceId))
+
+  class Attrs():
+    def __init__(self, **kwargs):
+      self.__dict__.update(kwargs)
+
+
+class RegistryTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.config_file = os.path.join(self.tmpdir, 'kodi.config')
+    self.write_config()
+    self.registry = KodiRegistry(self.config_file)
+
+  def tearDown(self):
+    self.registry.clear()
+    shutil.rmtree(self.tmpdir)
+
+  def write_config(self, extra='', mtime=None):
+    with open(self.config_file, 'w') as f:
+      f.write(CONFIG % {'mirror': os.path.join(self.tmpdir, 'mirror.db')} + extra)
+    if mtime:
+      os.utime(self.config_file, (mtime, mtime))
+
+  def test_keyed_by_section(self):
+    living = self.registry.client(Context('living-room-echo'))
+    self.assertIs(self.registry.client(Context('living-room-echo')), living)
+    self.assertEqual(living.dev_cfg_section, 'living-room-echo')
+    self.assertEqual(living.address, '127.0.0.2')
+
+    # devices without a section share the DEFAULT instance
+    unknown = self.registry.client(Context('amzn1.ask.device.unknown1'))
+    self.assertIs(self.registry.client(Context('amzn1.ask.device.unknown2')), unknown)
+    self.assertIs(self.registry.client(None), unknown)
+    self.assertEqual(unknown.dev_cfg_section, 'DEFAULT')
+    self.assertEqual(len(self.registry.clients), 2)
+
+  def test_sessions_are_shared_per_endpoint(self):
+    living = self.registry.device('living-room-echo')
+    kitchen = self.registry.device('kitchen-echo')
+    self.assertIsNot(living, kitchen)
+    self.assertIs(living.session, kitchen.session)
+    self.assertIsNot(living.session, self.registry.device('DEFAULT').session)
+
+  def test_config_change_closes_old_clients(self):
+    old = self.registry.device('living-room-echo')
+    self.assertTrue(old.library_mirror.enabled)
+
+    self.write_config('\n[bedroom-echo]\naddress = 127.0.0.4\n', mtime=os.path.getmtime(self.config_file) + 10)
+    new = self.registry.device('living-room-echo')
+    self.assertIsNot(new, old)
+    self.assertFalse(old.library_mirror.enabled)
+    self.assertTrue(new.library_mirror.enabled)
+    self.assertEqual(self.registry.device('bedroom-echo').address, '127.0.0.4')
+
+  def test_slow_build_only_holds_up_its_own_section(self):
+    building = threading.Event()
+    release = threading.Event()
+    real_kodi = registry_module.Kodi
+
+    def slow_kodi(settings, deviceId=None):
+      if deviceId == 'kitchen-echo':
+        building.set()
+        release.wait(2)
+      return real_kodi(settings, deviceId=deviceId)
+
+    registry_module.Kodi = slow_kodi
+    try:
+      kitchen = []
+      threads = [threading.Thread(target=lambda: kitchen.append(self.registry.device('kitchen-echo'))) for i in range(2)]
+      for t in threads:
+        t.start()
+      self.assertTrue(building.wait(2))
+      # another section doesn't wait for the kitchen
+      self.assertEqual(self.registry.device('office-echo').address, '127.0.0.3')
+      self.assertEqual(kitchen, [])
+      release.set()
+      for t in threads:
+        t.join(2)
+    finally:
+      release.set()
+      registry_module.Kodi = real_kodi
+    self.assertEqual(len(kitchen), 2)
+    self.assertIs(kitchen[0], kitchen[1])
+
+  def test_replaced_client_still_usable(self):
+    old = self.registry.device('living-room-echo')
+    self.write_config(mtime=os.path.getmtime(self.config_file) + 10)
+    self.assertIsNot(self.registry.device('living-room-echo'), old)
+    # the closed mirror just doesn't answer any more
+    self.assertFalse(old.library_mirror.is_synced('movies'))
+    self.assertEqual(old.library_mirror.search('movies', [u'alien']), [])
+    self.assertEqual(old.library_mirror.count('movies'), 0)
+
+  def test_devices_leave_out_example_sections(self):
+    self.assertEqual(self.registry.devices(), ['kitchen-echo', 'living-room-echo', 'office-echo'])
+
+  def test_broadcast_reaches_each_kodi_once(self):
+    calls = []
+    lock = threading.Lock()
+
+    def command(kodi):
+      with lock:
+        calls.append(kodi.address)
+      return kodi.address
+
+    results = self.registry.broadcast(command)
+    self.assertEqual(sorted(calls), ['127.0.0.1', '127.0.0.2', '127.0.0.3'])
+    self.assertEqual(sorted(results), ['DEFAULT', 'kitchen-echo', 'living-room-echo', 'office-echo'])
+    self.assertEqual(results['kitchen-echo']['result'], '127.0.0.2')
+    self.assertEqual(results['living-room-echo']['status'], 'skipped')
+    self.assertEqual(results['living-room-echo']['same_as'], 'kitchen-echo')
+    self.assertEqual(results['DEFAULT']['result'], '127.0.0.1')
+
+    # Echos without a section go to the DEFAULT Kodi
+    calls[:] = []
+    results = self.registry.broadcast(command, ['amzn1.ask.device.unknown', 'DEFAULT', 'living-room-echo'])
+    self.assertEqual(sorted(calls), ['127.0.0.1', '127.0.0.2'])
+    self.assertEqual(results['DEFAULT']['same_as'], 'amzn1.ask.device.unknown')
+
+  def test_broadcast_reports_errors_and_timeouts(self):
+    release = threading.Event()
+
+    def command(kodi):
+      if kodi.address == '127.0.0.2':
+        release.wait(2)
+      elif kodi.address == '127.0.0.3':
+        raise IOError('unreachable')
+      return True
+
+    try:
+      results = self.registry.broadcast(command, timeout=0.2)
+    finally:
+      release.set()
+    self.assertEqual(results['DEFAULT']['status'], 'ok')
+    self.assertEqual(results['kitchen-echo']['status'], 'timeout')
+    self.assertEqual(results['office-echo']['status'], 'error')
+    self.assertIn('unreachable', results['office-echo']['error'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from kodi_voice import settings as kodi_settings
+from kodi_voice.settings import load_settings
+
+
+CONFIG = '''[DEFAULT]
+address = 127.0.0.1
+port = 8080
+username = kodi
+password = secret
+
+[global]
+unwatched_shows_max_results = 5
+unwatched_episodes_max_results = 5
+unwatched_movies_max_results = 5
+
+[living-room-echo]
+address = 127.0.0.2
+'''
+
+
+class LoadSettingsTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.config_file = os.path.join(self.tmpdir, 'kodi.config')
+    self.compiled_file = os.path.join(self.tmpdir, 'kodi.config.json')
+    self.write_config(CONFIG)
+    kodi_settings._settings.clear()
+
+  def tearDown(self):
+    kodi_settings._settings.clear()
+    shutil.rmtree(self.tmpdir)
+
+  def write_config(self, config, mtime=None):
+    with open(self.config_file, 'w') as f:
+      f.write(config)
+    if mtime:
+      os.utime(self.config_file, (mtime, mtime))
+
+  def test_unchanged_config_is_not_reread(self):
+    settings = load_settings(self.config_file)
+    self.assertIs(load_settings(self.config_file), settings)
+    self.assertEqual(settings.device('living-room-echo').address, '127.0.0.2')
+    self.assertEqual(settings.device('unknown').section, 'DEFAULT')
+
+  def test_reloads_when_config_changes(self):
+    settings = load_settings(self.config_file)
+    self.write_config(CONFIG.replace('127.0.0.2', '127.0.0.3'), mtime=os.path.getmtime(self.config_file) + 10)
+    reloaded = load_settings(self.config_file)
+    self.assertIsNot(reloaded, settings)
+    self.assertEqual(reloaded.device('living-room-echo').address, '127.0.0.3')
+
+  def test_compiled_file_is_private(self):
+    load_settings(self.config_file, self.compiled_file)
+    self.assertEqual(stat.S_IMODE(os.stat(self.compiled_file).st_mode), 0o600)
+    self.assertEqual([f for f in os.listdir(self.tmpdir) if f.startswith('.')], [])
+
+  def test_compiled_settings_match_config(self):
+    compiled = load_settings(self.config_file, self.compiled_file)
+    # a fresh process
+    kodi_settings._settings.clear()
+    loaded = load_settings(self.config_file, self.compiled_file)
+    self.assertIsNot(loaded, compiled)
+    self.assertEqual(sorted(loaded.devices), sorted(compiled.devices))
+    for section, device in compiled.devices.items():
+      self.assertEqual(loaded.devices[section].to_dict(), device.to_dict())
+      for option, value in device.to_dict().items():
+        self.assertIs(type(getattr(loaded.devices[section], option)), type(value), option)
+    self.assertIs(type(loaded.device('living-room-echo').password), str)
+
+  def test_stale_compiled_file_is_ignored(self):
+    load_settings(self.config_file, self.compiled_file)
+    kodi_settings._settings.clear()
+    self.write_config(CONFIG.replace('127.0.0.2', '127.0.0.3'), mtime=os.path.getmtime(self.config_file) + 10)
+    settings = load_settings(self.config_file, self.compiled_file)
+    self.assertEqual(settings.device('living-room-echo').address, '127.0.0.3')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,76 @@
+import json
+import threading
+import unittest
+
+from kodi_voice.kodi import Kodi, KodiConfigParser
+from kodi_voice.player import get_player_snapshots
+
+
+# Kodi's Application.SetVolume, with volume steps of 100 / steps.
+class FakeVolume():
+  def __init__(self, volume=50, steps=90):
+    self.step = 100.0 / steps
+    self.volume = float(volume)
+    self.round_trips = 0
+    self.lock = threading.Lock()
+
+  def SendCommand(self, command, wait_resp=True, cache_resp=False):
+    with self.lock:
+      self.round_trips += 1
+      responses = []
+      for c in json.loads(command):
+        if c['params']['volume'] == 'increment':
+          self.volume = min(self.volume + self.step, 100)
+        else:
+          self.volume = max(self.volume - self.step, 0)
+        responses.append({'id': c['id'], 'jsonrpc': '2.0', 'result': int(round(self.volume))})
+      return responses
+
+
+class VolumeTest(unittest.TestCase):
+  def setUp(self):
+    self.kodi = Kodi(KodiConfigParser(''))
+    self.kodi.endpoint = ('test', id(self))
+    self.fake = FakeVolume()
+    self.kodi.SendCommand = self.fake.SendCommand
+
+  def tearDown(self):
+    get_player_snapshots().volume_increments.pop(self.kodi.endpoint, None)
+
+  def test_one_round_trip(self):
+    self.assertEqual(self.kodi.VolumeUp()['result'], 60)
+    self.assertEqual(self.kodi.VolumeDown(steps=3)['result'], 30)
+    self.assertEqual(self.fake.round_trips, 2)
+
+  def test_kodi_increment(self):
+    self.assertEqual(self.kodi.VolumeUp(steps=2, step=None)['result'], 52)
+
+  def test_learns_kodi_volume_steps(self):
+    self.fake = FakeVolume(steps=20)
+    self.kodi.SendCommand = self.fake.SendCommand
+    # the first change overshoots, assuming Kodi's default of 90 steps
+    self.kodi.VolumeDown()
+    self.fake.volume = 50
+    self.assertEqual(self.kodi.VolumeUp()['result'], 60)
+
+  def test_stops_at_the_limits(self):
+    self.fake.volume = 95
+    self.assertEqual(self.kodi.VolumeUp()['result'], 100)
+    self.assertEqual(get_player_snapshots().get_volume_increment(self.kodi.endpoint, None), None)
+
+  def test_concurrent_requests_add_up(self):
+    threads = [threading.Thread(target=self.kodi.VolumeUp) for i in range(3)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    self.assertEqual(int(round(self.fake.volume)), 80)
+
+  def test_steps_must_be_positive(self):
+    self.assertRaises(ValueError, self.kodi.VolumeUp, 0)
+    self.assertRaises(ValueError, self.kodi.VolumeDown, 0, None)
+    self.assertEqual(self.fake.round_trips, 0)
+
+
+if __name__ == '__main__':
+  unittest.main()